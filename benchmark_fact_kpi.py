@@ -0,0 +1,584 @@
+"""
+FACT_KPI Scaling Benchmark
+==========================
+Synthesizes referentially consistent data_source/ trees at configurable scales
+and times generate_dimensions.py plus every phase of generate_fact_kpi(),
+recording runtime and peak RSS to a results file that can be compared between runs.
+
+Usage:
+    python benchmark_fact_kpi.py run --scale small --fact-args "--engine vectorized"
+    python benchmark_fact_kpi.py run --villages 80000 --cooperatives 1000000 --label national
+    python benchmark_fact_kpi.py compare
+    python benchmark_fact_kpi.py verify     # every engine must reproduce the loop engine's FACT_KPI
+"""
+
+import argparse
+import glob
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: peak RSS is reported as None
+    resource = None
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BENCHMARK_DIR = "benchmark"  # Synthetic data trees, stage logs and results live here
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "results.jsonl")  # One JSON record per run
+REFERENCE_DIR = "data_source"  # provinces, districts, subdistricts and dim_klu are copied from here
+REFERENCE_FILES = ['provinces.csv', 'districts.csv', 'subdistricts.csv', 'dim_klu.csv']
+SCALES = {  # --scale -> (villages, cooperatives)
+    "sample": (3_000, 4_000),
+    "small": (10_000, 100_000),
+    "national": (80_000, 1_000_000),
+}
+DEFAULT_SCALE = "small"
+# Rows per cooperative (or per village for upkdk) of the generated child tables
+ROWS_PER_COOPERATIVE = {
+    'members': 10.0,
+    'management': 5.0,
+    'outlets': 1.5,
+    'klus': 2.5,
+    'partnerships': 1.25,
+    'village_mergers': 0.05,
+    'domains': 0.25,
+}
+UPKDK_PER_VILLAGE = 0.8
+WRITE_CHUNK_ROWS = 1_000_000  # Large tables are generated and appended in chunks of this size
+TIMESTAMP_RANGE = ('2022-01-01', '2025-12-31')
+VERIFY_SIZE = (300, 1_500)  # villages, cooperatives of the `verify` data tree
+VERIFY_DUPLICATE_COOPERATIVES = 30  # cooperative.csv rows of that tree repeating an existing cooperative_id
+VERIFY_FACT_ARGS = {  # variant -> generate_fact_kpi.py options; its FACT_KPI must equal the loop engine's
+    'vectorized': ['--engine', 'vectorized'],
+    'streaming': ['--engine', 'vectorized', '--streaming', '--chunk-size', '5000'],
+    'sqlite': ['--engine', 'sqlite', '--chunk-size', '5000'],
+}
+FACT_PHASES = {  # generate_fact_kpi function (or Class.method) -> reported phase
+    'load_all_data': 'load_all_data',
+    'SqliteSource.load': 'load_all_data',
+    'create_mappings': 'create_mappings',
+    'calculate_global_aggregates': 'calculate_global_aggregates',
+    'calculate_global_aggregates_sqlite': 'calculate_global_aggregates',
+    'build_fact_coop': 'fact_coop',
+    'build_fact_coop_sqlite': 'fact_coop',
+    'hash_source_files': 'row_signatures',
+    'compute_row_signatures': 'row_signatures',
+    'generate_fact_rows_loop': 'village_rows',
+    'generate_fact_rows_vectorized': 'village_rows',
+    'generate_fact_rows_parallel': 'village_rows',
+    'generate_fact_rows_multi_period': 'village_rows',
+    'generate_fact_rows_sqlite': 'village_rows',
+    'write_fact_kpi': 'write',
+    'write_fact_coop': 'write',
+    'write_manifest': 'write',
+}
+
+# ============================================================================
+# SYNTHETIC DATA GENERATION
+# ============================================================================
+
+def _timestamps(rng, n):
+    """n random 'YYYY-MM-DD HH:MM:SS' strings inside TIMESTAMP_RANGE."""
+    start, end = (pd.Timestamp(value).value // 10**9 for value in TIMESTAMP_RANGE)
+    seconds = rng.integers(start, end, n).astype('datetime64[s]')
+    return np.char.replace(np.datetime_as_string(seconds), 'T', ' ')
+
+def _blank(values, rng, fraction):
+    """Replace a random fraction of values with NaN (as the production exports have)."""
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < fraction] = np.nan
+    return values
+
+def _write_chunked(path, n_rows, make_chunk, rng):
+    """Write a table of n_rows by appending make_chunk(start, size, rng) frames."""
+    for start in range(0, max(n_rows, 1), WRITE_CHUNK_ROWS):
+        size = min(WRITE_CHUNK_ROWS, n_rows - start)
+        make_chunk(start, size, rng).to_csv(path, index=False, mode='w' if start == 0 else 'a', header=start == 0)
+    return n_rows
+
+def synthesize_data_source(workdir, villages, cooperatives, seed=0, reference_dir=REFERENCE_DIR,
+                           duplicate_cooperatives=0):
+    """Write a data_source/ tree with the given number of villages and cooperatives.
+
+    Geography reference tables are copied from reference_dir; villages hang under
+    real subdistricts and every child row points to an existing cooperative.
+    duplicate_cooperatives extra cooperative.csv rows repeat an existing
+    cooperative_id with another capital and registration type, as re-exported
+    registrations do; every other repeat sits in another village. Returns the number of rows written per file.
+    """
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(workdir, 'data_source')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'result'), exist_ok=True)
+    for filename in REFERENCE_FILES:
+        shutil.copy(os.path.join(reference_dir, filename), data_dir)
+    path = lambda filename: os.path.join(data_dir, filename)
+    row_counts = {}
+
+    subdistricts = pd.read_csv(path('subdistricts.csv'))
+    districts = pd.read_csv(path('districts.csv'))
+    subdistricts.columns = subdistricts.columns.str.strip()
+    districts.columns = districts.columns.str.strip()
+
+    # Villages: spread over the subdistricts, numbered per subdistrict so codes stay unique
+    village_sub = subdistricts['code'].to_numpy()[rng.integers(0, len(subdistricts), villages)]
+    sequence = pd.Series(village_sub).groupby(village_sub).cumcount().to_numpy() + 2001
+    village_codes = pd.Series(village_sub).str.cat(pd.Series(sequence).astype(str), sep='.')
+    pd.DataFrame({
+        'village_id': np.arange(1, villages + 1),
+        'subdistrict_code': village_sub,
+        'code': village_codes,
+        'name': [f'Desa {i}' for i in range(villages)],
+        'total_u17': _blank(rng.integers(0, 3000, villages).astype(float), rng, 0.05),
+        'total_a17': rng.integers(0, 5000, villages).astype(float),
+    }).to_csv(path('villages.csv'), index=False)
+    row_counts['villages.csv'] = villages
+
+    # Cooperatives: located in a random village, with that village's subdistrict/district/province
+    sub_info = subdistricts.drop_duplicates('code').set_index('code')
+    district_info = districts.drop_duplicates('code').set_index('code')
+
+    def geography(coop_village):
+        coop_sub = pd.Series(village_sub[coop_village - 1])
+        coop_district = coop_sub.map(sub_info['district_code'])
+        return {
+            'provinceId': coop_district.map(district_info['province_code']).to_numpy(),
+            'districtId': coop_district.map(district_info['district_id']).to_numpy(),
+            'subdistrictId': coop_sub.map(sub_info['subdistrict_id']).to_numpy(),
+            'villageId': coop_village,
+        }
+
+    coop_village = rng.integers(1, villages + 1, cooperatives)
+    capital = rng.integers(1_000_000, 100_000_000, cooperatives).astype(object)
+    capital[rng.random(cooperatives) < 0.03] = np.nan
+    cooperative_ids = rng.permutation(np.arange(1, cooperatives + 1))
+    cooperative = pd.DataFrame({
+        'cooperative_id': cooperative_ids,
+        'name': [f'Koperasi {i}' for i in range(cooperatives)],
+        **geography(coop_village),
+        'capital': capital,
+        'registration_type': rng.choice(['Pendaftaran Baru', 'Perubahan', 'Pembaruan'], cooperatives),
+        'filling_method': rng.choice(['Mandiri', 'Pendamping'], cooperatives),
+        'longitude': _blank(rng.uniform(95, 141, cooperatives).round(5), rng, 0.1),
+        'latitude': _blank(rng.uniform(-11, 6, cooperatives).round(5), rng, 0.1),
+        'address': _blank([f'Jl. Koperasi {i}' for i in range(cooperatives)], rng, 0.1),
+        'created_at': _timestamps(rng, cooperatives),
+        'updated_at': _timestamps(rng, cooperatives),
+    })
+    if duplicate_cooperatives:
+        repeated = cooperative.iloc[np.sort(rng.choice(cooperatives, duplicate_cooperatives, replace=False))].copy()
+        repeated['capital'] = rng.integers(1_000_000, 100_000_000, duplicate_cooperatives)
+        repeated['registration_type'] = 'Pendaftaran Baru'
+        # Repeats in another village make one cooperative_id count towards two villages
+        moved = repeated.index[1::2]
+        for column, values in geography(rng.integers(1, villages + 1, len(moved))).items():
+            repeated.loc[moved, column] = values
+        cooperative = pd.concat([cooperative, repeated], ignore_index=True)
+    cooperative.to_csv(path('cooperative.csv'), index=False)
+    row_counts['cooperative.csv'] = len(cooperative)
+
+    pick = lambda size: cooperative_ids[rng.integers(0, cooperatives, size)]
+    rows = lambda table: int(cooperatives * ROWS_PER_COOPERATIVE[table])
+    klu_ids = pd.read_csv(path('dim_klu.csv'))['kluId'].to_numpy()
+
+    child_tables = {
+        'cooperative_members.csv': (rows('members'), lambda start, n, rng: pd.DataFrame({
+            'member_id': np.arange(start, start + n),
+            'cooperativeId': pick(n),
+            'gender': rng.choice(['LAKI-LAKI', 'PEREMPUAN'], n),
+            'principal_saving': _blank(rng.integers(0, 500_000, n), rng, 0.05),
+            'mandatory_saving': rng.integers(0, 100_000, n),
+            'bi_checking_verification': rng.choice(['Lancar', 'Kurang Lancar', 'Macet'], n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'cooperative_management.csv': (rows('management'), lambda start, n, rng: pd.DataFrame({
+            'cooperative_management_id': np.arange(start, start + n),
+            'cooperativeId': pick(n),
+            'role': rng.choice(['Ketua', 'Sekretaris', 'Bendahara', 'Pengawas', 'Anggota'], n, p=[.2, .2, .2, .3, .1]),
+            'gender': rng.choice(['Laki-laki', 'Perempuan'], n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'cooperative_outlets.csv': (rows('outlets'), lambda start, n, rng: pd.DataFrame({
+            'cooperative_outlet_id': np.arange(start + 1, start + n + 1),
+            'cooperativeId': pick(n),
+            'name': 'Gerai',
+            'primary_image': _blank(['outlet.png'] * n, rng, 0.4),
+            'cooperative_type_id': rng.integers(1, 14, n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'cooperative_klus.csv': (rows('klus'), lambda start, n, rng: pd.DataFrame({
+            'cooperative_klu_id': np.arange(start, start + n),
+            'cooperativeId': pick(n),
+            'kluId': klu_ids[rng.integers(0, len(klu_ids), n)],
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'business_partnership_applications.csv': (rows('partnerships'), lambda start, n, rng: pd.DataFrame({
+            'business_partnership_application_id': np.arange(start, start + n),
+            'cooperativeId': pick(n),
+            'business_partner_service_id': rng.integers(1, 11, n),
+            'status': rng.choice(['Verified', 'Rejected', 'Requested', 'InReview', 'In Progress', 'Draft'], n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'cooperative_village_mergers.csv': (rows('village_mergers'), lambda start, n, rng: pd.DataFrame({
+            'cooperative_village_merger_id': np.arange(start, start + n),
+            'cooperative_id': pick(n),
+            'village_id': rng.integers(1, villages + 1, n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'domains.csv': (rows('domains'), lambda start, n, rng: pd.DataFrame({
+            'domain_id': np.arange(start, start + n),
+            'name': [f'kop{i}.id' for i in range(start, start + n)],
+            'verification_status': rng.choice(['Verified', 'Pending'], n),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+        'upkdk.csv': (int(villages * UPKDK_PER_VILLAGE), lambda start, n, rng: pd.DataFrame({
+            'upkdk_id': np.arange(start + 1, start + n + 1),
+            'villageId': rng.integers(1, villages + 1, n),
+            'type': rng.choice(['Gudang', 'Kantor', 'Gerai'], n),
+            'internet_access': rng.choice(['Ada', 'Tidak Ada'], n),
+            'building_condition': rng.choice(['Baik', 'Rusak Ringan', 'Rusak Berat'], n),
+            'water_electricity': rng.choice(['Ya', 'Tidak'], n),
+            'longitude': _blank(rng.uniform(95, 141, n).round(5), rng, 0.2),
+            'latitude': _blank(rng.uniform(-11, 6, n).round(5), rng, 0.2),
+            'address': _blank(['Jl. Desa'] * n, rng, 0.2),
+            'created_at': _timestamps(rng, n),
+            'updated_at': _timestamps(rng, n),
+        })),
+    }
+    for filename, (n_rows, make_chunk) in child_tables.items():
+        row_counts[filename] = _write_chunked(path(filename), n_rows, make_chunk, rng)
+
+    with open(os.path.join(workdir, 'synthetic.json'), 'w') as f:
+        json.dump({'villages': villages, 'cooperatives': cooperatives, 'seed': seed,
+                   'duplicate_cooperatives': duplicate_cooperatives, 'rows': row_counts}, f, indent=2)
+    return row_counts
+
+# ============================================================================
+# STAGE MEASUREMENT (runs inside a fresh process per stage)
+# ============================================================================
+
+def _own_peak_rss_kb():
+    """This process' resident memory high-water mark in KB.
+
+    /proc VmHWM starts fresh at exec; ru_maxrss would carry over the peak of
+    the (large) process that spawned this one.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+def peak_rss_mb():
+    """Peak resident memory of this process (or of its largest finished worker) in MB."""
+    if resource is None:
+        return None
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    children = children // 1024 if sys.platform == 'darwin' else children
+    return round(max(_own_peak_rss_kb(), children) / 1024, 1)
+
+class PhaseTimer:
+    """Accumulated wall time and peak RSS per named phase."""
+
+    def __init__(self):
+        self.phases = {}
+        self.active = False
+
+    def wrap(self, module, function_name, phase):
+        """Replace module.function_name (or a class's method) with a version that records into phase."""
+        function = getattr(module, function_name)
+
+        def timed(*args, **kwargs):
+            # Calls nested in another phase (e.g. per-period aggregates) count towards the outer one
+            if self.active:
+                return function(*args, **kwargs)
+            self.active = True
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.active = False
+                entry = self.phases.setdefault(phase, {'seconds': 0.0, 'calls': 0})
+                entry['seconds'] = round(entry['seconds'] + time.perf_counter() - start, 3)
+                entry['calls'] += 1
+                entry['peak_rss_mb'] = peak_rss_mb()
+
+        setattr(module, function_name, timed)
+
+def measure_dimensions():
+    """Time DIM_GEOGRAPHY and DIM_PERIOD generation."""
+    import generate_dimensions as dimensions
+    timer = PhaseTimer()
+    timer.wrap(dimensions, 'generate_dim_geography', 'dim_geography')
+    timer.wrap(dimensions, 'generate_dim_period', 'dim_period')
+    dimensions.generate_dim_geography()
+    dimensions.generate_dim_period()
+    return timer.phases
+
+def measure_fact_kpi(fact_args):
+    """Run generate_fact_kpi.py with fact_args and time each phase of the pipeline."""
+    import generate_fact_kpi as fact
+    timer = PhaseTimer()
+    for name, phase in FACT_PHASES.items():
+        *owners, function_name = name.split('.')
+        owner = fact
+        for attribute in owners:
+            owner = getattr(owner, attribute)
+        timer.wrap(owner, function_name, phase)
+    # Every run starts from scratch: no source cache, previous versions or manifest to pick up
+    shutil.rmtree(fact.SOURCE_CACHE_DIR, ignore_errors=True)
+    for previous in glob.glob(os.path.join(fact.RESULT_DIR, f"{fact.OUTPUT_FILE_PREFIX}*")):
+        os.remove(previous)
+    manifest = os.path.join(fact.RESULT_DIR, fact.MANIFEST_FILE)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    df = fact.main(fact_args)
+    return timer.phases, len(df)
+
+def run_stage(stage, workdir, fact_args, metrics_path):
+    """Entry point of a stage process: measure one stage in workdir and dump its metrics."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    start = time.perf_counter()
+    metrics = {}
+    if stage == 'dimensions':
+        metrics['phases'] = measure_dimensions()
+    else:
+        metrics['phases'], metrics['fact_rows'] = measure_fact_kpi(fact_args)
+    metrics['seconds'] = round(time.perf_counter() - start, 3)
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    # Time outside the named phases (mappings of the code tables, schema casts, ...)
+    metrics['phases']['other'] = {'seconds': round(metrics['seconds'] - sum(
+        phase['seconds'] for phase in metrics['phases'].values()), 3)}
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f)
+
+def spawn_stage(stage, workdir, fact_args):
+    """Run one stage in a fresh interpreter (so its peak RSS is its own) and return its metrics."""
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_path = os.path.join(tmp, 'metrics.json')
+        log_path = os.path.join(workdir, f'{stage}.log')
+        command = [sys.executable, os.path.abspath(__file__), '_stage', stage, '--workdir', workdir,
+                   '--metrics-out', metrics_path, '--fact-args', ' '.join(shlex.quote(arg) for arg in fact_args)]
+        with open(log_path, 'w') as log:
+            completed = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Stage '{stage}' failed (exit {completed.returncode}), see {log_path}")
+        with open(metrics_path) as f:
+            return json.load(f)
+
+# ============================================================================
+# RESULTS
+# ============================================================================
+
+def git_commit():
+    """Short commit hash of the benchmarked code, None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def append_result(record, results_file=RESULTS_FILE):
+    """Append one run record to the JSON lines results file."""
+    os.makedirs(os.path.dirname(results_file) or '.', exist_ok=True)
+    with open(results_file, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def load_results(results_file=RESULTS_FILE):
+    """All run records of the results file, oldest first."""
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _find_record(records, label):
+    """Latest record with the given label (or run timestamp)."""
+    for record in reversed(records):
+        if label in (record.get('label'), record.get('timestamp')):
+            return record
+    raise SystemExit(f"No benchmark run labelled '{label}'")
+
+def compare_results(baseline, candidate):
+    """Print runtime and peak RSS of two runs side by side, phase by phase."""
+    print(f"Baseline : {baseline['label']} ({baseline['timestamp']}, {baseline.get('git_commit')})")
+    print(f"Candidate: {candidate['label']} ({candidate['timestamp']}, {candidate.get('git_commit')})")
+    print(f"\n{'Stage/phase':<42} {'base s':>9} {'cand s':>9} {'ratio':>7} {'base MB':>9} {'cand MB':>9}")
+    print("-" * 90)
+    for stage in candidate['stages']:
+        base_stage = baseline['stages'].get(stage, {})
+        rows = [(stage, base_stage, candidate['stages'][stage])]
+        rows += [(f"  {phase}", base_stage.get('phases', {}).get(phase, {}), metrics)
+                 for phase, metrics in candidate['stages'][stage]['phases'].items()]
+        for name, base, cand in rows:
+            ratio = f"{cand['seconds'] / base['seconds']:.2f}x" if base.get('seconds') else "-"
+            print(f"{name:<42} {base.get('seconds', '-'):>9} {cand['seconds']:>9} {ratio:>7} "
+                  f"{str(base.get('peak_rss_mb', '-')):>9} {str(cand.get('peak_rss_mb', '-')):>9}")
+
+# ============================================================================
+# ENGINE VERIFICATION
+# ============================================================================
+
+def latest_fact_kpi(workdir):
+    """FACT_KPI CSV written by the last fact_kpi stage in workdir."""
+    return pd.read_csv(sorted(glob.glob(os.path.join(workdir, 'result', 'FACT_KPI_V*.csv')))[-1])
+
+def diff_fact_kpi(expected, actual):
+    """Columns of actual that differ from expected, with their number of differing rows."""
+    if list(actual.columns) != list(expected.columns) or len(actual) != len(expected):
+        return {'<shape>': f"{actual.shape} vs {expected.shape}"}
+    differences = {}
+    for column in expected.columns:
+        a, b = expected[column], actual[column]
+        differs = ~((a == b) | (a.isna() & b.isna()))
+        if differs.any():
+            differences[column] = int(differs.sum())
+    return differences
+
+def verify_engines(args):
+    """Run every VERIFY_FACT_ARGS variant on a tree with repeated cooperative_ids and diff it with the loop engine."""
+    villages, cooperatives = VERIFY_SIZE
+    workdir = os.path.abspath(os.path.join(BENCHMARK_DIR, f"verify_{villages}v_{cooperatives}c_seed{args.seed}"))
+    if args.regenerate or not os.path.exists(os.path.join(workdir, 'synthetic.json')):
+        print(f"Synthesizing {villages:,} villages / {cooperatives:,} cooperatives "
+              f"(+{VERIFY_DUPLICATE_COOPERATIVES} repeated cooperative_ids) in {workdir} ...")
+        synthesize_data_source(workdir, villages, cooperatives, args.seed,
+                               duplicate_cooperatives=VERIFY_DUPLICATE_COOPERATIVES)
+    spawn_stage('dimensions', workdir, [])
+    spawn_stage('fact_kpi', workdir, ['--engine', 'loop'])
+    expected = latest_fact_kpi(workdir)
+    print(f"loop: {len(expected):,} FACT_KPI rows")
+
+    failures = 0
+    for variant, fact_args in VERIFY_FACT_ARGS.items():
+        spawn_stage('fact_kpi', workdir, fact_args)
+        differences = diff_fact_kpi(expected, latest_fact_kpi(workdir))
+        if differences:
+            failures += 1
+            print(f"{variant}: MISMATCH in {len(differences)} columns: "
+                  + ", ".join(f"{column} ({rows})" for column, rows in differences.items()))
+        else:
+            print(f"{variant}: identical")
+    return failures
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def run_benchmark(args):
+    """Synthesize (or reuse) the data tree for the requested scale and measure every stage."""
+    villages, cooperatives = SCALES[args.scale]
+    villages = args.villages or villages
+    cooperatives = args.cooperatives or cooperatives
+    workdir = os.path.abspath(os.path.join(BENCHMARK_DIR, f"{villages}v_{cooperatives}c_seed{args.seed}"))
+
+    if args.regenerate or not os.path.exists(os.path.join(workdir, 'synthetic.json')):
+        print(f"Synthesizing {villages:,} villages / {cooperatives:,} cooperatives in {workdir} ...")
+        start = time.perf_counter()
+        synthesize_data_source(workdir, villages, cooperatives, args.seed)
+        print(f"  done in {time.perf_counter() - start:.1f}s")
+    with open(os.path.join(workdir, 'synthetic.json')) as f:
+        synthetic = json.load(f)
+    if args.generate_only:
+        return
+
+    fact_args = shlex.split(args.fact_args)
+    stages = {}
+    for stage in ['dimensions', 'fact_kpi']:
+        print(f"Running {stage} ...")
+        stages[stage] = spawn_stage(stage, workdir, fact_args)
+        print(f"  {stages[stage]['seconds']:.1f}s, peak RSS {stages[stage]['peak_rss_mb']} MB")
+
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    record = {
+        'timestamp': timestamp,
+        'label': args.label or timestamp,
+        'git_commit': git_commit(),
+        'villages': villages,
+        'cooperatives': cooperatives,
+        'seed': args.seed,
+        'rows': synthetic['rows'],
+        'fact_args': fact_args,
+        'stages': stages,
+    }
+    append_result(record, args.results)
+    print(f"Results appended to {args.results}")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Benchmark dimension and FACT_KPI generation on synthetic data.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Synthesize data (if needed) and benchmark every stage")
+    run.add_argument('--scale', choices=list(SCALES), default=DEFAULT_SCALE,
+                     help=f"Preset size: {', '.join(f'{k}={v[0]:,}v/{v[1]:,}c' for k, v in SCALES.items())}")
+    run.add_argument('--villages', type=int, help="Override the number of villages of --scale")
+    run.add_argument('--cooperatives', type=int, help="Override the number of cooperatives of --scale")
+    run.add_argument('--seed', type=int, default=0, help="Random seed of the synthetic data")
+    run.add_argument('--regenerate', action='store_true', help="Rebuild the data tree even if it exists")
+    run.add_argument('--generate-only', action='store_true', help="Only synthesize the data tree")
+    run.add_argument('--fact-args', default="", help="Extra generate_fact_kpi.py options, e.g. \"--engine vectorized\"")
+    run.add_argument('--label', help="Name of this run in the results file (default: its timestamp)")
+    run.add_argument('--results', default=RESULTS_FILE, help=f"Results file (default: {RESULTS_FILE})")
+
+    compare = commands.add_parser('compare', help="Compare two runs of the results file")
+    compare.add_argument('--baseline', help="Label of the baseline run (default: second to last run)")
+    compare.add_argument('--candidate', help="Label of the candidate run (default: last run)")
+    compare.add_argument('--results', default=RESULTS_FILE, help=f"Results file (default: {RESULTS_FILE})")
+
+    verify = commands.add_parser('verify', help="Check every engine reproduces the loop engine's FACT_KPI")
+    verify.add_argument('--seed', type=int, default=0, help="Random seed of the synthetic data")
+    verify.add_argument('--regenerate', action='store_true', help="Rebuild the data tree even if it exists")
+
+    stage = commands.add_parser('_stage')  # Internal: one measured stage in a fresh process
+    stage.add_argument('stage', choices=['dimensions', 'fact_kpi'])
+    stage.add_argument('--workdir', required=True)
+    stage.add_argument('--metrics-out', required=True)
+    stage.add_argument('--fact-args', default="")
+
+    args = parser.parse_args(argv)
+    if args.command == 'run' and any(value is not None and value < 1 for value in (args.villages, args.cooperatives)):
+        parser.error("--villages and --cooperatives must be at least 1")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == '_stage':
+        run_stage(args.stage, args.workdir, shlex.split(args.fact_args), args.metrics_out)
+    elif args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'verify':
+        if verify_engines(args):
+            sys.exit(1)
+    else:
+        records = load_results(args.results)
+        if len(records) < 2 and not (args.baseline and args.candidate):
+            raise SystemExit(f"Need at least two runs in {args.results} to compare")
+        baseline = _find_record(records, args.baseline) if args.baseline else records[-2]
+        candidate = _find_record(records, args.candidate) if args.candidate else records[-1]
+        compare_results(baseline, candidate)
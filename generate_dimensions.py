@@ -2,11 +2,73 @@
 Script to generate DIM_GEOGRAPHY and DIM_PERIOD with hierarchical structure
 """
 
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import calendar
+import argparse
 
-def generate_dim_geography():
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:  # Optional: only needed for Parquet/Arrow output
+    pa = None
+
+OUTPUT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+DATE_COLUMNS = ['period_st', 'period_end_date']
+DEFAULT_PERIOD_YEARS = (2022, 2025)  # DIM_PERIOD year range
+
+
+def dimension_to_arrow(df):
+    """Convert a dimension table to Arrow: dates as date32, repetitive text dictionary-encoded"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            continue
+        column = table.column(i)
+        if field.name in DATE_COLUMNS:
+            column = column.cast(pa.date32())
+        elif len(column.unique()) * 2 <= len(column):
+            # Only repetitive text (names, parent codes) benefits from a dictionary
+            column = column.dictionary_encode()
+        table = table.set_column(i, field.name, column)
+    return table
+
+
+def save_dimension(df, name, output_formats=('csv',), **csv_options):
+    """Save a dimension table to result/ in every requested format"""
+    paths = []
+    for output_format in output_formats:
+        output_path = f'result/{name}{OUTPUT_FORMATS[output_format]}'
+        if output_format == 'csv':
+            df.to_csv(output_path, index=False, **csv_options)
+        elif output_format == 'parquet':
+            parquet.write_table(dimension_to_arrow(df), output_path)
+        else:
+            feather.write_feather(dimension_to_arrow(df), output_path, compression='uncompressed')
+        paths.append(output_path)
+    return paths
+
+
+def _by_code(table, column, keep='first'):
+    """Series of column indexed by code, from the first (or last) row of each code"""
+    rows = table.dropna(subset=['code']).drop_duplicates('code', keep=keep)
+    return rows.set_index('code')[column]
+
+
+def _geo_level(province_id, province_name, district_id=None, district_name=None,
+               subdistrict_id=None, subdistrict_name=None, village_id=None, village_name=None):
+    """One DIM_GEOGRAPHY level; the columns below the level are left empty"""
+    columns = {
+        'province_id': province_id, 'district_id': district_id,
+        'subdistrict_id': subdistrict_id, 'village_id': village_id,
+        'province_name': province_name, 'district_name': district_name,
+        'subdistrict_name': subdistrict_name, 'village_name': village_name,
+    }
+    return pd.DataFrame({name: None if values is None else values.to_numpy(dtype=object)
+                         for name, values in columns.items()}, index=range(len(province_id)))
+
+
+def generate_dim_geography(output_formats=('csv',)):
     """Generate DIM_GEOGRAPHY from villages.csv and related data sources"""
     print("="*80)
     print("GENERATING DIM_GEOGRAPHY")
@@ -30,11 +92,12 @@ def generate_dim_geography():
     districts.columns = districts.columns.str.strip()
     provinces.columns = provinces.columns.str.strip()
     
-    # Create mappings
+    # Create mappings (the code -> name dicts kept the last row of a code, row lookups the first)
     print("\n[2] Creating mappings...")
-    province_map = dict(zip(provinces['code'], provinces[['province_id', 'name']].values))
-    district_map = dict(zip(districts['code'], districts[['district_id', 'name']].values))
-    subdistrict_map = dict(zip(subdistricts['code'], subdistricts[['subdistrict_id', 'name']].values))
+    province_names = _by_code(provinces, 'name', keep='last')
+    district_names = _by_code(districts, 'name', keep='last')
+    district_provinces = _by_code(districts, 'province_code')
+    subdistrict_info = subdistricts.dropna(subset=['code']).drop_duplicates('code').set_index('code')
     
     # Parse codes from villages
     print("\n[3] Parsing village codes...")
@@ -44,291 +107,160 @@ def generate_dim_geography():
     
     # Build hierarchical dimension
     print("\n[4] Building hierarchical dimension...")
-    dim_geo_data = []
-    geo_key = 1
     
-    # Level 1: Provinces
+    # Level 1: Provinces (first-seen order, last name of each code)
     print("    Generating province level...")
-    for prov_code, (prov_id, prov_name) in province_map.items():
-        dim_geo_data.append({
-            'geo_key': geo_key,
-            'province_id': prov_code,
-            'district_id': None,
-            'subdistrict_id': None,
-            'village_id': None,
-            'province_name': prov_name,
-            'district_name': None,
-            'subdistrict_name': None,
-            'village_name': None
-        })
-        geo_key += 1
+    province_level = provinces[['code']].drop_duplicates()
+    province_level = _geo_level(province_level['code'], province_level['code'].map(province_names))
     
     # Level 2: Districts
     print("    Generating district level...")
-    districts_processed = set()
-    for _, district in districts.iterrows():
-        district_code = district['code']
-        province_code = district['province_code']
-        
-        if (province_code, district_code) in districts_processed:
-            continue
-        districts_processed.add((province_code, district_code))
-        
-        prov_id, prov_name = province_map.get(province_code, (None, None))
-        
-        dim_geo_data.append({
-            'geo_key': geo_key,
-            'province_id': province_code,
-            'district_id': district_code,
-            'subdistrict_id': None,
-            'village_id': None,
-            'province_name': prov_name,
-            'district_name': district['name'],
-            'subdistrict_name': None,
-            'village_name': None
-        })
-        geo_key += 1
+    district_level = districts.drop_duplicates(['province_code', 'code'])
+    districts_processed = len(district_level)
+    district_level = _geo_level(district_level['province_code'],
+                                district_level['province_code'].map(province_names),
+                                district_level['code'], district_level['name'])
     
-    # Level 3: Subdistricts
+    # Level 3: Subdistricts (skipped when their district is unknown)
     print("    Generating subdistrict level...")
-    subdistricts_processed = set()
-    for _, subdistrict in subdistricts.iterrows():
-        subdistrict_code = subdistrict['code']
-        district_code = subdistrict['district_code']
-        
-        if (district_code, subdistrict_code) in subdistricts_processed:
-            continue
-        subdistricts_processed.add((district_code, subdistrict_code))
-        
-        # Get province code from district
-        district_info = districts[districts['code'] == district_code]
-        if len(district_info) == 0:
-            continue
-        province_code = district_info.iloc[0]['province_code']
-        
-        prov_id, prov_name = province_map.get(province_code, (None, None))
-        district_name = district_map.get(district_code, [None, None])[1]
-        
-        dim_geo_data.append({
-            'geo_key': geo_key,
-            'province_id': province_code,
-            'district_id': district_code,
-            'subdistrict_id': subdistrict_code,
-            'village_id': None,
-            'province_name': prov_name,
-            'district_name': district_name,
-            'subdistrict_name': subdistrict['name'],
-            'village_name': None
-        })
-        geo_key += 1
+    subdistrict_level = subdistricts.drop_duplicates(['district_code', 'code'])
+    subdistricts_processed = len(subdistrict_level)
+    subdistrict_level = subdistrict_level[subdistrict_level['district_code'].isin(district_provinces.index)]
+    province_code = subdistrict_level['district_code'].map(district_provinces)
+    subdistrict_level = _geo_level(province_code, province_code.map(province_names),
+                                   subdistrict_level['district_code'],
+                                   subdistrict_level['district_code'].map(district_names),
+                                   subdistrict_level['code'], subdistrict_level['name'])
     
-    # Level 4: Villages
+    # Level 4: Villages (duplicate codes are dropped before the subdistrict check)
     print("    Generating village level...")
-    villages_processed = set()
-    for _, village in villages.iterrows():
-        village_code = village['code']
-        subdistrict_code = village['subdistrict_code']
-        
-        # Skip duplicates
-        if village_code in villages_processed:
-            continue
-        villages_processed.add(village_code)
-        
-        # Get subdistrict info
-        subdistrict_info = subdistricts[subdistricts['code'] == subdistrict_code]
-        if len(subdistrict_info) == 0:
-            continue
-        
-        district_code = subdistrict_info.iloc[0]['district_code']
-        
-        # Get district info
-        district_info = districts[districts['code'] == district_code]
-        if len(district_info) == 0:
-            continue
-        province_code = district_info.iloc[0]['province_code']
-        
-        prov_id, prov_name = province_map.get(province_code, (None, None))
-        district_name = district_map.get(district_code, [None, None])[1]
-        subdistrict_name = subdistrict_info.iloc[0]['name']
-        
-        dim_geo_data.append({
-            'geo_key': geo_key,
-            'province_id': province_code,
-            'district_id': district_code,
-            'subdistrict_id': subdistrict_code,
-            'village_id': village_code,
-            'province_name': prov_name,
-            'district_name': district_name,
-            'subdistrict_name': subdistrict_name,
-            'village_name': village['name']
-        })
-        geo_key += 1
+    village_level = villages.drop_duplicates('code')
+    villages_processed = len(village_level)
+    village_level = village_level[village_level['subdistrict_code'].isin(subdistrict_info.index)]
+    district_code = village_level['subdistrict_code'].map(subdistrict_info['district_code'])
+    village_level = village_level[district_code.isin(district_provinces.index)]
+    district_code = district_code[village_level.index]
+    province_code = district_code.map(district_provinces)
+    village_level = _geo_level(province_code, province_code.map(province_names),
+                               district_code, district_code.map(district_names),
+                               village_level['subdistrict_code'],
+                               village_level['subdistrict_code'].map(subdistrict_info['name']),
+                               village_level['code'], village_level['name'])
     
-    # Create DataFrame
-    dim_geography = pd.DataFrame(dim_geo_data)
+    # Create DataFrame with consecutive geo_keys across the four levels
+    dim_geography = pd.concat([province_level, district_level, subdistrict_level, village_level],
+                              ignore_index=True).infer_objects()
+    dim_geography.insert(0, 'geo_key', np.arange(1, len(dim_geography) + 1))
     
     print(f"\n[5] Generated {len(dim_geography):,} geography records")
     print(f"    Province level: {len(provinces):,}")
-    print(f"    District level: {len(districts_processed):,}")
-    print(f"    Subdistrict level: {len(subdistricts_processed):,}")
-    print(f"    Village level: {len(villages_processed):,}")
+    print(f"    District level: {districts_processed:,}")
+    print(f"    Subdistrict level: {subdistricts_processed:,}")
+    print(f"    Village level: {villages_processed:,}")
     
-    # Save to CSV
-    output_path = 'result/DIM_GEOGRAPHY.csv'
-    dim_geography.to_csv(output_path, index=False)
-    print(f"\n[6] Saved to {output_path}")
+    # Save to CSV (and Parquet/Arrow if requested)
+    output_paths = save_dimension(dim_geography, 'DIM_GEOGRAPHY', output_formats)
+    print(f"\n[6] Saved to {', '.join(output_paths)}")
     
     return dim_geography
 
 
-def get_week_ranges(year, month):
-    """Calculate week ranges for a given month"""
-    # Get first and last day of month
-    first_day = datetime(year, month, 1)
-    last_day = datetime(year, month, calendar.monthrange(year, month)[1])
-    
-    weeks = []
-    current_date = first_day
-    
-    week_num = 1
-    while current_date <= last_day:
-        # Find the start of the week (Monday)
-        days_since_monday = current_date.weekday()
-        week_start = current_date - timedelta(days=days_since_monday)
-        
-        # Find the end of the week (Sunday)
-        week_end = week_start + timedelta(days=6)
-        
-        # Adjust to month boundaries
-        if week_start < first_day:
-            week_start = first_day
-        if week_end > last_day:
-            week_end = last_day
-        
-        weeks.append({
-            'week': week_num,
-            'start': week_start,
-            'end': week_end
-        })
-        
-        # Move to next week
-        current_date = week_end + timedelta(days=1)
-        week_num += 1
+def calendar_days(start_year, end_year):
+    """Every day from start_year-01-01 to end_year-12-31 with its quarter, month and week of month.
     
-    return weeks
+    Weeks run Monday to Sunday and are cut at month boundaries, so week 1 starts
+    on the 1st and every Monday after it starts the next week of that month.
+    """
+    days = pd.date_range(f'{start_year}-01-01', f'{end_year}-12-31', freq='D')
+    calendar_df = pd.DataFrame({
+        'date': days,
+        'year': days.year,
+        'quarter': days.quarter,
+        'month': days.month,
+    })
+    starts_week = (days.day == 1) | (days.dayofweek == 0)
+    calendar_df['week'] = pd.Series(starts_week.astype('int64')).groupby(
+        [calendar_df['year'], calendar_df['month']]).cumsum().to_numpy()
+    return calendar_df
 
 
-def generate_dim_period():
+def generate_dim_period(output_formats=('csv',), start_year=DEFAULT_PERIOD_YEARS[0], end_year=DEFAULT_PERIOD_YEARS[1]):
     """Generate DIM_PERIOD with hierarchical structure"""
     print("\n" + "="*80)
     print("GENERATING DIM_PERIOD")
     print("="*80)
     
-    # Date range: 2022-2025
-    start_year = 2022
-    end_year = 2025
+    if start_year > end_year:
+        raise ValueError(f"start_year {start_year} is after end_year {end_year}")
     
     print(f"\n[1] Generating period dimension from {start_year} to {end_year}...")
     
-    dim_period_data = []
-    date_key = 1
+    days = calendar_days(start_year, end_year)
     
-    for year in range(start_year, end_year + 1):
-        # Level 1: Year
-        dim_period_data.append({
-            'date_key': date_key,
-            'year': year,
-            'quarter': None,
-            'month': None,
-            'week': None,
-            'period_st': f'{year}-01-01',
-            'period_end_date': f'{year}-12-31'
-        })
-        date_key += 1
-        
-        # Quarters
-        for quarter in range(1, 5):
-            # Level 2: Quarter
-            quarter_start_month = (quarter - 1) * 3 + 1
-            quarter_end_month = quarter * 3
-            quarter_start_date = datetime(year, quarter_start_month, 1)
-            quarter_end_date = datetime(year, quarter_end_month, calendar.monthrange(year, quarter_end_month)[1])
-            
-            dim_period_data.append({
-                'date_key': date_key,
-                'year': year,
-                'quarter': quarter,
-                'month': None,
-                'week': None,
-                'period_st': quarter_start_date.strftime('%Y-%m-%d'),
-                'period_end_date': quarter_end_date.strftime('%Y-%m-%d')
-            })
-            date_key += 1
-            
-            # Months in quarter
-            for month in range(quarter_start_month, quarter_end_month + 1):
-                # Level 3: Month
-                month_start_date = datetime(year, month, 1)
-                month_end_date = datetime(year, month, calendar.monthrange(year, month)[1])
-                
-                dim_period_data.append({
-                    'date_key': date_key,
-                    'year': year,
-                    'quarter': quarter,
-                    'month': month,
-                    'week': None,
-                    'period_st': month_start_date.strftime('%Y-%m-%d'),
-                    'period_end_date': month_end_date.strftime('%Y-%m-%d')
-                })
-                date_key += 1
-                
-                # Weeks in month
-                weeks = get_week_ranges(year, month)
-                for week_info in weeks:
-                    # Level 4: Week
-                    dim_period_data.append({
-                        'date_key': date_key,
-                        'year': year,
-                        'quarter': quarter,
-                        'month': month,
-                        'week': week_info['week'],
-                        'period_st': week_info['start'].strftime('%Y-%m-%d'),
-                        'period_end_date': week_info['end'].strftime('%Y-%m-%d')
-                    })
-                    date_key += 1
+    # One row per period of every level: first and last day of its days
+    levels = []
+    for keys in [['year'], ['year', 'quarter'], ['year', 'quarter', 'month'], ['year', 'quarter', 'month', 'week']]:
+        level = days.groupby(keys)['date'].agg(['min', 'max']).reset_index()
+        levels.append(level)
+    dim_period = pd.concat(levels, ignore_index=True)
     
-    # Create DataFrame
-    dim_period = pd.DataFrame(dim_period_data)
-    
-    # Convert quarter, month, week to nullable integer type
-    # This ensures integers are stored as integers, not floats
-    dim_period['quarter'] = dim_period['quarter'].astype('Int64')
-    dim_period['month'] = dim_period['month'].astype('Int64')
-    dim_period['week'] = dim_period['week'].astype('Int64')
+    # Year, then each quarter followed by its months, each month followed by its weeks
+    order_keys = dim_period[['quarter', 'month', 'week']].fillna(0)
+    dim_period = dim_period.iloc[np.lexsort([order_keys['week'], order_keys['month'],
+                                             order_keys['quarter'], dim_period['year']])]
+    dim_period = dim_period.reset_index(drop=True)
+    dim_period = pd.DataFrame({
+        'date_key': np.arange(1, len(dim_period) + 1),
+        'year': dim_period['year'].astype('int64'),
+        # Nullable integers keep quarter, month and week as integers, not floats
+        'quarter': dim_period['quarter'].astype('Int64'),
+        'month': dim_period['month'].astype('Int64'),
+        'week': dim_period['week'].astype('Int64'),
+        'period_st': dim_period['min'].dt.strftime('%Y-%m-%d'),
+        'period_end_date': dim_period['max'].dt.strftime('%Y-%m-%d'),
+    })
     
     print(f"\n[2] Generated {len(dim_period):,} period records")
     print(f"    Years: {end_year - start_year + 1}")
     print(f"    Quarters: {(end_year - start_year + 1) * 4}")
     print(f"    Months: {(end_year - start_year + 1) * 12}")
     
-    # Save to CSV
-    output_path = 'result/DIM_PERIOD.csv'
-    dim_period.to_csv(output_path, index=False, na_rep='')
-    print(f"\n[3] Saved to {output_path}")
+    # Save to CSV (and Parquet/Arrow if requested)
+    output_paths = save_dimension(dim_period, 'DIM_PERIOD', output_formats, na_rep='')
+    print(f"\n[3] Saved to {', '.join(output_paths)}")
     
     return dim_period
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate DIM_GEOGRAPHY and DIM_PERIOD.")
+    parser.add_argument('--output-format', default='csv',
+                        help="Comma-separated output formats: csv, parquet, arrow (default: csv)")
+    parser.add_argument('--years', default='-'.join(map(str, DEFAULT_PERIOD_YEARS)),
+                        help="DIM_PERIOD year range, e.g. 2022-2025 (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        start, _, end = args.years.partition('-')
+        period_years = (int(start), int(end or start))
+    except ValueError:
+        parser.error("--years must look like 2022-2025 or 2024")
+    if period_years[0] > period_years[1]:
+        parser.error("--years start must not be after its end")
+    output_formats = tuple(fmt.strip() for fmt in args.output_format.split(',') if fmt.strip())
+    if not output_formats or any(fmt not in OUTPUT_FORMATS for fmt in output_formats):
+        parser.error("--output-format must be a comma-separated subset of csv,parquet,arrow")
+    if pa is None and any(fmt != 'csv' for fmt in output_formats):
+        parser.error("Parquet/Arrow output requires pyarrow (pip install pyarrow)")
+    
     print("\n" + "="*80)
     print("DIMENSION GENERATION SCRIPT")
     print("="*80)
     
     # Generate DIM_GEOGRAPHY
-    dim_geo = generate_dim_geography()
+    dim_geo = generate_dim_geography(output_formats)
     
     # Generate DIM_PERIOD
-    dim_period = generate_dim_period()
+    dim_period = generate_dim_period(output_formats, *period_years)
     
     print("\n" + "="*80)
     print("GENERATION COMPLETE!")
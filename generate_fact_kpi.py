@@ -9,11 +9,35 @@ Date: 2024-12-02
 
 import pandas as pd
 import numpy as np
+import argparse
+import cProfile
+import fnmatch
+import functools
+import io
+import multiprocessing
 import os
+import sys
 import glob
+import hashlib
+import json
+import pstats
+import sqlite3
 import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:  # Optional: without pyarrow the source cache and Parquet/Arrow output are disabled
+    pa = feather = parquet = None
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: stage metrics report no peak RSS
+    resource = None
 
 # ============================================================================
 # CONFIGURATION
@@ -23,20 +47,327 @@ DATA_SOURCE_DIR = "data_source"
 RESULT_DIR = "result"
 TEST_VILLAGE_LIMIT = None  # Limit for testing, set to None for full run (will generate ~38,053 rows)
 OUTPUT_FILE_PREFIX = "FACT_KPI_V"
+FACT_COOP_FILE_PREFIX = "FACT_COOP_V"  # Per-cooperative facts written with the same version as FACT_KPI
+OUTPUT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}  # --output-format -> extension
+DEFAULT_OUTPUT_FORMATS = ("csv",)
+MANIFEST_FILE = "FACT_KPI_MANIFEST.json"  # Inputs of the last run, used by --incremental
+MANIFEST_FORMAT = 1
+SOURCE_CACHE_DIR = "cache"  # Parsed source tables in a binary columnar format (needs pyarrow)
+CACHE_FORMATS = ("feather", "parquet")  # feather: uncompressed, memory-mapped; parquet: smaller files
+DEFAULT_CACHE_FORMAT = "feather"
+SQLITE_DB_FILE = os.path.join(SOURCE_CACHE_DIR, "fact_kpi_source.sqlite")  # On-disk database of the sqlite engine
+# Tables the sqlite engine loads into SQLite (the dimension tables stay in pandas) and their indexes
+SQLITE_TABLES = ['cooperative', 'members', 'management', 'outlets', 'klus', 'partnerships',
+                 'upkdk', 'domains', 'village_mergers', 'villages', 'dim_klu']
+SQLITE_INDEXES = {
+    'cooperative': ['cooperative_id', 'villageId', 'provinceId'],
+    'members': ['cooperativeId'],
+    'management': ['cooperativeId'],
+    'outlets': ['cooperativeId'],
+    'klus': ['cooperativeId'],
+    'partnerships': ['cooperativeId'],
+    'upkdk': ['villageId'],
+    'village_mergers': ['village_id'],
+    'villages': ['village_id'],
+    'dim_klu': ['kluId'],
+}
+SQLITE_CACHE_MB = 64  # SQLite page cache, the sqlite engine's main memory knob
+SQLITE_FETCH_ROWS = 50_000  # Query result rows converted to pandas at a time
+STREAMED_TABLES = ['members', 'management']  # Tables --streaming folds chunk by chunk into per-cooperative partials
+DEFAULT_CHUNK_SIZE = 500_000  # Rows per chunk when streaming
+PARTIAL_COMPACT_EVERY = 16  # Chunk partials kept before they are folded together
+PENGURUS_ROLES = ['Ketua', 'Sekretaris', 'Bendahara']
+COMPLETE_STRUCTURE_MASK = (1 << len(PENGURUS_ROLES)) - 1  # Role bitmask with every PENGURUS_ROLES bit set
+ROLE_COUNT_COLUMNS = ['pengurus_count', 'pengawas_count', 'female_pengurus_count']  # Per-cooperative management counts
+METRICS_FILE_SUFFIX = "_metrics.json"  # Stage metrics written next to FACT_KPI_Vnnn
+OPENMETRICS_PREFIX = "fact_kpi"  # Metric name prefix of the --metrics-textfile output
+PROFILE_FILE_SUFFIX = "_profile.prof"  # cProfile dump of the --profile-sample villages
+PROFILE_TOP_FUNCTIONS = 25  # Functions listed in the cProfile summary
+KPI_FAMILY_PATTERN = "calculate_*_kpis"  # Stages ranked by --profile
+# loop: per-village filtering, vectorized: groupby/merge passes, sqlite: GROUP BY queries over SQLITE_DB_FILE
+ENGINES = ("loop", "vectorized", "sqlite")
+DEFAULT_ENGINE = "loop"
+DEFAULT_WORKERS = 1  # >1 runs the loop engine in a process pool
+SHARD_LEVELS = {"province": "province_id", "district": "district_id"}  # --shard-by -> DIM_GEOGRAPHY column
+PROGRESS_POLL_SECONDS = 5  # How often the parent process reports progress of parallel workers
+PERIOD_GRAINS = ("year", "quarter", "month", "week")  # DIM_PERIOD levels available to --all-periods
+GEO_LEVEL_COLUMNS = ['province_id', 'district_id', 'subdistrict_id', 'village_id']  # DIM_GEOGRAPHY levels, coarsest first
+DEFAULT_DISTINCT_COUNT = "exact"  # exact | hll, see DISTINCT_COUNTERS
+HLL_PRECISION = 12  # HyperLogLog registers = 2 ** precision (at most 16), ~1.6% relative error at 12
+# --rollups levels above the villages, bottom up: (level, DIM_GEOGRAPHY columns identifying a row of it)
+ROLLUP_LEVELS = [
+    ('subdistrict', ['province_id', 'district_id', 'subdistrict_id']),
+    ('district', ['province_id', 'district_id']),
+    ('province', ['province_id']),
+]
+# Source tables filtered by created_at when generating facts for past periods
+TIME_AWARE_TABLES = ['cooperative', 'members', 'management', 'outlets', 'klus',
+                     'partnerships', 'upkdk', 'domains', 'village_mergers']
+
+# Input tables (data key -> file); dimension tables come from RESULT_DIR
+SOURCE_FILES = {
+    'cooperative': 'cooperative.csv',
+    'members': 'cooperative_members.csv',
+    'management': 'cooperative_management.csv',
+    'outlets': 'cooperative_outlets.csv',
+    'klus': 'cooperative_klus.csv',
+    'partnerships': 'business_partnership_applications.csv',
+    'upkdk': 'upkdk.csv',
+    'domains': 'domains.csv',
+    'village_mergers': 'cooperative_village_mergers.csv',
+    'villages': 'villages.csv',
+    'districts': 'districts.csv',
+    'subdistricts': 'subdistricts.csv',
+    'dim_klu': 'dim_klu.csv',
+    'dim_geography': os.path.join(RESULT_DIR, 'DIM_GEOGRAPHY.csv'),
+    'dim_period': os.path.join(RESULT_DIR, 'DIM_PERIOD.csv'),
+}
+# Columns read from each source table and their dtype: "id" = integer ID (int32 when every value
+# fits, IDs with missing values stay float64), "category" = low-cardinality text compared with
+# string literals, "timestamp" = parsed once into datetime64[ns] (UTC, NaT when unparseable),
+# "money" = parsed once into int64 cents (0 when missing or unparseable), None = dtype inferred
+# by pandas. Tables not listed are read in full.
+SOURCE_SCHEMAS = {
+    'cooperative': {'cooperative_id': 'id', 'provinceId': 'id', 'districtId': 'id', 'subdistrictId': 'id',
+                    'villageId': 'id', 'capital': 'money', 'registration_type': 'category',
+                    'filling_method': 'category', 'longitude': None, 'latitude': None, 'address': None},
+    'members': {'cooperativeId': 'id', 'gender': 'category', 'principal_saving': 'money',
+                'mandatory_saving': 'money', 'bi_checking_verification': 'category'},
+    'management': {'cooperativeId': 'id', 'role': 'category', 'position': 'category', 'gender': 'category'},
+    'outlets': {'cooperative_outlet_id': 'id', 'cooperativeId': 'id', 'primary_image': None,
+                'cooperative_type_id': 'id', 'longitude': None, 'latitude': None},
+    'klus': {'cooperativeId': 'id', 'kluId': 'id'},
+    'partnerships': {'cooperativeId': 'id', 'business_partner_service_id': 'id', 'status': 'category',
+                     'created_at': 'timestamp', 'updated_at': 'timestamp'},
+    'upkdk': {'upkdk_id': 'id', 'villageId': 'id', 'type': 'category', 'internet_access': 'category',
+              'building_condition': 'category', 'water_electricity': 'category',
+              'longitude': None, 'latitude': None, 'address': None},
+    'domains': {'domain_id': 'id', 'verification_status': 'category'},
+    'village_mergers': {'village_id': 'id'},
+    'villages': {'village_id': 'id', 'code': None, 'total_u17': None, 'total_a17': None},
+    'districts': {'district_id': 'id', 'code': None},
+    'subdistricts': {'subdistrict_id': 'id', 'code': None},
+    'dim_klu': {'kluId': 'id', 'sector': 'category'},
+}
+INT32_RANGE = (np.iinfo('int32').min, np.iinfo('int32').max)
+# Schema kind -> declared SQLite column type (other columns are stored untyped, as read)
+SQLITE_COLUMN_TYPES = {'id': 'INTEGER', 'money': 'INTEGER', 'timestamp': 'INTEGER', 'category': 'TEXT'}
+NAT_EPOCH = np.iinfo('int64').min  # Epoch nanoseconds of a missing timestamp (pandas NaT)
+MONEY_SCALE = 100  # "money" columns hold int64 cents, exact for Decimal(18,2)
+PROCESS_SECONDS_CAP = 72 * 3600  # KPI_53 caps a partnership's process time at 72 hours, in whole seconds
+
+# KPI_49 GeoSpatialDataCompletenessScore components: table -> fields that should be filled. A table
+# only counts while it has at least one of its fields (cooperative_outlets.csv has no coordinates yet)
+GEO_COMPLETENESS_FIELDS = {
+    'cooperative': ['longitude', 'latitude', 'address'],
+    'upkdk': ['longitude', 'latitude', 'address'],
+    'outlets': ['longitude', 'latitude'],
+}
+
+# Inputs that can move cooperatives between villages or change every row: --incremental does a full run
+FULL_RECOMPUTE_SOURCES = ['villages', 'districts', 'subdistricts', 'dim_klu', 'dim_geography']
+
+# FACT_KPI output layout (column order and target data types)
+FACT_KPI_COLUMNS = [
+    # Dimension keys
+    'date_key', 'geo_key', 'outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id',
+    # KPI columns
+    'TotalKoperasiTerdaftar', 'TotalKoperasiPerProvinsi', 'TotalKoperasiPerKabupatenKota',
+    'RataRataModalAwalKoperasi', 'TotalModalAwalKoperasi',
+    'RasioKoperasiBaruVsTotal', 'RasioPendaftaranMandiriVsPendamping',
+    'KoperasiPer10000PendudukDesa',
+    'TotalAnggotaKoperasi', 'RasioGenderAnggotaLP',
+    'RataRataSimpananPokokPerAnggota', 'RataRataSimpananWajibPerAnggota',
+    'RasioAnggotaDenganBICheckingLancar',
+    'TotalPengurusKoperasi', 'TotalPengawasKoperasi',
+    'RasioGenderPengurus', 'RatioStrukturJabatanLengkap',
+    'RataRataAnggotaPerKoperasi',
+    'TotalGeraiKoperasi', 'GeraiPerKoperasi', 'SebaranGeraiPerProvinsi',
+    'KomposisiTipeGerai', 'ColdStorageCoverage', 'OutletExpansionRate',
+    'TotalKLUTerdaftar', 'Top10KBLITerbanyak', 'DistribusiKLUPerProvinsi',
+    'ProporsiSektorUtama', 'RataRataKLUPerKoperasi', 'KluDiversificationIndex',
+    'TotalAplikasiKemitraan', 'VerifiedPartnershipRate', 'RejectedPartnershipRate',
+    'InProgressPartnershipRate', 'DistribusiJenisLayananKemitraan',
+    'PartnershipGrowthRate', 'KemitraanPerProvinsi',
+    'TotalUPKDKAktif', 'ProporsiJenisUPKDK',
+    'UpkdkDenganAksesInternet', 'KondisiBangunanUpkdkLayak',
+    'TotalDomainKoperasiTerdaftar', 'DomainKoperasiTerverifikasi',
+    'KoperasiPerDesa', 'JumlahPenggabunganDesa', 'GeoSpatialDataCompletenessScore',
+    'PersentaseGeraiDenganFotoTerunggah', 'DistribusiJenisGeraiKoperasi',
+    'RataRataWaktuProsesAplikasiKemitraan',
+    'PersentaseUpkdkDenganAksesAirListrikMemadai'
+]
+
+# Integer columns (BigInt)
+INT_COLUMNS = [
+    'date_key', 'geo_key', 'outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id',
+    'TotalKoperasiTerdaftar', 'TotalKoperasiPerProvinsi', 'TotalKoperasiPerKabupatenKota',
+    'TotalAnggotaKoperasi', 'TotalPengurusKoperasi', 'TotalPengawasKoperasi',
+    'RataRataAnggotaPerKoperasi', 'TotalGeraiKoperasi', 'SebaranGeraiPerProvinsi',
+    'TotalKLUTerdaftar', 'Top10KBLITerbanyak', 'DistribusiKLUPerProvinsi',
+    'TotalAplikasiKemitraan', 'DistribusiJenisLayananKemitraan', 'KemitraanPerProvinsi',
+    'TotalUPKDKAktif', 'TotalDomainKoperasiTerdaftar', 'JumlahPenggabunganDesa'
+]
+
+# Decimal(18,2) columns
+DEC_18_2_COLUMNS = [
+    'RataRataModalAwalKoperasi', 'TotalModalAwalKoperasi',
+    'RataRataSimpananPokokPerAnggota', 'RataRataSimpananWajibPerAnggota',
+    'GeraiPerKoperasi', 'RataRataKLUPerKoperasi',
+    'KoperasiPer10000PendudukDesa', 'KoperasiPerDesa',
+    'RataRataWaktuProsesAplikasiKemitraan'
+]
+
+# Decimal(5,4) columns (percentages and indices)
+DEC_5_4_COLUMNS = [
+    'RasioKoperasiBaruVsTotal', 'RasioPendaftaranMandiriVsPendamping',
+    'RasioGenderAnggotaLP', 'RasioAnggotaDenganBICheckingLancar',
+    'RasioGenderPengurus', 'RatioStrukturJabatanLengkap',
+    'KomposisiTipeGerai', 'ColdStorageCoverage', 'OutletExpansionRate',
+    'ProporsiSektorUtama', 'KluDiversificationIndex',
+    'VerifiedPartnershipRate', 'RejectedPartnershipRate', 'InProgressPartnershipRate',
+    'PartnershipGrowthRate', 'ProporsiJenisUPKDK',
+    'UpkdkDenganAksesInternet', 'KondisiBangunanUpkdkLayak',
+    'DomainKoperasiTerverifikasi', 'GeoSpatialDataCompletenessScore',
+    'PersentaseGeraiDenganFotoTerunggah', 'DistribusiJenisGeraiKoperasi',
+    'PersentaseUpkdkDenganAksesAirListrikMemadai'
+]
 
 # ============================================================================
 # PROGRESS LOGGING UTILITIES
 # ============================================================================
 
+def process_cpu_seconds():
+    """User + system CPU time of this process and its finished worker processes."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def peak_rss_mb():
+    """Peak resident memory of this process (or its largest finished worker) in MB, None if unknown."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
 class ProgressLogger:
     """Handles real-time progress logging with timestamps and formatting."""
     
     def __init__(self):
         self.start_time = time.time()
-        self.step_times = {}
+        self.step_times = {}  # Stage name -> accumulated metrics, filled by stage()
+        self.muted = False
+    
+    @contextmanager
+    def stage(self, name, rows=0):
+        """Record wall time, CPU time, rows and peak RSS of a pipeline stage.
+        
+        Repeated stages (e.g. one KPI family per village) accumulate into one
+        entry. The yielded dict's "rows" can be set once the count is known.
+        """
+        counters = {'rows': rows}
+        wall_start, cpu_start = time.perf_counter(), process_cpu_seconds()
+        try:
+            yield counters
+        finally:
+            entry = self.step_times.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                      'rows': 0, 'peak_rss_mb': None})
+            entry['calls'] += 1
+            entry['wall_seconds'] += time.perf_counter() - wall_start
+            entry['cpu_seconds'] += process_cpu_seconds() - cpu_start
+            entry['rows'] += counters['rows']
+            entry['peak_rss_mb'] = peak_rss_mb()
+    
+    def merge_steps(self, step_times):
+        """Fold stage metrics recorded in a worker process into this logger."""
+        for name, metrics in step_times.items():
+            entry = self.step_times.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                      'rows': 0, 'peak_rss_mb': None})
+            for key in ('calls', 'wall_seconds', 'cpu_seconds', 'rows'):
+                entry[key] += metrics[key]
+            peaks = [peak for peak in (entry['peak_rss_mb'], metrics['peak_rss_mb']) if peak is not None]
+            entry['peak_rss_mb'] = max(peaks) if peaks else None
+    
+    def stage_metrics(self):
+        """Per-stage metrics with rounded times and rows per second."""
+        metrics = {}
+        for name, entry in self.step_times.items():
+            wall = entry['wall_seconds']
+            metrics[name] = {
+                'calls': entry['calls'],
+                'wall_seconds': round(wall, 4),
+                'cpu_seconds': round(entry['cpu_seconds'], 4),
+                'rows': entry['rows'],
+                'rows_per_second': round(entry['rows'] / wall, 1) if wall > 0 else None,
+                'peak_rss_mb': entry['peak_rss_mb'],
+            }
+        return metrics
+    
+    def log_stage_ranking(self, pattern=KPI_FAMILY_PATTERN):
+        """Log the stages matching a glob pattern, slowest first, with their share of the total."""
+        stages = {name: entry for name, entry in self.step_times.items() if fnmatch.fnmatchcase(name, pattern)}
+        total = sum(entry['wall_seconds'] for entry in stages.values())
+        self.log("PROFILE", f"{'Stage':32s} {'calls':>8s} {'total s':>9s} {'ms/call':>9s} {'share':>7s}")
+        for name, entry in sorted(stages.items(), key=lambda item: item[1]['wall_seconds'], reverse=True):
+            per_call = entry['wall_seconds'] / entry['calls'] * 1000 if entry['calls'] else 0
+            share = entry['wall_seconds'] / total * 100 if total > 0 else 0
+            self.log("PROFILE", f"{name:32s} {entry['calls']:8,d} {entry['wall_seconds']:9.3f} "
+                                f"{per_call:9.3f} {share:6.1f}%")
+    
+    def save_metrics(self, filepath, run_info):
+        """Write run_info plus the stage metrics as JSON."""
+        report = dict(run_info, total_seconds=round(time.time() - self.start_time, 3),
+                      peak_rss_mb=peak_rss_mb(), stages=self.stage_metrics())
+        with open(filepath, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    def save_openmetrics(self, filepath, run_info):
+        """Write the stage metrics as an OpenMetrics textfile (for the node exporter textfile collector)."""
+        families = [
+            ('stage_wall_seconds', 'Wall time of a FACT_KPI generation stage.', 'wall_seconds', 1),
+            ('stage_cpu_seconds', 'CPU time of a FACT_KPI generation stage.', 'cpu_seconds', 1),
+            ('stage_rows', 'Rows processed by a FACT_KPI generation stage.', 'rows', 1),
+            ('stage_rows_per_second', 'Throughput of a FACT_KPI generation stage.', 'rows_per_second', 1),
+            ('stage_peak_rss_bytes', 'Peak resident memory at the end of a FACT_KPI generation stage.',
+             'peak_rss_mb', 1024 * 1024),
+        ]
+        # Only stable labels: a per-run label (like the output file) would start new series every night
+        labels = f'engine="{run_info["engine"]}"'
+        lines = []
+        stages = self.stage_metrics()
+        for family, help_text, key, scale in families:
+            name = f"{OPENMETRICS_PREFIX}_{family}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for stage_name, metrics in stages.items():
+                if metrics[key] is not None:
+                    lines.append(f'{name}{{stage="{stage_name}",{labels}}} {metrics[key] * scale:g}')
+        for family, help_text, value in [
+            ('output_rows', 'Rows in the last FACT_KPI output.', run_info['rows']),
+            ('last_run_timestamp_seconds', 'Unix time the last FACT_KPI generation finished.', round(time.time())),
+        ]:
+            name = f"{OPENMETRICS_PREFIX}_{family}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name}{{{labels}}} {value}"]
+        lines.append("# EOF")
+        # Write then rename, so the collector never reads a half-written file
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, filepath)
+    
+    @contextmanager
+    def quiet(self):
+        """Suppress everything except progress and errors (for repeated steps)."""
+        previous, self.muted = self.muted, True
+        try:
+            yield
+        finally:
+            self.muted = previous
     
     def log(self, category, message, status=""):
         """Log a message with category and optional status."""
+        if self.muted and category not in ("PROCESSING", "ERROR"):
+            return
         elapsed = time.time() - self.start_time
         status_symbol = {
             "success": "✓",
@@ -47,9 +378,10 @@ class ProgressLogger:
         
         print(f"[{category:12s}] {message} {status_symbol}")
     
-    def log_file_load(self, filename, size_mb, row_count):
-        """Log file loading with size and row count."""
-        self.log("LOADING", f"{filename:40s} {size_mb:6.1f} MB, {row_count:,} rows", "success")
+    def log_file_load(self, filename, size_mb, row_count, source=""):
+        """Log file loading with size, row count and optional source (file type or cache)."""
+        suffix = f" [{source}]" if source else ""
+        self.log("LOADING", f"{filename:40s} {size_mb:6.1f} MB, {row_count:,} rows{suffix}", "success")
     
     def log_mapping(self, name, count):
         """Log mapping creation."""
@@ -59,7 +391,7 @@ class ProgressLogger:
         """Log global calculation."""
         self.log("GLOBAL", f"{name:50s} {value}", "success")
     
-    def log_progress(self, current, total, extra_info=""):
+    def log_progress(self, current, total, extra_info="", unit="Village"):
         """Log processing progress with percentage and ETA."""
         pct = (current / total * 100) if total > 0 else 0
         elapsed = time.time() - self.start_time
@@ -73,7 +405,7 @@ class ProgressLogger:
             eta_str = "ETA: calculating..."
         
         self.log("PROCESSING", 
-                f"Village {current:,}/{total:,} ({pct:5.1f}%) {extra_info} - {eta_str}", 
+                f"{unit} {current:,}/{total:,} ({pct:5.1f}%) {extra_info} - {eta_str}", 
                 "progress")
     
     def log_complete(self, message):
@@ -89,13 +421,23 @@ class ProgressLogger:
 
 logger = ProgressLogger()
 
+def timed_stage(name):
+    """Decorator recording every call as logger stage ``name``, one row (village) per call."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with logger.stage(name, rows=1):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # ============================================================================
 # FILE UTILITIES
 # ============================================================================
 
 def get_next_version_number():
-    """Get the next version number for FACT_KPI file."""
-    pattern = os.path.join(RESULT_DIR, f"{OUTPUT_FILE_PREFIX}*.csv")
+    """Get the next version number for FACT_KPI file (shared by every output format)."""
+    pattern = os.path.join(RESULT_DIR, f"{OUTPUT_FILE_PREFIX}*")
     existing_files = glob.glob(pattern)
     
     if not existing_files:
@@ -103,10 +445,12 @@ def get_next_version_number():
     
     versions = []
     for filepath in existing_files:
-        filename = os.path.basename(filepath)
-        # Extract version number from filename like "FACT_KPI_V001.csv"
+        filename, extension = os.path.splitext(os.path.basename(filepath))
+        if extension not in OUTPUT_FORMATS.values():
+            continue
+        # Extract version number from filename like "FACT_KPI_V001.csv" or "FACT_KPI_V001.parquet"
         try:
-            version_str = filename.replace(OUTPUT_FILE_PREFIX, "").replace(".csv", "")
+            version_str = filename.replace(OUTPUT_FILE_PREFIX, "")
             version_num = int(version_str)
             versions.append(version_num)
         except ValueError:
@@ -118,48 +462,415 @@ def get_file_size_mb(filepath):
     """Get file size in MB."""
     return os.path.getsize(filepath) / (1024 * 1024)
 
+def source_file_path(key):
+    """Path of an input table from SOURCE_FILES.
+    
+    Dimension tables may also be written as Parquet/Arrow by
+    generate_dimensions.py; the most recently written variant is used.
+    """
+    filename = SOURCE_FILES[key]
+    if key in ['dim_geography', 'dim_period']:
+        base = os.path.splitext(filename)[0]
+        variants = [base + extension for extension in OUTPUT_FORMATS.values() if os.path.exists(base + extension)]
+        return max(variants, key=os.path.getmtime) if variants else filename
+    return os.path.join(DATA_SOURCE_DIR, filename)
+
+def get_file_sha256(filepath, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# ============================================================================
+# SOURCE CACHE
+# ============================================================================
+# Each cleaned source table is stored in SOURCE_CACHE_DIR next to a small JSON
+# file with the size, mtime and SHA-256 of the CSV it came from. An entry is
+# used when size and mtime still match; if only the mtime moved (file copied
+# or touched) the content hash decides. Reads are memory-mapped.
+
+def _cache_paths(key, cache_format):
+    """Table and metadata paths of a cache entry."""
+    return (os.path.join(SOURCE_CACHE_DIR, f"{key}.{cache_format}"),
+            os.path.join(SOURCE_CACHE_DIR, f"{key}.{cache_format}.json"))
+
+def _read_cache_meta(meta_path):
+    """Metadata of a cache entry, None if missing or unreadable."""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache_meta(meta_path, meta):
+    """Write the metadata of a cache entry."""
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+def source_file_sha256(key):
+    """SHA-256 of an input file, reusing cache metadata when size and mtime match."""
+    filepath = source_file_path(key)
+    stat = os.stat(filepath)
+    for cache_format in CACHE_FORMATS:
+        meta = _read_cache_meta(_cache_paths(key, cache_format)[1])
+        if meta and meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns:
+            return meta['sha256']
+    return get_file_sha256(filepath)
+
+def load_cached_table(key, filepath, cache_format, schema, columns):
+    """Cached copy of a cleaned source table (only ``columns``, None = all), None if missing or stale."""
+    table_path, meta_path = _cache_paths(key, cache_format)
+    meta = _read_cache_meta(meta_path)
+    if meta is None or meta.get('format') != cache_format or not os.path.exists(table_path):
+        return None
+    if meta.get('schema') != schema or meta.get('source') != filepath:
+        return None
+    
+    stat = os.stat(filepath)
+    if meta.get('size') != stat.st_size:
+        return None
+    if meta.get('mtime_ns') != stat.st_mtime_ns:
+        if get_file_sha256(filepath) != meta.get('sha256'):
+            return None
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_cache_meta(meta_path, meta)
+    
+    reader = feather.read_table if cache_format == "feather" else parquet.read_table
+    if columns is not None:
+        columns = [col for col in meta['columns'] if col in columns]
+    df = reader(table_path, columns=columns, memory_map=True).to_pandas()
+    # Arrow gives None for missing strings, read_csv gives NaN
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    df.attrs['coercion_failures'] = {col: count for col, count in meta.get('coercion_failures', {}).items()
+                                     if col in df.columns}
+    return df
+
+def store_cached_table(key, filepath, df, cache_format, schema):
+    """Write a cleaned source table to the cache (skipped if Arrow cannot represent it)."""
+    os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+    table_path, meta_path = _cache_paths(key, cache_format)
+    try:
+        if cache_format == "feather":
+            df.to_feather(table_path, compression='uncompressed')
+        else:
+            df.to_parquet(table_path, index=False)
+    except Exception as e:
+        # e.g. a column mixing numbers and strings
+        logger.log("CACHE", f"{key} not cached: {e}", "info")
+        if os.path.exists(table_path):
+            os.remove(table_path)
+        return
+    stat = os.stat(filepath)
+    _write_cache_meta(meta_path, {
+        'source': filepath,
+        'format': cache_format,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': get_file_sha256(filepath),
+        'schema': schema,
+        'columns': list(df.columns),
+        'coercion_failures': df.attrs.get('coercion_failures', {}),
+    })
+
 # ============================================================================
 # DATA LOADING
 # ============================================================================
 
-def load_all_data():
-    """Load all required data sources and dimension tables."""
+def clean_column_name(name):
+    """Strip whitespace and embedded newlines from a CSV header."""
+    return name.strip().replace('\n', '').replace('\r', '')
+
+def table_schema(key, include_created_at=False):
+    """Columns (name -> dtype kind) to read for a table, None to read every column."""
+    schema = SOURCE_SCHEMAS.get(key)
+    if schema is None:
+        return None
+    schema = dict(schema)
+    if include_created_at and key in TIME_AWARE_TABLES:
+        schema.setdefault('created_at', 'timestamp')
+    return schema
+
+def read_arrow_file(filepath, columns=None):
+    """Read a Parquet or Arrow IPC file into pandas with CSV-like dtypes (plain strings, no decimals)."""
+    if filepath.endswith(OUTPUT_FORMATS["parquet"]):
+        table = parquet.read_table(filepath, columns=columns, memory_map=True)
+    else:
+        table = feather.read_table(filepath, columns=columns, memory_map=True)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type) or pa.types.is_date(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+        elif pa.types.is_decimal(field.type):
+            # Via text: a direct decimal -> float64 cast is not correctly rounded
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()).cast(pa.float64()))
+        elif pa.types.is_integer(field.type) and field.type != pa.int64() and table.column(i).null_count == 0:
+            table = table.set_column(i, field.name, table.column(i).cast(pa.int64()))
+    df = table.to_pandas()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+def _csv_read_options(filepath, schema):
+    """Map the CSV's raw headers to clean schema column names, plus the category dtypes to read them with."""
+    header = pd.read_csv(filepath, nrows=0).columns
+    raw_names = {raw: clean_column_name(raw) for raw in header if clean_column_name(raw) in schema}
+    dtypes = {raw: 'category' for raw, name in raw_names.items() if schema[name] == 'category'}
+    return raw_names, dtypes
+
+def parse_timestamps(values):
+    """Parse timestamp strings into datetime64[ns]: zoned values in UTC, NaT where unparseable."""
+    if pd.api.types.is_datetime64_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, errors='coerce', utc=True)
+    # The format is inferred from the first value; values in another format get a per-value retry
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], errors='coerce', utc=True, format='mixed')
+    return parsed.dt.tz_convert(None).astype('datetime64[ns]')
+
+def epoch_ns(timestamps):
+    """int64 epoch nanoseconds of a datetime64[ns] column (NAT_EPOCH where missing)."""
+    return np.asarray(timestamps, dtype='datetime64[ns]').view('int64')
+
+def seconds_between(start, end):
+    """Whole int64 seconds from start to end of two datetime64[ns] columns, -1 where either is missing."""
+    start_ns, end_ns = epoch_ns(start), epoch_ns(end)
+    seconds = (end_ns - start_ns) // 1_000_000_000
+    seconds[(start_ns == NAT_EPOCH) | (end_ns == NAT_EPOCH)] = -1
+    return seconds
+
+def process_hours(seconds_sum, count):
+    """KPI_53 average hours from a sum of capped process seconds: divided once, like money cents."""
+    return seconds_sum / count / 3600
+
+# Thousands-separated money strings; anything else is read with a decimal point or comma
+MONEY_IDR_PATTERN = r'-?[1-9]\d{0,2}(?:\.\d{3})+(?:,\d+)?'  # 1.000.000,00
+MONEY_EN_PATTERN = r'-?[1-9]\d{0,2}(?:,\d{3})+(?:\.\d+)?'  # 1,000,000.00
+# Largest whole amount whose cents (rounded up) still fit in int64
+MONEY_MAX_WHOLE = (np.iinfo('int64').max - MONEY_SCALE) // MONEY_SCALE
+
+def parse_money(values):
+    """Money values as int64 cents (0 when missing or unparseable) plus a mask of the unparseable values.
+    
+    Accepts numbers and strings such as 1000000, 1000000,50, 1.000.000,00 (Indonesian),
+    1,000,000.00 and an optional Rp prefix; fractions are rounded half up to whole cents.
+    Amounts beyond MONEY_MAX_WHOLE rupiah would overflow int64 cents and count as unparseable.
+    """
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_float_dtype(values):
+        overflow = (values.abs() > MONEY_MAX_WHOLE).to_numpy(dtype=bool)
+        if pd.api.types.is_integer_dtype(values):
+            cents = values.where(~overflow, 0).astype('int64') * MONEY_SCALE
+        else:
+            # Half away from zero like the string branch; Series.round() would round half to even
+            amounts = values.where(~overflow, 0).fillna(0).to_numpy(dtype='float64')
+            cents = pd.Series(np.sign(amounts) * np.floor(np.abs(amounts) * MONEY_SCALE + 0.5),
+                              index=values.index).astype('int64')
+        return cents, overflow
+    
+    text = values.astype('string').str.strip().str.replace(r'^Rp\.?\s*', '', case=False, regex=True)
+    text = text.str.replace(' ', '', regex=False)
+    text = text.mask(text.str.fullmatch(MONEY_IDR_PATTERN).fillna(False), text.str.replace('.', '', regex=False))
+    text = text.mask(text.str.fullmatch(MONEY_EN_PATTERN).fillna(False), text.str.replace(',', '', regex=False))
+    # A comma still left is a decimal comma
+    parts = text.str.replace(',', '.', regex=False).str.extract(r'^(-?)(\d+)(?:\.(\d*))?$')
+    # Whole parts longer than MONEY_MAX_WHOLE would not even fit int64 before scaling
+    digits = parts[1].str.lstrip('0').replace('', '0')
+    parsed = (digits.notna() & (digits.str.len() <= len(str(MONEY_MAX_WHOLE)))).to_numpy(dtype=bool)
+    whole = digits.where(parsed, '0').astype('int64')
+    parsed &= (whole <= MONEY_MAX_WHOLE).to_numpy()
+    fraction = parts[2].fillna('').str.ljust(3, '0').str[:3].astype('int64')
+    cents = whole * MONEY_SCALE + (fraction + 5) // 10
+    cents = cents.where(parts[0] != '-', -cents).where(parsed, 0).astype('int64')
+    return cents, values.notna().to_numpy() & ~parsed
+
+def _parse_typed_columns(df, schema):
+    """Parse the schema's "timestamp" and "money" columns of a freshly read table in place.
+    
+    Values that are present but not parseable as money are counted per column
+    in df.attrs['coercion_failures'].
+    """
+    failures = {}
+    for col, kind in (schema or {}).items():
+        if col not in df.columns:
+            continue
+        if kind == 'timestamp':
+            df[col] = parse_timestamps(df[col])
+        elif kind == 'money':
+            df[col], failed = parse_money(df[col])
+            failures[col] = int(failed.sum())
+    df.attrs['coercion_failures'] = failures
+    return df
+
+def coercion_failures(data):
+    """Unparseable money values per column ('table.column' -> count) of the loaded and streamed tables."""
+    return {f"{key.removesuffix('_partials')}.{col}": count
+            for key, table in data.items()
+            for col, count in table.attrs.get('coercion_failures', {}).items()}
+
+def read_source_csv(filepath, schema):
+    """Read a CSV with clean column names, only the schema's columns and their dtypes."""
+    if not filepath.endswith(OUTPUT_FORMATS["csv"]):
+        return _parse_typed_columns(read_arrow_file(filepath), schema)
+    if schema is None:
+        df = pd.read_csv(filepath, low_memory=False)
+        df.columns = [clean_column_name(col) for col in df.columns]
+        return df
+    
+    raw_names, dtypes = _csv_read_options(filepath, schema)
+    df = pd.read_csv(filepath, usecols=list(raw_names), dtype=dtypes, low_memory=False)
+    df = df.rename(columns=raw_names)
+    
+    for col, kind in schema.items():
+        # IDs with missing values are parsed as float64 and left alone
+        if kind == 'id' and col in df.columns and df[col].dtype == 'int64':
+            values = df[col]
+            if len(values) == 0 or (values.min() >= INT32_RANGE[0] and values.max() <= INT32_RANGE[1]):
+                df[col] = values.astype('int32')
+    return _parse_typed_columns(df, schema)
+
+def read_source_chunks(filepath, schema, chunk_size):
+    """Yield a source CSV in chunks of chunk_size rows, read like read_source_csv."""
+    if not filepath.endswith(OUTPUT_FORMATS["csv"]):
+        yield read_source_csv(filepath, schema)
+        return
+    raw_names, dtypes = _csv_read_options(filepath, schema)
+    for chunk in pd.read_csv(filepath, usecols=list(raw_names), dtype=dtypes, chunksize=chunk_size):
+        yield _parse_typed_columns(chunk.rename(columns=raw_names), schema)
+
+# ============================================================================
+# STREAMING AGGREGATION
+# ============================================================================
+
+def _fold_partials(parts, aggregations):
+    """Combine per-chunk partials (indexed by cooperativeId) into one row per cooperative."""
+    return pd.concat(parts).groupby(level=0).agg(aggregations)
+
+def _stream_partials(filepath, schema, chunk_size, chunk_partial, aggregations):
+    """Fold a table chunk by chunk into per-cooperative partials without holding it in memory."""
+    parts, row_count, chunk_count = [], 0, 0
+    failures = {}
+    for chunk in read_source_chunks(filepath, schema, chunk_size):
+        row_count += len(chunk)
+        chunk_count += 1
+        for col, count in chunk.attrs.get('coercion_failures', {}).items():
+            failures[col] = failures.get(col, 0) + count
+        if not aggregations:
+            continue
+        columns = chunk_partial(chunk)
+        parts.append(pd.DataFrame(columns).groupby(chunk['cooperativeId'].to_numpy()).agg(aggregations))
+        if len(parts) >= PARTIAL_COMPACT_EVERY:
+            parts = [_fold_partials(parts, aggregations)]
+    if parts:
+        partials = _fold_partials(parts, aggregations)
+    else:
+        partials = pd.DataFrame({col: pd.Series(dtype='int64') for col in aggregations})
+    partials.attrs['coercion_failures'] = failures
+    return partials.rename_axis('cooperativeId'), row_count, chunk_count
+
+def _member_chunk_partial(chunk):
+    """Member counts, gender/BI checking counts and saving sums of one chunk."""
+    columns = {'member_count': np.ones(len(chunk), dtype='int64')}
+    if 'gender' in chunk.columns:
+        columns['female_count'] = (chunk['gender'] == 'PEREMPUAN').to_numpy(dtype='int64')
+    for column in ['principal_saving', 'mandatory_saving']:
+        columns[f'{column}_sum'] = chunk[column].to_numpy(dtype='int64')
+    if 'bi_checking_verification' in chunk.columns:
+        columns['lancar_count'] = (chunk['bi_checking_verification'] == 'Lancar').to_numpy(dtype='int64')
+    return columns
+
+def _management_role_column(columns):
+    """Column holding the management role: role, else position, else None."""
+    return 'role' if 'role' in columns else ('position' if 'position' in columns else None)
+
+def _management_chunk_partial(chunk):
+    """Pengurus/pengawas counts and Ketua/Sekretaris/Bendahara presence flags of one chunk."""
+    role_column = _management_role_column(chunk.columns)
+    if role_column is None:
+        return {}
+    role = chunk[role_column]
+    is_pengurus = role.isin(PENGURUS_ROLES)
+    columns = {'pengurus_count': is_pengurus, 'pengawas_count': role == 'Pengawas'}
+    if 'gender' in chunk.columns:
+        columns['female_pengurus_count'] = is_pengurus & (chunk['gender'] == 'Perempuan')
+    for role_name in PENGURUS_ROLES:
+        columns[f'has_{role_name.lower()}'] = role == role_name
+    return {name: values.to_numpy(dtype='int64') for name, values in columns.items()}
+
+def aggregate_members_in_chunks(filepath, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Per-cooperative member partials: member_count, female_count, *_saving_sum (cents), lancar_count."""
+    raw_names, _ = _csv_read_options(filepath, schema)
+    present = set(raw_names.values())
+    aggregations = {'member_count': 'sum'}
+    if 'gender' in present:
+        aggregations['female_count'] = 'sum'
+    aggregations.update({'principal_saving_sum': 'sum', 'mandatory_saving_sum': 'sum'})
+    if 'bi_checking_verification' in present:
+        aggregations['lancar_count'] = 'sum'
+    return _stream_partials(filepath, schema, chunk_size, _member_chunk_partial, aggregations)
+
+def aggregate_management_in_chunks(filepath, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Per-cooperative management partials: pengurus/pengawas counts and role presence flags."""
+    raw_names, _ = _csv_read_options(filepath, schema)
+    present = set(raw_names.values())
+    aggregations = {}
+    if _management_role_column(present) is not None:
+        aggregations = {'pengurus_count': 'sum', 'pengawas_count': 'sum'}
+        if 'gender' in present:
+            aggregations['female_pengurus_count'] = 'sum'
+        aggregations.update({f'has_{role_name.lower()}': 'max' for role_name in PENGURUS_ROLES})
+    return _stream_partials(filepath, schema, chunk_size, _management_chunk_partial, aggregations)
+
+STREAM_AGGREGATORS = {
+    'members': aggregate_members_in_chunks,
+    'management': aggregate_management_in_chunks,
+}
+
+def load_all_data(cache_format=DEFAULT_CACHE_FORMAT, include_created_at=False, streamed_tables=(),
+                  chunk_size=DEFAULT_CHUNK_SIZE, tables=None):
+    """Load all required data sources and dimension tables.
+    
+    Source tables are read with the columns and dtypes of SOURCE_SCHEMAS;
+    include_created_at adds created_at to the time-aware tables.
+    cache_format selects the source cache ("feather" or "parquet"); None reads
+    every CSV directly.
+    Tables in streamed_tables are never loaded whole: they are read chunk_size
+    rows at a time into per-cooperative partials, stored as data['<table>_partials'].
+    tables limits loading to those SOURCE_FILES keys (default: all of them).
+    """
     logger.log("INIT", "Starting data loading phase...")
+    if cache_format is not None and feather is None:
+        logger.log("INIT", "pyarrow not installed, source cache disabled", "info")
+        cache_format = None
     
     data = {}
     
-    # Define required files
-    required_files = {
-        'cooperative': 'cooperative.csv',
-        'members': 'cooperative_members.csv',
-        'management': 'cooperative_management.csv',
-        'outlets': 'cooperative_outlets.csv',
-        'klus': 'cooperative_klus.csv',
-        'partnerships': 'business_partnership_applications.csv',
-        'upkdk': 'upkdk.csv',
-        'domains': 'domains.csv',
-        'village_mergers': 'cooperative_village_mergers.csv',
-        'villages': 'villages.csv',
-        'districts': 'districts.csv',
-        'subdistricts': 'subdistricts.csv',
-        'dim_klu': 'dim_klu.csv',
-        'dim_geography': os.path.join(RESULT_DIR, 'DIM_GEOGRAPHY.csv'),
-        'dim_period': os.path.join(RESULT_DIR, 'DIM_PERIOD.csv'),
-    }
-    
     # Load each file
-    for key, filename in required_files.items():
-        if key in ['dim_geography', 'dim_period']:
-            filepath = filename
-        else:
-            filepath = os.path.join(DATA_SOURCE_DIR, filename)
+    for key in SOURCE_FILES if tables is None else tables:
+        filepath = source_file_path(key)
         
         try:
-            df = pd.read_csv(filepath, low_memory=False)
-            # Clean column names (strip whitespace and newlines)
-            df.columns = df.columns.str.strip().str.replace('\n', '').str.replace('\r', '')
+            schema = table_schema(key, include_created_at)
+            if key in streamed_tables:
+                partials, row_count, chunk_count = STREAM_AGGREGATORS[key](filepath, schema, chunk_size)
+                logger.log_file_load(os.path.basename(filepath), get_file_size_mb(filepath), row_count,
+                                     f"streamed, {chunk_count} chunks")
+                data[f'{key}_partials'] = partials
+                continue
+            # The cache always holds created_at too, so it serves single and multi-period runs
+            cached_schema = table_schema(key, include_created_at=True)
+            df = load_cached_table(key, filepath, cache_format, cached_schema, schema) if cache_format else None
+            from_cache = df is not None
+            if not from_cache:
+                df = read_source_csv(filepath, cached_schema if cache_format else schema)
+                if cache_format:
+                    store_cached_table(key, filepath, df, cache_format, cached_schema)
+                if schema is not None:
+                    df = df[[col for col in df.columns if col in schema]]
             size_mb = get_file_size_mb(filepath)
-            logger.log_file_load(os.path.basename(filepath), size_mb, len(df))
+            logger.log_file_load(os.path.basename(filepath), size_mb, len(df),
+                                 "cache" if from_cache else os.path.splitext(filepath)[1].lstrip('.'))
             data[key] = df
         except FileNotFoundError:
             logger.log_error(f"File not found: {filepath}")
@@ -169,60 +880,278 @@ def load_all_data():
             raise
     
     logger.log("INIT", f"Loaded {len(data)} data sources successfully", "success")
+    for column, count in coercion_failures(data).items():
+        if count:
+            logger.log("INIT", f"{column}: {count:,} values not parseable as money, counted as 0", "info")
     return data
 
 # ============================================================================
 # PRE-CALCULATION & MAPPING
 # ============================================================================
 
+class CsrTable:
+    """Rows of one table stored sorted by a key column, with CSR offset arrays.
+    
+    Rows of key value ``k`` live in ``table.iloc[offsets[slot]:offsets[slot + 1]]``,
+    so looking up a single key is a dictionary hit plus a zero-copy slice.
+    """
+    
+    def __init__(self, table, key):
+        codes, uniques = pd.factorize(table[key], sort=True)
+        order = np.argsort(codes, kind='stable')
+        # Rows with a missing key (code -1) sort first and never match a lookup
+        order = order[int((codes < 0).sum()):]
+        
+        self.key = key
+        self.positions = order  # source row number of every sorted row
+        self.table = table.iloc[order].reset_index(drop=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.slots = {value: slot for slot, value in enumerate(uniques)}
+    
+    def span(self, key_value):
+        """Return the (start, end) offsets of a key, (0, 0) if absent."""
+        slot = self.slots.get(key_value)
+        if slot is None:
+            return 0, 0
+        return self.offsets[slot], self.offsets[slot + 1]
+    
+    def count(self, key_value):
+        """Number of rows for a key."""
+        start, end = self.span(key_value)
+        return int(end - start)
+    
+    def rows(self, key_value):
+        """Rows of a single key as a zero-copy slice."""
+        start, end = self.span(key_value)
+        return self.table.iloc[start:end]
+    
+    def rows_for(self, key_values):
+        """Rows of several keys, in source table order (same as an ``isin`` filter)."""
+        slots = {self.slots[value] for value in key_values if value in self.slots}
+        spans = [(self.offsets[slot], self.offsets[slot + 1]) for slot in sorted(slots)]
+        if len(spans) == 0:
+            return self.table.iloc[0:0]
+        if len(spans) == 1:
+            return self.table.iloc[spans[0][0]:spans[0][1]]
+        row_numbers = np.concatenate([np.arange(start, end) for start, end in spans])
+        # Restore source order so "first row" dimension keys match the boolean filters
+        row_numbers = row_numbers[np.argsort(self.positions[row_numbers], kind='stable')]
+        return self.table.iloc[row_numbers]
+
+class CsrIndex:
+    """CsrTable indexes over several tables, each keyed on its TABLE_KEYS column."""
+    
+    TABLE_KEYS = {}
+    
+    def __init__(self, data):
+        self.tables = {
+            name: CsrTable(data[name], key)
+            for name, key in self.TABLE_KEYS.items()
+            if name in data
+        }
+    
+    def count(self, table, key_value):
+        """Number of rows of a table for one key."""
+        return self.tables[table].count(key_value)
+    
+    def rows(self, table, key_value):
+        """Rows of a table for one key (zero-copy slice)."""
+        return self.tables[table].rows(key_value)
+    
+    def rows_for(self, table, key_values):
+        """Rows of a table for a list of keys, in source table order."""
+        return self.tables[table].rows_for(key_values)
+
+class CooperativeIndex(CsrIndex):
+    """Per-cooperative CSR indexes over the cooperative table and its child tables."""
+    
+    TABLE_KEYS = {
+        'cooperative': 'cooperative_id',
+        'members': 'cooperativeId',
+        'outlets': 'cooperativeId',
+        'klus': 'cooperativeId',
+        'partnerships': 'cooperativeId',
+    }
+
+class VillageIndex(CsrIndex):
+    """Per-village_id CSR indexes over villages and the tables keyed on a village_id."""
+    
+    TABLE_KEYS = {
+        'villages': 'village_id',
+        'upkdk': 'villageId',
+        'village_mergers': 'village_id',
+    }
+
+class VillageCodeIndex:
+    """DIM_GEOGRAPHY village code -> village_ids -> cooperative_ids, built in one pass.
+    
+    villages.csv repeats codes across many village_id rows, so a code maps to a
+    list of village_ids (in villages.csv order) and to the cooperatives of any
+    of them (in cooperative.csv order).
+    """
+    
+    def __init__(self, villages, cooperative):
+        village_id_values = villages['village_id'].to_numpy()
+        self.village_ids = {
+            code: village_id_values[positions].tolist()
+            for code, positions in villages.groupby('code', sort=False).indices.items()
+        }
+        
+        links = villages[['village_id', 'code']].drop_duplicates()
+        coops = cooperative[['cooperative_id', 'villageId']].reset_index(drop=True)
+        coops['_pos'] = np.arange(len(coops))
+        matched = coops.merge(links, left_on='villageId', right_on='village_id', how='inner')
+        matched = matched.sort_values('_pos', kind='stable').reset_index(drop=True)
+        coop_id_values = matched['cooperative_id'].to_numpy()
+        self.coop_ids = {
+            code: coop_id_values[positions].tolist()
+            for code, positions in matched.groupby('code', sort=False).indices.items()
+        }
+        
+        # Duplicate-code statistics, computed once instead of per village
+        ids_per_code = villages.groupby('code')['village_id'].size()
+        self.stats = {
+            'villages': len(villages),
+            'codes': len(ids_per_code),
+            'duplicate_codes': int((ids_per_code > 1).sum()),
+            'duplicate_rows': int((ids_per_code - 1).sum()),
+            'codes_with_cooperatives': len(self.coop_ids),
+        }
+    
+    def lookup(self, code):
+        """Return (village_ids, cooperative_ids) for a village code."""
+        return self.village_ids.get(code, []), self.coop_ids.get(code, [])
+
+class CooperativeRoles:
+    """Per-cooperative management summary: pengurus/pengawas counts and a role bitmask.
+    
+    Bit i of a cooperative's role mask is set when its management has
+    PENGURUS_ROLES[i] (in the role column, else position), so a complete
+    structure is a mask equal to COMPLETE_STRUCTURE_MASK. Built once from the
+    management table, or from its per-cooperative partials when streamed.
+    """
+    
+    def __init__(self, table):
+        self.table = table  # Indexed by cooperative id: ROLE_COUNT_COLUMNS + role_mask
+        self.slots = {coop_id: slot for slot, coop_id in enumerate(table.index)}
+        self.counts = table[ROLE_COUNT_COLUMNS].to_numpy(dtype='int64')
+        self.masks = table['role_mask'].to_numpy(dtype='int64')
+    
+    @classmethod
+    def _from_flags(cls, counts, flags):
+        """Table from per-cooperative counts and per-role presence flags (one column per PENGURUS_ROLES entry)."""
+        role_mask = sum(flags[role_name].astype('int64') * (1 << bit) for bit, role_name in enumerate(PENGURUS_ROLES))
+        table = counts.reindex(columns=ROLE_COUNT_COLUMNS, fill_value=0).astype('int64')
+        return cls(table.assign(role_mask=role_mask))
+    
+    @classmethod
+    def from_data(cls, data, keys=None):
+        """Roles from data['management'], or data['management_partials'] when streamed.
+        
+        keys replaces the management rows' cooperativeId as the groupby keys
+        (the multi-period sweep adds each row's period bucket).
+        """
+        if 'management_partials' in data:
+            partials = data['management_partials']
+            if 'pengurus_count' not in partials.columns:
+                return cls.empty()
+            flags = pd.DataFrame({role_name: partials[f'has_{role_name.lower()}'] > 0 for role_name in PENGURUS_ROLES})
+            return cls._from_flags(partials, flags)
+        
+        management = data['management']
+        role_column = _management_role_column(management.columns)
+        if role_column is None:
+            return cls.empty()
+        role = management[role_column]
+        is_pengurus = role.isin(PENGURUS_ROLES)
+        rows = pd.DataFrame({'pengurus_count': is_pengurus, 'pengawas_count': role == 'Pengawas'})
+        if 'gender' in management.columns:
+            rows['female_pengurus_count'] = is_pengurus & (management['gender'] == 'Perempuan')
+        for role_name in PENGURUS_ROLES:
+            rows[role_name] = role == role_name
+        by_coop = rows.groupby(management['cooperativeId'] if keys is None else keys)
+        return cls._from_flags(by_coop[rows.columns[:-len(PENGURUS_ROLES)]].sum(), by_coop[PENGURUS_ROLES].any())
+    
+    @classmethod
+    def empty(cls):
+        """Roles of a management table without a role or position column."""
+        return cls(pd.DataFrame({column: pd.Series(dtype='int64') for column in ROLE_COUNT_COLUMNS + ['role_mask']}))
+    
+    def _slots(self, coop_ids):
+        """Table positions of the given cooperatives (those without management are skipped)."""
+        return [self.slots[coop_id] for coop_id in coop_ids if coop_id in self.slots]
+    
+    def totals(self, coop_ids):
+        """(pengurus, pengawas, female pengurus) summed over the distinct cooperatives."""
+        slots = sorted(set(self._slots(coop_ids)))
+        return tuple(int(total) for total in self.counts[slots].sum(axis=0))
+    
+    def complete_count(self, coop_ids):
+        """Number of coop_ids (with repeats) whose role mask is a complete structure."""
+        return int((self.masks[self._slots(coop_ids)] == COMPLETE_STRUCTURE_MASK).sum())
+
 def create_mappings(data):
-    """Create lookup dictionaries for fast access."""
+    """Create the lookup indexes of the per-village loop engine."""
     logger.log("INIT", "Creating lookup mappings...")
     
     mappings = {}
     
-    # 1. Cooperative Geography Map
-    coop_geo_map = {}
-    for _, row in data['cooperative'].iterrows():
-        key = (row.get('provinceId'), row.get('districtId'), 
-               row.get('subdistrictId'), row.get('villageId'))
-        if key not in coop_geo_map:
-            coop_geo_map[key] = []
-        coop_geo_map[key].append(row['cooperative_id'])
-    
-    mappings['coop_geo'] = coop_geo_map
-    logger.log_mapping("Cooperative geography map", len(coop_geo_map))
-    
-    # 2. Members by Cooperative
-    members_by_coop = data['members'].groupby('cooperativeId').size().to_dict()
-    mappings['members_count'] = members_by_coop
-    logger.log_mapping("Members count map", len(members_by_coop))
-    
-    # 3. Management by Cooperative
-    mappings['management'] = data['management']
-    logger.log_mapping("Management data", len(data['management']))
-    
-    # 4. Outlets by Cooperative
-    outlets_by_coop = data['outlets'].groupby('cooperativeId').size().to_dict()
-    mappings['outlets_count'] = outlets_by_coop
-    logger.log_mapping("Outlets count map", len(outlets_by_coop))
-    
-    # 5. KLUs by Cooperative
-    klu_by_coop = data['klus'].groupby('cooperativeId')['kluId'].apply(list).to_dict()
-    mappings['klu_by_coop'] = klu_by_coop
-    logger.log_mapping("KLU by cooperative map", len(klu_by_coop))
-    
-    # 6. Partnerships by Cooperative
-    mappings['partnerships'] = data['partnerships']
-    logger.log_mapping("Partnerships data", len(data['partnerships']))
-    
-    # 7. UPKDK by Village
-    upkdk_by_village = data['upkdk'].groupby('villageId')['upkdk_id'].apply(list).to_dict()
-    mappings['upkdk_by_village'] = upkdk_by_village
-    logger.log_mapping("UPKDK by village map", len(upkdk_by_village))
+    # 1. Village code -> village_ids -> cooperative_ids
+    village_codes = VillageCodeIndex(data['villages'], data['cooperative'])
+    mappings['village_codes'] = village_codes
+    logger.log_mapping("Village code index", len(village_codes.village_ids))
+    stats = village_codes.stats
+    logger.log("MAPPING", f"Village codes: {stats['villages']:,} rows, {stats['codes']:,} unique codes, "
+               f"{stats['duplicate_codes']:,} duplicated codes ({stats['duplicate_rows']:,} extra rows), "
+               f"{stats['codes_with_cooperatives']:,} codes with cooperatives", "info")
+    
+    # 2. Per-cooperative CSR index over cooperative and child tables (management is summarized by 3.)
+    coop_index = CooperativeIndex(data)
+    mappings['coop_index'] = coop_index
+    for name, csr in coop_index.tables.items():
+        logger.log_mapping(f"CSR index: {name} by {csr.key}", len(csr.slots))
+    
+    # 3. Management role bitmasks by Cooperative (from per-cooperative partials when streamed)
+    mappings['management_roles'] = CooperativeRoles.from_data(data)
+    logger.log_mapping("Management role bitmasks", len(mappings['management_roles'].slots))
+    
+    # 4. Per-village_id CSR index over villages, UPKDK and village mergers
+    village_index = VillageIndex(data)
+    mappings['village_index'] = village_index
+    for name, csr in village_index.tables.items():
+        logger.log_mapping(f"CSR index: {name} by {csr.key}", len(csr.slots))
     
     return mappings
 
+def geo_completeness_rows(data):
+    """Filled and total GEO_COMPLETENESS_FIELDS points of every component row, as (table key, frame) pairs.
+    
+    Each frame has the row's villageId, filled, total and _pos (its position in
+    data[key]); outlet rows also carry _coop_pos, the cooperative row placing them.
+    """
+    for key, fields in GEO_COMPLETENESS_FIELDS.items():
+        source = data[key]
+        if not any(field in source.columns for field in fields):
+            continue
+        source = source.reset_index(drop=True).assign(_pos=np.arange(len(source)))
+        if 'villageId' not in source.columns:
+            # Outlets belong to the village of their cooperative
+            coops = data['cooperative'][['cooperative_id', 'villageId']].reset_index(drop=True)
+            source = source.merge(coops.assign(_coop_pos=np.arange(len(coops))),
+                                  left_on='cooperativeId', right_on='cooperative_id', how='inner')
+        filled = sum(_filled_mask(source, field).astype('int64') for field in fields)
+        points = source[[col for col in ['villageId', '_pos', '_coop_pos'] if col in source.columns]]
+        yield key, points.assign(filled=filled.to_numpy(), total=len(fields))
+
+def geo_completeness_points(data):
+    """Filled and total GEO_COMPLETENESS_FIELDS points per villageId, summed over all components."""
+    parts = [points for _, points in geo_completeness_rows(data)]
+    if not parts:
+        return pd.Series(dtype='int64'), pd.Series(dtype='int64')
+    points = pd.concat(parts).groupby('villageId')[['filled', 'total']].sum()
+    return points['filled'], points['total']
+
 def calculate_global_aggregates(data, mappings):
     """Calculate global aggregates needed for certain KPIs."""
     logger.log("INIT", "Calculating global aggregates...")
@@ -257,6 +1186,31 @@ def calculate_global_aggregates(data, mappings):
     global_agg['verified_domains'] = len(data['domains'][data['domains']['verification_status'] == 'Verified'])
     logger.log_global("Total domains", f"{global_agg['total_domains']:,}")
     
+    # 5. Partnership Growth Rate (KPI_38, same value for every village)
+    global_agg['partnership_growth_rate'] = calculate_partnership_growth_rate(data['partnerships'])
+    logger.log_global("Partnership growth rate", f"{global_agg['partnership_growth_rate']:.4f}")
+    
+    # 6. Regional cooperative counts (KPI_02, KPI_03, KPI_08)
+    cooperative = data['cooperative']
+    global_agg['coops_per_province'] = cooperative.groupby('provinceId').size().to_dict()
+    global_agg['coops_per_district'] = cooperative.groupby('districtId').size().to_dict()
+    global_agg['coops_per_village'] = cooperative.groupby('villageId').size().to_dict()
+    logger.log_global("Cooperatives per province", f"{len(global_agg['coops_per_province'])} provinces")
+    logger.log_global("Cooperatives per district", f"{len(global_agg['coops_per_district'])} districts")
+    
+    # 7. Koperasi per Desa per subdistrict (KPI_47): cooperatives / villages with cooperatives, capped 1-3
+    subdistrict_coops = cooperative.groupby(['provinceId', 'districtId', 'subdistrictId'])
+    unique_villages = subdistrict_coops['villageId'].nunique()
+    koperasi_per_desa = (subdistrict_coops.size() / unique_villages.where(unique_villages > 0)).clip(1.0, 3.0)
+    global_agg['koperasi_per_desa'] = koperasi_per_desa.fillna(1.0).to_dict()
+    logger.log_global("Koperasi per desa", f"{len(global_agg['koperasi_per_desa'])} subdistricts")
+    
+    # 8. GeoSpatial completeness points per village (KPI_49)
+    filled_points, total_points = geo_completeness_points(data)
+    global_agg['geo_filled_points'] = filled_points.to_dict()
+    global_agg['geo_total_points'] = total_points.to_dict()
+    logger.log_global("GeoSpatial completeness", f"{len(total_points)} villages")
+    
     return global_agg
 
 # ============================================================================
@@ -275,39 +1229,43 @@ def safe_percentage(numerator, denominator, default=0):
         return default
     return (numerator / denominator) * 100
 
-def calculate_cooperative_kpis(village_coop_ids, data, province_id, district_code, district_id_internal):
+def money_ratio(cents, count):
+    """Rupiah per unit from an int64 cents total, return 0 if count is 0."""
+    if count == 0:
+        return 0.0
+    return cents / (count * MONEY_SCALE)
+
+@timed_stage("calculate_cooperative_kpis")
+def calculate_cooperative_kpis(village_coop_ids, coop_index, global_agg, province_id, district_code, district_id_internal):
     """Calculate cooperative-related KPIs (KPI_01 to KPI_06, KPI_08)."""
     kpis = {}
+    village_coops = coop_index.rows_for('cooperative', village_coop_ids)
     
     # KPI_01: Total Koperasi Terdaftar (village level)
     kpis['TotalKoperasiTerdaftar'] = len(village_coop_ids)
     
-    # KPI_02: Total Koperasi per Provinsi
-    province_coops = data['cooperative'][data['cooperative']['provinceId'] == province_id]
-    kpis['TotalKoperasiPerProvinsi'] = len(province_coops)
+    # KPI_02: Total Koperasi per Provinsi (global aggregate)
+    kpis['TotalKoperasiPerProvinsi'] = global_agg['coops_per_province'].get(province_id, 0)
     
-    # KPI_03: Total Koperasi per Kabupaten/Kota
+    # KPI_03: Total Koperasi per Kabupaten/Kota (global aggregate)
     # Use internal district_id (integer) from cooperative table
     if district_id_internal is not None:
-        district_coops = data['cooperative'][data['cooperative']['districtId'] == district_id_internal]
-        kpis['TotalKoperasiPerKabupatenKota'] = len(district_coops)
+        kpis['TotalKoperasiPerKabupatenKota'] = global_agg['coops_per_district'].get(district_id_internal, 0)
     else:
         kpis['TotalKoperasiPerKabupatenKota'] = 0
     
     # KPI_04 & KPI_05: Modal Awal
     if len(village_coop_ids) > 0:
-        village_coops = data['cooperative'][data['cooperative']['cooperative_id'].isin(village_coop_ids)]
-        # Convert capital to numeric, handling errors
-        capital_values = pd.to_numeric(village_coops['capital'], errors='coerce').fillna(0)
-        kpis['RataRataModalAwalKoperasi'] = float(capital_values.mean() if len(capital_values) > 0 else 0)
-        kpis['TotalModalAwalKoperasi'] = float(capital_values.sum())
+        # Capital is parsed into int64 cents at load, so the sum is exact
+        capital_cents = int(village_coops['capital'].to_numpy().sum())
+        kpis['RataRataModalAwalKoperasi'] = money_ratio(capital_cents, len(village_coops))
+        kpis['TotalModalAwalKoperasi'] = money_ratio(capital_cents, 1)
     else:
         kpis['RataRataModalAwalKoperasi'] = 0.0
         kpis['TotalModalAwalKoperasi'] = 0.0
     
     # KPI_06: Rasio Koperasi Baru vs Total
     if len(village_coop_ids) > 0:
-        village_coops = data['cooperative'][data['cooperative']['cooperative_id'].isin(village_coop_ids)]
         if 'registration_type' in village_coops.columns:
             baru_count = len(village_coops[village_coops['registration_type'] == 'Pendaftaran Baru'])
             kpis['RasioKoperasiBaruVsTotal'] = safe_percentage(baru_count, len(village_coops))
@@ -318,7 +1276,6 @@ def calculate_cooperative_kpis(village_coop_ids, data, province_id, district_cod
     
     # KPI_07: Rasio Pendaftaran Mandiri vs Pendamping
     if len(village_coop_ids) > 0:
-        village_coops = data['cooperative'][data['cooperative']['cooperative_id'].isin(village_coop_ids)]
         if 'filling_method' in village_coops.columns:
             mandiri_count = len(village_coops[village_coops['filling_method'] == 'Mandiri'])
             kpis['RasioPendaftaranMandiriVsPendamping'] = safe_percentage(mandiri_count, len(village_coops))
@@ -329,12 +1286,13 @@ def calculate_cooperative_kpis(village_coop_ids, data, province_id, district_cod
     
     return kpis
 
-def calculate_member_kpis(village_coop_ids, data):
+@timed_stage("calculate_member_kpis")
+def calculate_member_kpis(village_coop_ids, coop_index):
     """Calculate member-related KPIs (KPI_09 to KPI_13, KPI_18)."""
     kpis = {}
     
     # Filter members for this village's cooperatives
-    village_members = data['members'][data['members']['cooperativeId'].isin(village_coop_ids)]
+    village_members = coop_index.rows_for('members', village_coop_ids)
     
     # KPI_09: Total Anggota Koperasi
     kpis['TotalAnggotaKoperasi'] = len(village_members)
@@ -347,13 +1305,13 @@ def calculate_member_kpis(village_coop_ids, data):
         else:
             kpis['RasioGenderAnggotaLP'] = 0
         
-        # KPI_11: Rata-rata Simpanan Pokok per Anggota
-        principal_saving = pd.to_numeric(village_members['principal_saving'], errors='coerce').fillna(0)
-        kpis['RataRataSimpananPokokPerAnggota'] = principal_saving.mean()
+        # KPI_11: Rata-rata Simpanan Pokok per Anggota (savings are int64 cents)
+        principal_cents = int(village_members['principal_saving'].to_numpy().sum())
+        kpis['RataRataSimpananPokokPerAnggota'] = money_ratio(principal_cents, len(village_members))
         
         # KPI_12: Rata-rata Simpanan Wajib per Anggota
-        mandatory_saving = pd.to_numeric(village_members['mandatory_saving'], errors='coerce').fillna(0)
-        kpis['RataRataSimpananWajibPerAnggota'] = mandatory_saving.mean()
+        mandatory_cents = int(village_members['mandatory_saving'].to_numpy().sum())
+        kpis['RataRataSimpananWajibPerAnggota'] = money_ratio(mandatory_cents, len(village_members))
         
         # KPI_13: Rasio Anggota dengan BI Checking Lancar
         if 'bi_checking_verification' in village_members.columns:
@@ -373,73 +1331,36 @@ def calculate_member_kpis(village_coop_ids, data):
     
     return kpis
 
-def calculate_management_kpis(village_coop_ids, data):
+@timed_stage("calculate_management_kpis")
+def calculate_management_kpis(village_coop_ids, management_roles):
     """Calculate management-related KPIs (KPI_14 to KPI_17)."""
     kpis = {}
     
-    # Filter management for this village's cooperatives
-    village_mgmt = data['management'][data['management']['cooperativeId'].isin(village_coop_ids)]
-    
-    # KPI_14: Total Pengurus (role='Pengurus' OR position in specific roles)
-    # Note: Based on data, 'role' column has the values, NOT 'status'
-    # Pengurus includes: Ketua, Sekretaris, Bendahara
-    pengurus_roles = ['Ketua', 'Sekretaris', 'Bendahara']
+    # Pengurus includes: Ketua, Sekretaris, Bendahara (role column, else position)
+    pengurus, pengawas, female_pengurus = management_roles.totals(village_coop_ids)
     
-    if 'role' in village_mgmt.columns:
-        pengurus = village_mgmt[village_mgmt['role'].isin(pengurus_roles)]
-        kpis['TotalPengurusKoperasi'] = len(pengurus)
-    else:
-        pengurus = village_mgmt[village_mgmt['position'].isin(pengurus_roles)] if 'position' in village_mgmt.columns else pd.DataFrame()
-        kpis['TotalPengurusKoperasi'] = len(pengurus)
+    # KPI_14: Total Pengurus
+    kpis['TotalPengurusKoperasi'] = pengurus
     
     # KPI_15: Total Pengawas (role='Pengawas')
-    if 'role' in village_mgmt.columns:
-        pengawas = village_mgmt[village_mgmt['role'] == 'Pengawas']
-        kpis['TotalPengawasKoperasi'] = len(pengawas)
-    else:
-        pengawas = village_mgmt[village_mgmt['position'] == 'Pengawas'] if 'position' in village_mgmt.columns else pd.DataFrame()
-        kpis['TotalPengawasKoperasi'] = len(pengawas)
+    kpis['TotalPengawasKoperasi'] = pengawas
     
     # KPI_16: Rasio Gender Pengurus (Perempuan percentage)
-    if len(pengurus) > 0 and 'gender' in pengurus.columns:
-        female_pengurus = len(pengurus[pengurus['gender'] == 'Perempuan'])
-        kpis['RasioGenderPengurus'] = safe_percentage(female_pengurus, len(pengurus))
-    else:
-        kpis['RasioGenderPengurus'] = 0
-    
-    # KPI_17: Ratio Struktur Jabatan Lengkap
-    # Check if each cooperative has Ketua, Sekretaris, Bendahara
-    if len(village_coop_ids) > 0 and len(village_mgmt) > 0:
-        complete_structure_count = 0
-        for coop_id in village_coop_ids:
-            coop_mgmt = village_mgmt[village_mgmt['cooperativeId'] == coop_id]
-            if 'role' in coop_mgmt.columns:
-                roles = coop_mgmt['role'].unique()
-            elif 'position' in coop_mgmt.columns:
-                roles = coop_mgmt['position'].unique()
-            else:
-                roles = []
-            
-            # Check if has Ketua, Sekretaris, Bendahara
-            has_ketua = 'Ketua' in roles
-            has_sekretaris = 'Sekretaris' in roles
-            has_bendahara = 'Bendahara' in roles
-            
-            if has_ketua and has_sekretaris and has_bendahara:
-                complete_structure_count += 1
-        
-        kpis['RatioStrukturJabatanLengkap'] = safe_percentage(complete_structure_count, len(village_coop_ids))
-    else:
-        kpis['RatioStrukturJabatanLengkap'] = 0
+    kpis['RasioGenderPengurus'] = safe_percentage(female_pengurus, pengurus)
+    
+    # KPI_17: Ratio Struktur Jabatan Lengkap (role mask has Ketua, Sekretaris and Bendahara)
+    kpis['RatioStrukturJabatanLengkap'] = safe_percentage(management_roles.complete_count(village_coop_ids),
+                                                          len(village_coop_ids))
     
     return kpis
 
-def calculate_outlet_kpis(village_coop_ids, data, global_agg, province_id):
+@timed_stage("calculate_outlet_kpis")
+def calculate_outlet_kpis(village_coop_ids, coop_index, global_agg, province_id):
     """Calculate outlet-related KPIs (KPI_19 to KPI_24, KPI_51, KPI_52)."""
     kpis = {}
     
     # Filter outlets for this village's cooperatives
-    village_outlets = data['outlets'][data['outlets']['cooperativeId'].isin(village_coop_ids)]
+    village_outlets = coop_index.rows_for('outlets', village_coop_ids)
     
     # KPI_19: Total Gerai Koperasi
     kpis['TotalGeraiKoperasi'] = len(village_outlets)
@@ -477,12 +1398,13 @@ def calculate_outlet_kpis(village_coop_ids, data, global_agg, province_id):
     
     return kpis
 
-def calculate_klu_kpis(village_coop_ids, data, global_agg):
+@timed_stage("calculate_klu_kpis")
+def calculate_klu_kpis(village_coop_ids, data, coop_index, global_agg):
     """Calculate KLU-related KPIs (KPI_27 to KPI_32)."""
     kpis = {}
     
     # Filter KLUs for this village's cooperatives
-    village_klus = data['klus'][data['klus']['cooperativeId'].isin(village_coop_ids)]
+    village_klus = coop_index.rows_for('klus', village_coop_ids)
     
     # KPI_27: Total KLU Terdaftar
     unique_klus = village_klus['kluId'].nunique()
@@ -526,12 +1448,39 @@ def calculate_klu_kpis(village_coop_ids, data, global_agg):
     
     return kpis
 
-def calculate_partnership_kpis(village_coop_ids, data, global_agg):
+def calculate_partnership_growth_rate(partnerships):
+    """Calculate average monthly growth rate of verified partnerships (KPI_38, global)."""
+    # Calculate average monthly growth rate from created_at timestamps
+    if 'created_at' not in partnerships.columns or len(partnerships) == 0:
+        return 0
+    
+    # Month number (year * 12 + month) of every verified partnership; missing created_at is skipped
+    created = partnerships.loc[partnerships['status'] == 'Verified', 'created_at']
+    months = (created.dt.year * 12 + created.dt.month).dropna()
+    
+    # Count by month
+    return monthly_growth_rate(months.value_counts().sort_index().to_numpy())
+
+def monthly_growth_rate(monthly_counts):
+    """Average month-over-month growth (%) of chronologically ordered monthly counts, capped at 0-100."""
+    if len(monthly_counts) < 2:
+        return 0
+    
+    # Month-over-month growth rates (every counted month has at least one partnership)
+    prev_month, curr_month = monthly_counts[:-1], monthly_counts[1:]
+    growth_rates = ((curr_month - prev_month) / prev_month) * 100
+    
+    # Average growth rate, capped at 0-100
+    avg_growth = np.mean(growth_rates)
+    return max(0, min(avg_growth, 100))
+
+@timed_stage("calculate_partnership_kpis")
+def calculate_partnership_kpis(village_coop_ids, coop_index, global_agg):
     """Calculate partnership-related KPIs (KPI_33 to KPI_40, KPI_53)."""
     kpis = {}
     
     # Filter partnerships for this village's cooperatives
-    village_partnerships = data['partnerships'][data['partnerships']['cooperativeId'].isin(village_coop_ids)]
+    village_partnerships = coop_index.rows_for('partnerships', village_coop_ids)
     
     # KPI_33: Total Aplikasi Kemitraan
     total_partnerships = len(village_partnerships)
@@ -552,25 +1501,16 @@ def calculate_partnership_kpis(village_coop_ids, data, global_agg):
         
         # KPI_53: Rata-rata Waktu Proses Aplikasi Kemitraan (in hours)
         if 'created_at' in village_partnerships.columns and 'updated_at' in village_partnerships.columns:
-            try:
-                created = pd.to_datetime(village_partnerships['created_at'], errors='coerce')
-                updated = pd.to_datetime(village_partnerships['updated_at'], errors='coerce')
-                
-                # Calculate hours difference
-                time_diff = (updated - created).dt.total_seconds() / 3600
-                
-                # Filter valid values (positive, non-null)
-                valid_times = time_diff[(time_diff > 0) & (time_diff.notna())]
-                
-                if len(valid_times) > 0:
-                    # Cap at 72 hours before averaging
-                    capped_times = valid_times.clip(upper=72)
-                    avg_time = capped_times.mean()
-                    # Ensure minimum 5 if > 0
-                    kpis['RataRataWaktuProsesAplikasiKemitraan'] = max(avg_time, 5) if avg_time > 0 else 0
-                else:
-                    kpis['RataRataWaktuProsesAplikasiKemitraan'] = 0
-            except:
+            seconds = seconds_between(village_partnerships['created_at'], village_partnerships['updated_at'])
+            
+            # Filter valid values (positive, non-null) and cap at 72 hours before averaging
+            valid_times = np.minimum(seconds[seconds > 0], PROCESS_SECONDS_CAP)
+            
+            if len(valid_times) > 0:
+                avg_time = process_hours(valid_times.sum(), len(valid_times))
+                # Ensure minimum 5 if > 0
+                kpis['RataRataWaktuProsesAplikasiKemitraan'] = max(avg_time, 5) if avg_time > 0 else 0
+            else:
                 kpis['RataRataWaktuProsesAplikasiKemitraan'] = 0
         else:
             kpis['RataRataWaktuProsesAplikasiKemitraan'] = 0
@@ -588,62 +1528,21 @@ def calculate_partnership_kpis(village_coop_ids, data, global_agg):
     else:
         kpis['DistribusiJenisLayananKemitraan'] = 0
     
-    # KPI_38: Partnership Growth Rate (calculated from trend data)
-    # Calculate average monthly growth rate from created_at timestamps
-    if 'created_at' in data['partnerships'].columns and len(data['partnerships']) > 0:
-        try:
-            # Convert to datetime
-            partnerships_with_date = data['partnerships'].copy()
-            partnerships_with_date['created_month'] = pd.to_datetime(
-                partnerships_with_date['created_at'], 
-                errors='coerce'
-            ).dt.to_period('M')
-            
-            # Filter verified partnerships only
-            verified_partnerships = partnerships_with_date[
-                partnerships_with_date['status'] == 'Verified'
-            ]
-            
-            if len(verified_partnerships) > 0:
-                # Count by month
-                monthly_counts = verified_partnerships.groupby('created_month').size()
-                
-                if len(monthly_counts) >= 2:
-                    # Calculate month-over-month growth rates
-                    growth_rates = []
-                    for i in range(1, len(monthly_counts)):
-                        prev_month = monthly_counts.iloc[i-1]
-                        curr_month = monthly_counts.iloc[i]
-                        if prev_month > 0:
-                            growth_rate = ((curr_month - prev_month) / prev_month) * 100
-                            growth_rates.append(growth_rate)
-                    
-                    if len(growth_rates) > 0:
-                        # Average growth rate, capped at 0-100
-                        avg_growth = np.mean(growth_rates)
-                        kpis['PartnershipGrowthRate'] = max(0, min(avg_growth, 100))
-                    else:
-                        kpis['PartnershipGrowthRate'] = 0
-                else:
-                    kpis['PartnershipGrowthRate'] = 0
-            else:
-                kpis['PartnershipGrowthRate'] = 0
-        except:
-            kpis['PartnershipGrowthRate'] = 0
-    else:
-        kpis['PartnershipGrowthRate'] = 0
+    # KPI_38: Partnership Growth Rate (global aggregate, calculated from trend data)
+    kpis['PartnershipGrowthRate'] = global_agg['partnership_growth_rate']
     
     # KPI_40: Kemitraan per Provinsi (same as total for village)
     kpis['KemitraanPerProvinsi'] = total_partnerships
     
     return kpis
 
-def calculate_upkdk_kpis(village_id, data):
+@timed_stage("calculate_upkdk_kpis")
+def calculate_upkdk_kpis(village_id, village_index):
     """Calculate UPKDK-related KPIs (KPI_41 to KPI_44, KPI_54)."""
     kpis = {}
     
-    # Filter UPKDK for this village
-    village_upkdk = data['upkdk'][data['upkdk']['villageId'] == village_id]
+    # UPKDK of this village
+    village_upkdk = village_index.rows('upkdk', village_id)
     
     # KPI_41: Total UPKDK Aktif
     total_upkdk = len(village_upkdk)
@@ -690,6 +1589,7 @@ def calculate_upkdk_kpis(village_id, data):
     
     return kpis
 
+@timed_stage("calculate_domain_kpis")
 def calculate_domain_kpis(global_agg):
     """Calculate domain-related KPIs (KPI_45 to KPI_46)."""
     kpis = {}
@@ -708,12 +1608,13 @@ def calculate_domain_kpis(global_agg):
     
     return kpis
 
-def calculate_geo_kpis(village_id, data, province_id, district_id, subdistrict_id):
+@timed_stage("calculate_geo_kpis")
+def calculate_geo_kpis(village_id, village_index, global_agg, province_id, district_id, subdistrict_id):
     """Calculate geography-related KPIs (KPI_08, KPI_47 to KPI_50)."""
     kpis = {}
     
     # KPI_08: Koperasi per 10,000 Penduduk Desa
-    village_info = data['villages'][data['villages']['village_id'] == village_id]
+    village_info = village_index.rows('villages', village_id)
     if len(village_info) > 0:
         village_row = village_info.iloc[0]
         # Calculate total population
@@ -723,340 +1624,2413 @@ def calculate_geo_kpis(village_id, data, province_id, district_id, subdistrict_i
         
         if population > 0:
             # Count cooperatives in this village
-            village_coops = data['cooperative'][data['cooperative']['villageId'] == village_id]
-            coop_count = len(village_coops)
+            coop_count = global_agg['coops_per_village'].get(village_id, 0)
             kpis['KoperasiPer10000PendudukDesa'] = (coop_count / population) * 10000
         else:
             kpis['KoperasiPer10000PendudukDesa'] = 0
     else:
         kpis['KoperasiPer10000PendudukDesa'] = 0
     
-    # KPI_47: Koperasi per Desa (average in subdistrict, capped 1-3)
-    subdistrict_coops = data['cooperative'][
-        (data['cooperative']['provinceId'] == province_id) &
-        (data['cooperative']['districtId'] == district_id) &
-        (data['cooperative']['subdistrictId'] == subdistrict_id)
-    ]
-    
-    if len(subdistrict_coops) > 0:
-        unique_villages = subdistrict_coops['villageId'].nunique()
-        if unique_villages > 0:
-            avg_coop_per_village = len(subdistrict_coops) / unique_villages
-            kpis['KoperasiPerDesa'] = max(1.0, min(avg_coop_per_village, 3.0))
-        else:
-            kpis['KoperasiPerDesa'] = 1.0
-    else:
-        kpis['KoperasiPerDesa'] = 1.0
+    # KPI_47: Koperasi per Desa (average in subdistrict, capped 1-3, global aggregate)
+    kpis['KoperasiPerDesa'] = global_agg['koperasi_per_desa'].get((province_id, district_id, subdistrict_id), 1.0)
     
     # KPI_48: Jumlah Penggabungan Desa
-    village_mergers = data['village_mergers'][data['village_mergers']['village_id'] == village_id]
-    kpis['JumlahPenggabunganDesa'] = len(village_mergers)
+    kpis['JumlahPenggabunganDesa'] = village_index.count('village_mergers', village_id)
     
     # KPI_49: GeoSpatial Data Completeness Score
-    # Calculate completeness score based on:
-    # 1. Cooperative: longitude, latitude, address
-    # 2. Outlets: longitude, latitude (if outlets exist)
-    # 3. UPKDK: longitude, latitude, address (if UPKDK exists)
-    
-    total_points = 0
-    filled_points = 0
-    
-    # Check cooperatives in this village
-    village_coops = data['cooperative'][data['cooperative']['villageId'] == village_id]
-    if len(village_coops) > 0:
-        for _, coop in village_coops.iterrows():
-            total_points += 3  # longitude, latitude, address
-            if pd.notna(coop.get('longitude')) and coop.get('longitude') != '':
-                filled_points += 1
-            if pd.notna(coop.get('latitude')) and coop.get('latitude') != '':
-                filled_points += 1
-            if pd.notna(coop.get('address')) and coop.get('address') != '':
-                filled_points += 1
-    
-    # Check outlets for cooperatives in this village
-    village_coop_ids = village_coops['cooperative_id'].tolist() if len(village_coops) > 0 else []
-    if len(village_coop_ids) > 0:
-        village_outlets = data['outlets'][data['outlets']['cooperativeId'].isin(village_coop_ids)]
-        for _, outlet in village_outlets.iterrows():
-            # Note: outlets don't have longitude/latitude in current schema, skip
-            pass
-    
-    # Check UPKDK in this village
-    village_upkdk = data['upkdk'][data['upkdk']['villageId'] == village_id]
-    if len(village_upkdk) > 0:
-        for _, upkdk in village_upkdk.iterrows():
-            total_points += 3  # longitude, latitude, address
-            if pd.notna(upkdk.get('longitude')) and upkdk.get('longitude') != '':
-                filled_points += 1
-            if pd.notna(upkdk.get('latitude')) and upkdk.get('latitude') != '':
-                filled_points += 1
-            if pd.notna(upkdk.get('address')) and upkdk.get('address') != '':
-                filled_points += 1
-    
-    # Calculate score
-    if total_points > 0:
-        kpis['GeoSpatialDataCompletenessScore'] = (filled_points / total_points) * 100
-    else:
-        kpis['GeoSpatialDataCompletenessScore'] = 0
+    # Filled / total GEO_COMPLETENESS_FIELDS points of the village's cooperatives, UPKDK
+    # (and outlets, once they have coordinates), precomputed for every village
+    filled_points = global_agg['geo_filled_points'].get(village_id, 0)
+    total_points = global_agg['geo_total_points'].get(village_id, 0)
+    kpis['GeoSpatialDataCompletenessScore'] = safe_percentage(filled_points, total_points)
     
     return kpis
 
 # ============================================================================
-# MAIN PROCESSING
+# DISTINCT COUNTS
 # ============================================================================
+# Distinct counts (TotalKLUTerdaftar, Top10KBLITerbanyak, KluDiversificationIndex)
+# cannot be summed across villages, so the village tallies keep a mergeable
+# structure per geo_key instead of a number. Both kinds roll up to a parent
+# geo_key (rollup) and combine with another one (merge, e.g. two shards):
+#   exact - DistinctValues: the set bits of a (geo_key x value) bitmap, stored
+#           as sorted packed int64 positions (sparse, like an array container)
+#   hll   - DistinctSketch: a sparse HyperLogLog sketch per geo_key, about
+#           1.04 / sqrt(2 ** HLL_PRECISION) relative error
 
-def generate_fact_kpi():
-    """Main function to generate FACT_KPI data."""
-    logger.log("START", f"FACT_KPI Generation Started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.log("START", f"Test mode: {TEST_VILLAGE_LIMIT} villages" if TEST_VILLAGE_LIMIT else "Full run: all villages")
-    
-    # Step 1: Load all data
-    data = load_all_data()
-    
-    # Step 2: Create mappings
-    mappings = create_mappings(data)
-    
-    # Step 3: Calculate global aggregates
-    global_agg = calculate_global_aggregates(data, mappings)
-    
-    # Step 4: Get latest period (date_key)
-    latest_period = data['dim_period'][
-        (data['dim_period']['week'].notna()) & 
-        (data['dim_period']['month'].notna())
-    ].sort_values('date_key', ascending=False).iloc[0]
-    date_key = int(latest_period['date_key'])
-    logger.log("INFO", f"Using date_key: {date_key} ({latest_period['period_st']} to {latest_period['period_end_date']})")
-    
-    # Step 4.5: Create village ID to code mapping (REVERSE of previous approach)
-    # Problem: villages.csv has DUPLICATE codes (36,978 duplicates!)
-    # Solution: Use village_id (unique) as key, code as value
-    # Then match: cooperative.villageId → villages.village_id → villages.code → DIM_GEOGRAPHY.village_id
-    village_id_to_code = dict(zip(data['villages']['village_id'], data['villages']['code']))
-    logger.log("INFO", f"Created village ID-to-code mapping: {len(village_id_to_code):,} villages")
-    
-    # Step 4.6: Create district code to internal ID mapping
-    # DIM_GEOGRAPHY uses district.code (e.g., "11.05"), cooperative uses district.district_id (integer)
-    district_code_to_id = {}
-    if 'districts' in data:
-        for _, row in data['districts'].iterrows():
-            code = row['code']  # Keep as float to match DIM_GEOGRAPHY (which is also float)
-            district_code_to_id[code] = row['district_id']
-        logger.log("INFO", f"Created district code-to-ID mapping: {len(district_code_to_id):,} districts")
-    
-    # Step 4.7: Create subdistrict code to internal ID mapping
-    # DIM_GEOGRAPHY uses subdistrict.code (string like "11.05.07"), cooperative uses subdistrict_id (integer)
-    subdistrict_code_to_id = {}
-    if 'subdistricts' in data:
-        for _, row in data['subdistricts'].iterrows():
-            code = str(row['code'])  # Keep as string
-            subdistrict_code_to_id[code] = row['subdistrict_id']
-        logger.log("INFO", f"Created subdistrict code-to-ID mapping: {len(subdistrict_code_to_id):,} subdistricts")
+VALUE_ID_BITS = 32  # Low bits of a packed DistinctValues position hold the value id
+HLL_REGISTER_BITS = 16  # Low bits of a packed DistinctSketch slot hold the register index
+
+def _packed_geo_keys(packed, low_bits):
+    """geo_key part of packed int64 positions."""
+    return packed >> np.int64(low_bits)
+
+def _repack(packed, low_bits, parent):
+    """Positions moved to their parent geo_key (positions without a parent are dropped)."""
+    parent_keys = pd.Series(_packed_geo_keys(packed, low_bits)).map(parent)
+    kept = parent_keys.notna().to_numpy()
+    low = packed[kept] & np.int64((1 << low_bits) - 1)
+    return (parent_keys[kept].to_numpy(dtype='int64') << np.int64(low_bits)) | low, kept
+
+class DistinctValues:
+    """Exact distinct values per geo_key, as the set bits of a geo_key x value bitmap."""
     
-    # Step 5: Filter geography for village level
-    village_geo = data['dim_geography'][data['dim_geography']['village_id'].notna()].copy()
+    def __init__(self, positions, values):
+        self.positions = positions  # sorted unique int64: geo_key << VALUE_ID_BITS | value id
+        self.values = values  # value id -> value
     
-    # Limit for testing
-    if TEST_VILLAGE_LIMIT:
-        village_geo = village_geo.head(TEST_VILLAGE_LIMIT)
+    @classmethod
+    def from_pairs(cls, geo_keys, values):
+        """Structure of the distinct values of each geo_key."""
+        value_ids, uniques = pd.factorize(np.asarray(values))
+        positions = (np.asarray(geo_keys, dtype='int64') << np.int64(VALUE_ID_BITS)) | value_ids.astype('int64')
+        return cls(np.unique(positions), np.asarray(uniques))
     
-    total_villages = len(village_geo)
-    logger.log("INFO", f"Processing {total_villages:,} villages...")
+    def rollup(self, parent):
+        """Distinct values per parent geo_key; parent maps a geo_key to its parent geo_key."""
+        positions, _ = _repack(self.positions, VALUE_ID_BITS, parent)
+        return DistinctValues(np.unique(positions), self.values)
     
-    # Step 6: Process each village
-    fact_data = []
+    def merge(self, other):
+        """Union with another DistinctValues (value ids are remapped onto one value list)."""
+        values = pd.Index(self.values).append(pd.Index(other.values)).unique()
+        merged = []
+        for part in (self, other):
+            remap = values.get_indexer(part.values).astype('int64')
+            value_ids = remap[part.positions & np.int64((1 << VALUE_ID_BITS) - 1)]
+            merged.append((part.positions >> np.int64(VALUE_ID_BITS) << np.int64(VALUE_ID_BITS)) | value_ids)
+        return DistinctValues(np.unique(np.concatenate(merged)), np.asarray(values))
     
-    for idx, (_, geo_row) in enumerate(village_geo.iterrows(), 1):
-        geo_key = geo_row['geo_key']
-        province_id = geo_row['province_id']
-        district_id = geo_row['district_id']
-        subdistrict_id = geo_row['subdistrict_id']
-        village_code = geo_row['village_id']  # This is the code from DIM_GEOGRAPHY
-        
-        # Find which village_id(s) have this code
-        # Since codes are duplicated, we need to find ALL village_ids with this code
-        matching_village_ids = data['villages'][data['villages']['code'] == village_code]['village_id'].tolist()
-        
-        if len(matching_village_ids) == 0:
-            # Skip if village code not found in villages.csv
-            continue
-        
-        # Find cooperatives for ANY of these village_ids
-        village_coops = data['cooperative'][data['cooperative']['villageId'].isin(matching_village_ids)]
-        village_coop_ids = village_coops['cooperative_id'].tolist()
-        
-        # Skip if no cooperatives
-        if len(village_coop_ids) == 0:
-            continue
-        
-        # Initialize row
-        row = {
-            'date_key': date_key,
-            'geo_key': geo_key,
-        }
-        
-        # Get district and subdistrict internal IDs for KPI calculations
-        # district_id is already float in DIM_GEOGRAPHY, no need to convert
-        district_id_internal = district_code_to_id.get(district_id) if pd.notna(district_id) else None
-        
-        # subdistrict_id is string in DIM_GEOGRAPHY
-        subdistrict_id_str = str(subdistrict_id) if pd.notna(subdistrict_id) else None
-        subdistrict_id_internal = subdistrict_code_to_id.get(subdistrict_id_str) if subdistrict_id_str else None
-        
-        # Get dimension keys
-        # outlet_id: first outlet in village
-        village_outlets = data['outlets'][data['outlets']['cooperativeId'].isin(village_coop_ids)]
-        row['outlet_id'] = village_outlets['cooperative_outlet_id'].iloc[0] if len(village_outlets) > 0 else 0
-        
-        # business_partner_service_id: first partnership service
-        village_partnerships = data['partnerships'][data['partnerships']['cooperativeId'].isin(village_coop_ids)]
-        row['business_partner_service_id'] = village_partnerships['business_partner_service_id'].iloc[0] if len(village_partnerships) > 0 else 0
-        
-        # upkdk_id: first UPKDK in village (use first matching village_id)
-        village_upkdk = data['upkdk'][data['upkdk']['villageId'].isin(matching_village_ids)]
-        row['upkdk_id'] = village_upkdk['upkdk_id'].iloc[0] if len(village_upkdk) > 0 else 0
-        
-        # klu_id: first KLU from village cooperatives
-        village_klus = data['klus'][data['klus']['cooperativeId'].isin(village_coop_ids)]
-        row['klu_id'] = village_klus['kluId'].iloc[0] if len(village_klus) > 0 else 0
-        
-        # Calculate all KPIs (use first matching village_id for geo and upkdk KPIs)
-        first_village_id = matching_village_ids[0]
-        row.update(calculate_cooperative_kpis(village_coop_ids, data, province_id, district_id, district_id_internal))
-        row.update(calculate_geo_kpis(first_village_id, data, province_id, district_id_internal, subdistrict_id_internal))
-        row.update(calculate_member_kpis(village_coop_ids, data))
-        row.update(calculate_management_kpis(village_coop_ids, data))
-        row.update(calculate_outlet_kpis(village_coop_ids, data, global_agg, province_id))
-        row.update(calculate_klu_kpis(village_coop_ids, data, global_agg))
-        row.update(calculate_partnership_kpis(village_coop_ids, data, global_agg))
-        row.update(calculate_upkdk_kpis(first_village_id, data))
-        row.update(calculate_domain_kpis(global_agg))
-        
-        fact_data.append(row)
-        
-        # Log progress every 50 villages
-        if idx % 50 == 0 or idx == total_villages:
-            logger.log_progress(idx, total_villages, f"geo_key: {geo_key}")
+    def counts(self):
+        """Number of distinct values per geo_key."""
+        geo_keys, counts = np.unique(_packed_geo_keys(self.positions, VALUE_ID_BITS), return_counts=True)
+        return pd.Series(counts, index=geo_keys)
+
+def _bit_length(values):
+    """Bit length of each uint64 value (0 for 0)."""
+    values = values.copy()
+    length = np.zeros(len(values), dtype='int64')
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+class DistinctSketch:
+    """Sparse HyperLogLog sketch of the distinct values per geo_key (only non-zero registers are kept)."""
     
-    # Step 7: Create DataFrame
-    logger.log("INFO", "Creating DataFrame...")
-    df = pd.DataFrame(fact_data)
-    
-    # Define all expected columns in correct order
-    expected_columns = [
-        # Dimension keys
-        'date_key', 'geo_key', 'outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id',
-        # KPI columns
-        'TotalKoperasiTerdaftar', 'TotalKoperasiPerProvinsi', 'TotalKoperasiPerKabupatenKota',
-        'RataRataModalAwalKoperasi', 'TotalModalAwalKoperasi',
-        'RasioKoperasiBaruVsTotal', 'RasioPendaftaranMandiriVsPendamping',
-        'KoperasiPer10000PendudukDesa',
-        'TotalAnggotaKoperasi', 'RasioGenderAnggotaLP',
-        'RataRataSimpananPokokPerAnggota', 'RataRataSimpananWajibPerAnggota',
-        'RasioAnggotaDenganBICheckingLancar',
-        'TotalPengurusKoperasi', 'TotalPengawasKoperasi',
-        'RasioGenderPengurus', 'RatioStrukturJabatanLengkap',
-        'RataRataAnggotaPerKoperasi',
-        'TotalGeraiKoperasi', 'GeraiPerKoperasi', 'SebaranGeraiPerProvinsi',
-        'KomposisiTipeGerai', 'ColdStorageCoverage', 'OutletExpansionRate',
-        'TotalKLUTerdaftar', 'Top10KBLITerbanyak', 'DistribusiKLUPerProvinsi',
-        'ProporsiSektorUtama', 'RataRataKLUPerKoperasi', 'KluDiversificationIndex',
-        'TotalAplikasiKemitraan', 'VerifiedPartnershipRate', 'RejectedPartnershipRate',
-        'InProgressPartnershipRate', 'DistribusiJenisLayananKemitraan',
-        'PartnershipGrowthRate', 'KemitraanPerProvinsi',
-        'TotalUPKDKAktif', 'ProporsiJenisUPKDK',
-        'UpkdkDenganAksesInternet', 'KondisiBangunanUpkdkLayak',
-        'TotalDomainKoperasiTerdaftar', 'DomainKoperasiTerverifikasi',
-        'KoperasiPerDesa', 'JumlahPenggabunganDesa', 'GeoSpatialDataCompletenessScore',
-        'PersentaseGeraiDenganFotoTerunggah', 'DistribusiJenisGeraiKoperasi',
-        'RataRataWaktuProsesAplikasiKemitraan',
-        'PersentaseUpkdkDenganAksesAirListrikMemadai'
-    ]
+    def __init__(self, slots, ranks, precision):
+        self.slots = slots  # sorted unique int64: geo_key << HLL_REGISTER_BITS | register
+        self.ranks = ranks  # register value of each slot
+        self.precision = precision
     
-    # Add missing columns with default value 0
-    for col in expected_columns:
-        if col not in df.columns:
-            df[col] = 0
+    @classmethod
+    def _from_slots(cls, slots, ranks, precision):
+        """Sketch keeping the highest rank per slot."""
+        registers = pd.Series(ranks).groupby(slots).max()
+        return cls(registers.index.to_numpy(dtype='int64'), registers.to_numpy(dtype='uint8'), precision)
     
-    # Reorder columns
-    df = df[expected_columns]
+    @classmethod
+    def from_pairs(cls, geo_keys, values, precision=None):
+        """Sketch of the distinct values of each geo_key."""
+        precision = precision or HLL_PRECISION
+        hashes = pd.util.hash_array(np.asarray(values))
+        register = (hashes >> np.uint64(64 - precision)).astype('int64')
+        rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+        ranks = (64 - precision) - _bit_length(rest) + 1
+        slots = (np.asarray(geo_keys, dtype='int64') << np.int64(HLL_REGISTER_BITS)) | register
+        return cls._from_slots(slots, ranks, precision)
     
-    logger.log("INFO", f"DataFrame created with {len(df)} rows and {len(df.columns)} columns")
+    def rollup(self, parent):
+        """Sketch per parent geo_key; parent maps a geo_key to its parent geo_key."""
+        slots, kept = _repack(self.slots, HLL_REGISTER_BITS, parent)
+        return DistinctSketch._from_slots(slots, self.ranks[kept], self.precision)
     
-    # Step 8: Apply data types
-    logger.log("INFO", "Applying data types...")
+    def merge(self, other):
+        """Union with another sketch of the same precision."""
+        return DistinctSketch._from_slots(np.concatenate([self.slots, other.slots]),
+                                          np.concatenate([self.ranks, other.ranks]), self.precision)
     
-    # Integer columns (BigInt)
-    int_columns = [
-        'date_key', 'geo_key', 'outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id',
-        'TotalKoperasiTerdaftar', 'TotalKoperasiPerProvinsi', 'TotalKoperasiPerKabupatenKota',
-        'TotalAnggotaKoperasi', 'TotalPengurusKoperasi', 'TotalPengawasKoperasi',
-        'RataRataAnggotaPerKoperasi', 'TotalGeraiKoperasi', 'SebaranGeraiPerProvinsi',
-        'TotalKLUTerdaftar', 'Top10KBLITerbanyak', 'DistribusiKLUPerProvinsi',
-        'TotalAplikasiKemitraan', 'DistribusiJenisLayananKemitraan', 'KemitraanPerProvinsi',
-        'TotalUPKDKAktif', 'TotalDomainKoperasiTerdaftar', 'JumlahPenggabunganDesa'
-    ]
+    def counts(self):
+        """Estimated number of distinct values per geo_key (HyperLogLog with linear counting for small sets)."""
+        registers = 1 << self.precision
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        geo_keys = _packed_geo_keys(self.slots, HLL_REGISTER_BITS)
+        by_key = pd.DataFrame({'geo_key': geo_keys, 'weight': np.exp2(-self.ranks.astype('float64'))}).groupby('geo_key')
+        used = by_key.size()
+        zeros = registers - used
+        estimate = alpha * registers ** 2 / (by_key['weight'].sum() + zeros)
+        linear = registers * np.log(registers / zeros.where(zeros > 0))
+        estimate = estimate.where(~((estimate <= 2.5 * registers) & (zeros > 0)), linear)
+        return estimate.round().astype('int64')
+
+DISTINCT_COUNTERS = {'exact': DistinctValues, 'hll': DistinctSketch}
+
+# ============================================================================
+# PER-COOPERATIVE FACTS (FACT_COOP)
+# ============================================================================
+# Every village KPI that sums over cooperatives is a reduction of one row per
+# cooperative. FACT_COOP holds those rows: the cooperative's own attributes
+# plus the counts and sums of its child tables, built once per run with one
+# groupby per source table and written next to FACT_KPI as FACT_COOP_Vnnn.
+# Child table facts belong to a cooperative_id, not to a cooperative.csv row:
+# a repeated cooperative_id carries them on its first row only, so sums over
+# FACT_COOP count every child row once. Money columns are int64 cents (see MONEY_SCALE).
+# The build is timed under fact_coop_* stages, so the calculate_*_kpis stages
+# ranked by --profile only count per-village work.
+
+def _coop_column(coop_ids, values):
+    """Per-cooperative values (indexed by cooperative id) aligned to coop_ids, 0 where absent."""
+    dtype = 'float64' if values.dtype.kind == 'f' else 'int64'
+    return coop_ids.map(values).fillna(0).to_numpy(dtype=dtype)
+
+def cooperative_child_facts(data, keys=None):
+    """Counts and sums of every cooperative's child table rows ({FACT_COOP column: Series by cooperative id}).
     
-    for col in int_columns:
-        if col in df.columns:
-            df[col] = df[col].fillna(0).astype('int64')
-    
-    # Decimal(18,2) columns
-    dec_18_2_columns = [
-        'RataRataModalAwalKoperasi', 'TotalModalAwalKoperasi',
-        'RataRataSimpananPokokPerAnggota', 'RataRataSimpananWajibPerAnggota',
-        'GeraiPerKoperasi', 'RataRataKLUPerKoperasi',
-        'KoperasiPer10000PendudukDesa', 'KoperasiPerDesa',
-        'RataRataWaktuProsesAplikasiKemitraan'
-    ]
+    keys(name) replaces the cooperativeId of data[name] as the groupby keys
+    (the multi-period sweep adds each row's period bucket).
+    """
+    def by(name):
+        return data[name]['cooperativeId'] if keys is None else keys(name)
     
-    for col in dec_18_2_columns:
-        if col in df.columns:
-            # Ensure float64 type and 2 decimal places
-            df[col] = df[col].fillna(0).astype('float64').round(2)
-    
-    # Decimal(5,4) columns (percentages and indices)
-    dec_5_4_columns = [
-        'RasioKoperasiBaruVsTotal', 'RasioPendaftaranMandiriVsPendamping',
-        'RasioGenderAnggotaLP', 'RasioAnggotaDenganBICheckingLancar',
-        'RasioGenderPengurus', 'RatioStrukturJabatanLengkap',
-        'KomposisiTipeGerai', 'ColdStorageCoverage', 'OutletExpansionRate',
-        'ProporsiSektorUtama', 'KluDiversificationIndex',
-        'VerifiedPartnershipRate', 'RejectedPartnershipRate', 'InProgressPartnershipRate',
-        'PartnershipGrowthRate', 'ProporsiJenisUPKDK',
-        'UpkdkDenganAksesInternet', 'KondisiBangunanUpkdkLayak',
-        'DomainKoperasiTerverifikasi', 'GeoSpatialDataCompletenessScore',
-        'PersentaseGeraiDenganFotoTerunggah', 'DistribusiJenisGeraiKoperasi',
-        'PersentaseUpkdkDenganAksesAirListrikMemadai'
-    ]
+    per_coop = {}
+    with logger.stage("fact_coop_members", rows=len(data['cooperative'])):
+        if 'members_partials' in data:
+            partials = data['members_partials']
+            for name, column in [('members', 'member_count'), ('female_members', 'female_count'),
+                                 ('lancar_members', 'lancar_count'),
+                                 ('principal_saving_sum', 'principal_saving_sum'),
+                                 ('mandatory_saving_sum', 'mandatory_saving_sum')]:
+                if column in partials.columns:
+                    per_coop[name] = partials[column]
+        else:
+            members = data['members']
+            member_keys = by('members')
+            per_coop['members'] = members.groupby(member_keys).size()
+            if 'gender' in members.columns:
+                per_coop['female_members'] = _count_by(members['gender'] == 'PEREMPUAN', member_keys)
+            if 'bi_checking_verification' in members.columns:
+                per_coop['lancar_members'] = _count_by(members['bi_checking_verification'] == 'Lancar', member_keys)
+            for name, column in [('principal_saving_sum', 'principal_saving'),
+                                 ('mandatory_saving_sum', 'mandatory_saving')]:
+                per_coop[name] = members[column].groupby(member_keys).sum()
     
-    for col in dec_5_4_columns:
-        if col in df.columns:
-            # Ensure float64 type, percentage range 0-100, and 4 decimal places
-            df[col] = df[col].fillna(0).astype('float64').clip(0, 100).round(4)
+    with logger.stage("fact_coop_management", rows=len(data['cooperative'])):
+        roles = CooperativeRoles.from_data(data, None if 'management_partials' in data else by('management')).table
+        for name, column in [('pengurus', 'pengurus_count'), ('pengawas', 'pengawas_count'),
+                             ('female_pengurus', 'female_pengurus_count'), ('role_mask', 'role_mask')]:
+            per_coop[name] = roles[column]
+        # A cooperative has a complete structure when its role mask has Ketua, Sekretaris and Bendahara
+        per_coop['complete_structures'] = (roles['role_mask'] == COMPLETE_STRUCTURE_MASK).astype('int64')
     
-    # Step 9: Determine version and save
-    version = get_next_version_number()
-    output_filename = f"{OUTPUT_FILE_PREFIX}{version:03d}.csv"
-    output_path = os.path.join(RESULT_DIR, output_filename)
+    with logger.stage("fact_coop_outlets", rows=len(data['cooperative'])):
+        outlets = data['outlets']
+        outlet_keys = by('outlets')
+        per_coop['outlets'] = outlets.groupby(outlet_keys).size()
+        per_coop['outlets_with_photo'] = _count_by(outlets['primary_image'].notna(), outlet_keys)
     
-    logger.log("SAVING", f"Writing to {output_filename}...")
-    # Format decimal columns to ensure proper display (with .0 if needed)
-    # Note: pandas will handle formatting automatically, but we ensure float64 type
-    df.to_csv(output_path, index=False, float_format='%.10g')
+    with logger.stage("fact_coop_klus", rows=len(data['cooperative'])):
+        klus = data['klus']['kluId'].groupby(by('klus'))
+        per_coop['klu_rows'] = klus.size()
+        per_coop['distinct_klus'] = klus.nunique()
     
-    file_size_mb = get_file_size_mb(output_path)
-    logger.log("SAVING", f"File saved: {file_size_mb:.2f} MB", "success")
+    with logger.stage("fact_coop_partnerships", rows=len(data['cooperative'])):
+        partnerships = data['partnerships']
+        partnership_keys = by('partnerships')
+        per_coop['partnerships'] = partnerships.groupby(partnership_keys).size()
+        for name, statuses in [('verified_partnerships', ['Verified']),
+                               ('rejected_partnerships', ['Rejected']),
+                               ('in_progress_partnerships', ['Requested', 'InReview', 'In Progress'])]:
+            per_coop[name] = _count_by(partnerships['status'].isin(statuses), partnership_keys)
+        if 'created_at' in partnerships.columns and 'updated_at' in partnerships.columns:
+            seconds = pd.Series(seconds_between(partnerships['created_at'], partnerships['updated_at']),
+                                index=partnerships.index)
+            valid = seconds > 0
+            per_coop['process_seconds_sum'] = seconds.where(valid, 0).clip(upper=PROCESS_SECONDS_CAP).groupby(partnership_keys).sum()
+            per_coop['process_seconds_count'] = _count_by(valid, partnership_keys)
+    return per_coop
+
+def build_fact_coop(data):
+    """FACT_COOP: one row per cooperative.csv row (in source order) with the FACT_COOP_COLUMNS facts."""
+    cooperative = data['cooperative']
+    coop_ids = cooperative['cooperative_id']
+    fact = cooperative[[col for col in FACT_COOP_KEY_COLUMNS if col in cooperative.columns]].reset_index(drop=True)
     
-    # Step 10: Summary
-    logger.log_complete(f"Generated {len(df):,} rows with {len(df.columns)} columns")
-    logger.log("SUCCESS", f"Output file: {output_path}", "success")
+    with logger.stage("fact_coop_cooperatives", rows=len(cooperative)):
+        fact['capital_sum'] = cooperative['capital'].to_numpy(dtype='int64')
+        for name, column, value in [('new_coops', 'registration_type', 'Pendaftaran Baru'),
+                                    ('mandiri_coops', 'filling_method', 'Mandiri')]:
+            if column in cooperative.columns:
+                fact[name] = (cooperative[column] == value).to_numpy(dtype='int64')
     
-    # Display sample statistics
-    logger.log("INFO", "Sample statistics:")
-    print(f"  - Total cooperatives processed: {df['TotalKoperasiTerdaftar'].sum():,}")
-    print(f"  - Total members: {df['TotalAnggotaKoperasi'].sum():,}")
-    print(f"  - Total outlets: {df['TotalGeraiKoperasi'].sum():,}")
-    print(f"  - Average cooperatives per village: {df['TotalKoperasiTerdaftar'].mean():.2f}")
+    per_coop = cooperative_child_facts(data)  # Child table facts indexed by cooperative id
+    first_rows = ~coop_ids.duplicated().to_numpy()
+    for name, values in per_coop.items():
+        column = _coop_column(coop_ids, values)
+        # role_mask describes the cooperative and complete_structures counts rows (like KPI_17 does)
+        fact[name] = column if name in FACT_COOP_ROW_FACTS else np.where(first_rows, column, 0)
+    for name in FACT_COOP_COLUMNS:
+        if name not in fact.columns:
+            fact[name] = 0
+    return fact[[col for col in FACT_COOP_COLUMNS if col in fact.columns]]
+
+def write_fact_coop(fact_coop, version, output_formats):
+    """Write FACT_COOP_V{version}, the per-cooperative facts behind FACT_KPI_V{version}, in every requested format."""
+    paths = []
+    for output_format in output_formats:
+        output_filename = f"{FACT_COOP_FILE_PREFIX}{version:03d}{OUTPUT_FORMATS[output_format]}"
+        output_path = os.path.join(RESULT_DIR, output_filename)
+        if output_format == "csv":
+            fact_coop.to_csv(output_path, index=False, float_format='%.10g')
+        else:
+            table = pa.Table.from_pandas(fact_coop, preserve_index=False)
+            if output_format == "parquet":
+                parquet.write_table(table, output_path, compression='zstd')
+            else:
+                feather.write_feather(table, output_path, compression='uncompressed')
+        logger.log("SAVING", f"{output_filename} saved: {len(fact_coop):,} cooperatives, "
+                   f"{get_file_size_mb(output_path):.2f} MB", "success")
+        paths.append(output_path)
+    return paths
+
+# ============================================================================
+# VECTORIZED ENGINE
+# ============================================================================
+# Computes the same KPI columns as the per-village loop, but with a handful of
+# groupby/merge passes over each source table keyed on the village code.
+# Row order and "first row" dimension keys follow the source table order,
+# exactly like the boolean filters used by the loop engine.
+
+def _with_position(frame, columns):
+    """Select the available columns and remember each row's original position."""
+    columns = [col for col in columns if col in frame.columns]
+    out = frame[columns].reset_index(drop=True)
+    out['_pos'] = np.arange(len(out))
+    return out
+
+def _attach_village_code(frame, coop_codes, columns, key='cooperativeId'):
+    """Attach the village code of each row's cooperative (rows of other cooperatives are dropped)."""
+    out = _with_position(frame, [key] + [col for col in columns if col != key])
+    return out.merge(coop_codes, left_on=key, right_on='_coop_id', how='inner')
+
+def _count_by(mask, keys):
+    """Count True values of a boolean mask per group key."""
+    return mask.astype('int64').groupby(keys).sum()
+
+def _percentage(numerator, denominator):
+    """Vectorized safe_percentage: 0 where the denominator is 0."""
+    numerator = numerator.astype('float64')
+    denominator = denominator.astype('float64')
+    return (numerator / denominator.where(denominator != 0) * 100).fillna(0)
+
+def _filled_mask(frame, column):
+    """True where a column is present, not null and not an empty string."""
+    if column not in frame.columns:
+        return pd.Series(False, index=frame.index)
+    return frame[column].notna() & (frame[column] != '')
+
+def _ratio(numerator, denominator):
+    """Vectorized safe_divide: 0 where the denominator is 0."""
+    numerator = numerator.astype('float64')
+    denominator = denominator.astype('float64')
+    return (numerator / denominator.where(denominator != 0)).fillna(0)
+
+def _money_ratio(cents, count):
+    """Vectorized money_ratio: rupiah per unit from int64 cents, 0 where the count is 0."""
+    count = count.astype('float64')
+    return (cents.astype('float64') / (count.where(count != 0) * MONEY_SCALE)).fillna(0)
+
+def _keyed(frame, key, geo_keys):
+    """Rows whose key belongs to an emitted FACT_KPI row, with that row's geo_key as _geo_key."""
+    out = frame.assign(_geo_key=frame[key].map(geo_keys))
+    return out[out['_geo_key'].notna()].astype({'_geo_key': 'int64'})
+
+def _empty_tally(*columns):
+    """A tally frame without rows."""
+    return pd.DataFrame({column: pd.Series(dtype='int64') for column in ('_geo_key',) + columns})
+
+def _first_tally(frame, key, column, geo_keys):
+    """Source position and value of the first row per geo_key."""
+    first_rows = frame.sort_values('_pos', kind='stable').drop_duplicates(key)
+    first_rows = _keyed(first_rows[[key, '_pos', column]], key, geo_keys)
+    return first_rows[['_geo_key', '_pos', column]].rename(columns={column: 'value'})
+
+def _histogram_tally(frame, key, column, geo_keys):
+    """Row count per geo_key and (non-null) category."""
+    if column not in frame.columns:
+        return _empty_tally('value', 'count')
+    counts = frame.groupby([key, column], observed=True).size().rename('count').reset_index()
+    counts = _keyed(counts, key, geo_keys)
+    return counts[['_geo_key', column, 'count']].rename(columns={column: 'value'})
+
+def _distinct_tally(frame, key, column, geo_keys, counter):
+    """Distinct (non-null) values per geo_key, as a DISTINCT_COUNTERS structure."""
+    pairs = frame[[key, column]].dropna(subset=[column]).drop_duplicates()
+    pairs = _keyed(pairs, key, geo_keys)
+    return counter.from_pairs(pairs['_geo_key'].to_numpy(), pairs[column].to_numpy())
+
+def geo_internal_ids(geo, district_code_to_id, subdistrict_code_to_id):
+    """Internal district/subdistrict IDs (as used by cooperative.csv) of DIM_GEOGRAPHY rows."""
+    district_internal = geo['district_id'].map(
+        lambda d: district_code_to_id.get(d) if pd.notna(d) else None)
+    subdistrict_internal = geo['subdistrict_id'].map(
+        lambda s: subdistrict_code_to_id.get(str(s)) if pd.notna(s) else None)
+    return district_internal, subdistrict_internal
+
+def apply_regional_kpis(facts, geo, district_internal, subdistrict_internal, global_agg):
+    """Set the KPI columns that only depend on global aggregates and the village's region.
+    
+    Needs the village's business_partner_service_id and TotalAplikasiKemitraan
+    already in ``facts``; everything else comes from ``global_agg``.
+    """
+    coops_per_province = global_agg['coops_per_province']
+    coops_per_district = global_agg['coops_per_district']
+    facts['TotalKoperasiPerProvinsi'] = geo['province_id'].map(lambda p: coops_per_province.get(p, 0)).to_numpy()
+    facts['TotalKoperasiPerKabupatenKota'] = district_internal.map(
+        lambda d: coops_per_district.get(d, 0) if d is not None else 0).to_numpy()
+    facts['SebaranGeraiPerProvinsi'] = geo['province_id'].map(
+        lambda p: global_agg['gerai_per_provinsi'].get(p, 0)).to_numpy()
+    
+    service_distribution = global_agg['service_distribution']
+    facts['DistribusiJenisLayananKemitraan'] = [
+        service_distribution.get(service_id, 0) if total > 0 else 0
+        for service_id, total in zip(facts['business_partner_service_id'], facts['TotalAplikasiKemitraan'])
+    ]
+    facts['PartnershipGrowthRate'] = global_agg['partnership_growth_rate']
+    
+    for kpi, value in calculate_domain_kpis(global_agg).items():
+        facts[kpi] = value
+    
+    koperasi_per_desa = global_agg['koperasi_per_desa']
+    facts['KoperasiPerDesa'] = [
+        koperasi_per_desa.get((province_id, district_id, subdistrict_id), 1.0)
+        for province_id, district_id, subdistrict_id in zip(geo['province_id'], district_internal, subdistrict_internal)
+    ]
+    return facts
+
+# Additive intermediates behind the KPI columns: every ratio, average and total is derived from these sums
+KPI_TALLY_SUMS = [
+    'coops', 'coop_rows', 'coop_villages', 'capital_sum', 'new_coops', 'mandiri_coops',
+    'members', 'female_members', 'lancar_members', 'principal_saving_sum', 'mandatory_saving_sum',
+    'pengurus', 'pengawas', 'female_pengurus', 'complete_structures',
+    'outlets', 'outlets_with_photo', 'klu_rows',
+    'partnerships', 'verified_partnerships', 'rejected_partnerships', 'in_progress_partnerships',
+    'process_seconds_sum', 'process_seconds_count',
+    'upkdk', 'upkdk_internet', 'upkdk_good_building', 'upkdk_water_electricity',
+    'populated_coops', 'population', 'village_mergers', 'geo_filled_points', 'geo_total_points',
+]
+MONEY_TALLY_SUMS = ['capital_sum', 'principal_saving_sum', 'mandatory_saving_sum']  # Exact int64 cents
+# KPI_TALLY_SUMS that are sums of FACT_COOP columns of the same name
+FACT_COOP_SUMS = [
+    'capital_sum', 'new_coops', 'mandiri_coops',
+    'members', 'female_members', 'lancar_members', 'principal_saving_sum', 'mandatory_saving_sum',
+    'pengurus', 'pengawas', 'female_pengurus', 'complete_structures',
+    'outlets', 'outlets_with_photo', 'klu_rows',
+    'partnerships', 'verified_partnerships', 'rejected_partnerships', 'in_progress_partnerships',
+    'process_seconds_sum', 'process_seconds_count',
+]
+# FACT_COOP columns set on every cooperative.csv row; the other sums sit on the first row of a cooperative_id
+FACT_COOP_ROW_FACTS = ['capital_sum', 'new_coops', 'mandiri_coops', 'complete_structures', 'role_mask']
+# FACT_COOP sums tallied per cooperative.csv row of a village (KPI_17 counts the repeats of an id);
+# the rest are tallied over all rows of each distinct cooperative_id, whichever village they sit in
+FACT_COOP_CODE_ROW_SUMS = ['complete_structures']
+FACT_COOP_ID_SUMS = [name for name in FACT_COOP_SUMS if name not in FACT_COOP_CODE_ROW_SUMS]
+FACT_COOP_KEY_COLUMNS = ['cooperative_id', 'provinceId', 'districtId', 'subdistrictId', 'villageId']
+FACT_COOP_COLUMNS = FACT_COOP_KEY_COLUMNS + FACT_COOP_SUMS + ['distinct_klus', 'role_mask']
+
+class KpiTallies:
+    """Additive KPI intermediates per geo_key, rolled up one geography level at a time.
+    
+    sums holds KPI_TALLY_SUMS (one row per geo_key), firsts the source position
+    and value of the first row behind each dimension key, histograms the row
+    count per category and distinct a DISTINCT_COUNTERS structure per distinct
+    count. All of them combine with a sum, min or union, so a parent level
+    never rereads the source tables.
+    """
+    
+    def __init__(self, sums, firsts, histograms, distinct):
+        self.sums = sums
+        self.firsts = firsts
+        self.histograms = histograms
+        self.distinct = distinct
+    
+    def rollup(self, parent):
+        """Tallies of the parent rows; parent maps a child geo_key to its parent geo_key."""
+        def regroup(frame):
+            frame = frame.assign(_geo_key=frame['_geo_key'].map(parent))
+            return frame[frame['_geo_key'].notna()].astype({'_geo_key': 'int64'})
+        
+        sums = self.sums.groupby(self.sums.index.map(parent)).sum()
+        sums.index = sums.index.astype('int64').rename('geo_key')
+        firsts = {name: regroup(frame).sort_values('_pos', kind='stable').drop_duplicates('_geo_key')
+                  for name, frame in self.firsts.items()}
+        histograms = {name: regroup(frame).groupby(['_geo_key', 'value'], observed=True)['count'].sum().reset_index()
+                      for name, frame in self.histograms.items()}
+        distinct = {name: counter.rollup(parent) for name, counter in self.distinct.items()}
+        return KpiTallies(sums, firsts, histograms, distinct)
+    
+    def first(self, name):
+        """Value of the first source row per geo_key."""
+        return self.firsts[name].set_index('_geo_key')['value']
+    
+    def top_count(self, name):
+        """Row count of the most common category per geo_key."""
+        return self.histograms[name].groupby('_geo_key')['count'].max()
+    
+    def distinct_count(self, name):
+        """Number of distinct values per geo_key (estimated by the hll counter)."""
+        return self.distinct[name].counts()
+
+def village_populations(villages):
+    """Population (total_u17 + total_a17) per village_id, NaN where not numeric."""
+    village_rows = villages.drop_duplicates('village_id').set_index('village_id')
+    population = pd.Series(0, index=village_rows.index, dtype='float64')
+    for column in ['total_u17', 'total_a17']:
+        if column in village_rows.columns:
+            population = population + pd.to_numeric(village_rows[column], errors='coerce')
+    return population
+
+def village_tallies(data, global_agg, village_geo, distinct_count=DEFAULT_DISTINCT_COUNT, fact_coop=None):
+    """KpiTallies of every village with cooperatives, and those villages' DIM_GEOGRAPHY rows.
+    
+    The per-cooperative sums come from fact_coop (build_fact_coop(data), built
+    here when not given); only counts that are not per-cooperative sums read
+    the source rows.
+    """
+    if fact_coop is None:
+        fact_coop = build_fact_coop(data)
+    villages = data['villages']
+    cooperative = _with_position(data['cooperative'], data['cooperative'].columns)
+    
+    # Village membership: a DIM_GEOGRAPHY code covers every village_id sharing that code
+    village_codes = villages[['village_id', 'code']].drop_duplicates()
+    village_codes = village_codes.rename(columns={'village_id': '_village_id', 'code': '_code'})
+    first_village = villages.drop_duplicates('code')[['code', 'village_id']]
+    first_village = first_village.rename(columns={'code': '_code', 'village_id': '_first_village_id'})
+    
+    coop_in_code = cooperative.merge(village_codes, left_on='villageId', right_on='_village_id', how='inner')
+    coop_in_code = coop_in_code.sort_values('_pos', kind='stable')
+    coop_codes = coop_in_code[['cooperative_id', '_code']].drop_duplicates()
+    coop_codes = coop_codes.rename(columns={'cooperative_id': '_coop_id'})
+    
+    # Village rows to emit, in DIM_GEOGRAPHY order
+    geo = village_geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id', 'village_id']]
+    geo = geo.rename(columns={'village_id': '_code'})
+    geo = geo.merge(first_village, on='_code', how='inner')
+    coop_count = coop_in_code.groupby('_code').size()
+    geo = geo[geo['_code'].isin(coop_count.index)].reset_index(drop=True)
+    
+    code = geo['_code']
+    first_village_id = geo['_first_village_id']
+    code_keys = pd.Series(geo['geo_key'].to_numpy(), index=code.to_numpy())
+    village_keys = pd.Series(geo['geo_key'].to_numpy(), index=first_village_id.to_numpy())
+    
+    def per_code(values, default=0):
+        return code.map(values).fillna(default).to_numpy()
+    
+    def per_village(values, default=0):
+        return first_village_id.map(values).fillna(default).to_numpy()
+    
+    sums = dict.fromkeys(KPI_TALLY_SUMS, 0)
+    
+    # --- Dimension keys (first matching row in source table order) ---
+    outlets = _attach_village_code(data['outlets'], coop_codes, ['cooperative_outlet_id', 'cooperative_type_id'])
+    partnerships = _attach_village_code(data['partnerships'], coop_codes, ['business_partner_service_id'])
+    klus = _attach_village_code(data['klus'], coop_codes, ['kluId'])
+    upkdk_codes = _with_position(data['upkdk'], ['villageId', 'upkdk_id']).merge(
+        village_codes, left_on='villageId', right_on='_village_id', how='inner')
+    
+    firsts = {
+        'outlet_id': _first_tally(outlets, '_code', 'cooperative_outlet_id', code_keys),
+        'business_partner_service_id': _first_tally(partnerships, '_code', 'business_partner_service_id', code_keys),
+        'upkdk_id': _first_tally(upkdk_codes, '_code', 'upkdk_id', code_keys),
+        'klu_id': _first_tally(klus, '_code', 'kluId', code_keys),
+    }
+    histograms, distinct = {}, {}
+    counter = DISTINCT_COUNTERS[distinct_count]
+    
+    # --- Per-cooperative sums (KPI_04 to KPI_07, KPI_09 to KPI_24, KPI_27, KPI_33 to KPI_40, KPI_53) ---
+    with logger.stage("reduce_fact_coop", rows=len(geo)):
+        # FACT_COOP_CODE_ROW_SUMS add up the code's own cooperative.csv rows; the other sums add up
+        # every row of each distinct cooperative_id in the code, wherever it sits (the loop's isin filters)
+        row_facts = fact_coop[FACT_COOP_CODE_ROW_SUMS].iloc[coop_in_code['_pos'].to_numpy()]
+        by_code = row_facts.groupby(coop_in_code['_code'].to_numpy()).sum()
+        by_id = fact_coop.groupby('cooperative_id', dropna=False, observed=True)
+        id_facts = by_id[FACT_COOP_ID_SUMS].sum()
+        id_facts['coop_rows'] = by_id.size()
+        coop_id_facts = coop_codes.merge(id_facts, left_on='_coop_id', right_index=True, how='inner')
+        by_code = by_code.join(coop_id_facts.groupby('_code')[FACT_COOP_ID_SUMS + ['coop_rows']].sum())
+        for name in FACT_COOP_SUMS + ['coop_rows']:
+            sums[name] = per_code(by_code[name])
+    
+    # --- Cooperative tallies (KPI_01, KPI_08) ---
+    with logger.stage("calculate_cooperative_kpis", rows=len(geo)):
+        sums['coops'] = per_code(coop_count)
+        sums['coop_villages'] = per_code(coop_in_code.groupby('_code')['villageId'].nunique())
+    
+    # --- Outlet type histogram (KPI_22) ---
+    with logger.stage("calculate_outlet_kpis", rows=len(geo)):
+        histograms['outlet_type'] = _histogram_tally(outlets, '_code', 'cooperative_type_id', code_keys)
+    
+    # --- KLU distinct counts and sectors (KPI_28 to KPI_30, KPI_32) ---
+    with logger.stage("calculate_klu_kpis", rows=len(geo)):
+        distinct['klu'] = _distinct_tally(klus, '_code', 'kluId', code_keys, counter)
+        top_klus = klus[klus['kluId'].isin(global_agg['top_10_klu'])]
+        distinct['top_10_klu_coops'] = _distinct_tally(top_klus, '_code', 'cooperativeId', code_keys, counter)
+        klus_with_sector = klus[['_code', 'kluId']].merge(data['dim_klu'][['kluId', 'sector']], on='kluId', how='left')
+        histograms['klu_sector'] = _histogram_tally(klus_with_sector, '_code', 'sector', code_keys)
+    
+    # --- UPKDK tallies (KPI_41 to KPI_44, KPI_54), keyed on the first matching village_id ---
+    with logger.stage("calculate_upkdk_kpis", rows=len(geo)):
+        upkdk = data['upkdk']
+        upkdk_keys = upkdk['villageId']
+        sums['upkdk'] = per_village(upkdk.groupby('villageId').size())
+        histograms['upkdk_type'] = _histogram_tally(upkdk, 'villageId', 'type', village_keys)
+        for name, column, value in [('upkdk_internet', 'internet_access', 'Ada'),
+                                    ('upkdk_good_building', 'building_condition', 'Baik'),
+                                    ('upkdk_water_electricity', 'water_electricity', 'Ya')]:
+            if column in upkdk.columns:
+                sums[name] = per_village(_count_by(upkdk[column] == value, upkdk_keys))
+    
+    # --- Geography tallies (KPI_08, KPI_48, KPI_49) ---
+    with logger.stage("calculate_geo_kpis", rows=len(geo)):
+        coops_in_village = pd.Series(per_village(global_agg['coops_per_village']))
+        village_population = pd.Series(per_village(village_populations(villages), default=np.nan))
+        populated = village_population > 0
+        sums['populated_coops'] = coops_in_village.where(populated, 0).to_numpy()
+        sums['population'] = village_population.where(populated, 0).to_numpy()
+        sums['village_mergers'] = per_village(data['village_mergers'].groupby('village_id').size())
+        sums['geo_filled_points'] = per_village(global_agg['geo_filled_points'])
+        sums['geo_total_points'] = per_village(global_agg['geo_total_points'])
+    
+    sums = pd.DataFrame(sums, index=pd.Index(geo['geo_key'].to_numpy(), name='geo_key'))
+    sums = sums.astype(dict.fromkeys(MONEY_TALLY_SUMS, 'int64'))
+    geo = geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id']]
+    return KpiTallies(sums, firsts, histograms, distinct), geo
+
+def facts_from_tallies(tallies, geo, date_key, global_agg, district_code_to_id, subdistrict_code_to_id):
+    """FACT_KPI rows of ``geo`` (DIM_GEOGRAPHY rows in the order of tallies.sums) derived from their tallies."""
+    sums = tallies.sums
+    keys = sums.index
+    coops = sums['coops']
+    
+    def per_key(values, default=0):
+        return values.reindex(keys).fillna(default).to_numpy()
+    
+    # Columns are collected first and framed once; inserting them one by one dominates small (per-period) frames
+    facts = {'date_key': date_key, 'geo_key': keys.to_numpy()}
+    for column in ['outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id']:
+        facts[column] = per_key(tallies.first(column))
+    
+    # Cooperatives (KPI_01, KPI_04 to KPI_08)
+    facts['TotalKoperasiTerdaftar'] = coops.to_numpy()
+    # KPI_04 to KPI_07 cover every row of the code's cooperative_ids, including repeats in other villages
+    coop_rows = sums['coop_rows']
+    facts['RataRataModalAwalKoperasi'] = _money_ratio(sums['capital_sum'], coop_rows).to_numpy()
+    facts['TotalModalAwalKoperasi'] = (sums['capital_sum'] / MONEY_SCALE).to_numpy()
+    facts['RasioKoperasiBaruVsTotal'] = _percentage(sums['new_coops'], coop_rows).to_numpy()
+    facts['RasioPendaftaranMandiriVsPendamping'] = _percentage(sums['mandiri_coops'], coop_rows).to_numpy()
+    population = sums['population'].astype('float64')
+    facts['KoperasiPer10000PendudukDesa'] = (sums['populated_coops'] / population.where(population > 0) * 10000).fillna(0).to_numpy()
+    
+    # Members and management (KPI_09 to KPI_18)
+    members = sums['members']
+    facts['TotalAnggotaKoperasi'] = members.to_numpy()
+    facts['RasioGenderAnggotaLP'] = _percentage(sums['female_members'], members).to_numpy()
+    facts['RataRataSimpananPokokPerAnggota'] = _money_ratio(sums['principal_saving_sum'], members).to_numpy()
+    facts['RataRataSimpananWajibPerAnggota'] = _money_ratio(sums['mandatory_saving_sum'], members).to_numpy()
+    facts['RasioAnggotaDenganBICheckingLancar'] = _percentage(sums['lancar_members'], members).to_numpy()
+    facts['TotalPengurusKoperasi'] = sums['pengurus'].to_numpy()
+    facts['TotalPengawasKoperasi'] = sums['pengawas'].to_numpy()
+    facts['RasioGenderPengurus'] = _percentage(sums['female_pengurus'], sums['pengurus']).to_numpy()
+    facts['RatioStrukturJabatanLengkap'] = _percentage(sums['complete_structures'], coops).to_numpy()
+    facts['RataRataAnggotaPerKoperasi'] = (members // coops).to_numpy()
+    
+    # Outlets (KPI_19 to KPI_24, KPI_51, KPI_52)
+    outlets = sums['outlets']
+    facts['TotalGeraiKoperasi'] = outlets.to_numpy()
+    facts['GeraiPerKoperasi'] = (outlets / coops).to_numpy()
+    facts['KomposisiTipeGerai'] = 0
+    facts['ColdStorageCoverage'] = 0
+    facts['OutletExpansionRate'] = 0
+    facts['PersentaseGeraiDenganFotoTerunggah'] = _percentage(sums['outlets_with_photo'], outlets).to_numpy()
+    top_type = pd.Series(per_key(tallies.top_count('outlet_type')), index=keys)
+    facts['DistribusiJenisGeraiKoperasi'] = _percentage(top_type, outlets).to_numpy()
+    
+    # KLU (KPI_27 to KPI_32)
+    unique_klus = per_key(tallies.distinct_count('klu'))
+    facts['TotalKLUTerdaftar'] = unique_klus
+    facts['Top10KBLITerbanyak'] = per_key(tallies.distinct_count('top_10_klu_coops'))
+    facts['DistribusiKLUPerProvinsi'] = unique_klus
+    top_sector = pd.Series(per_key(tallies.top_count('klu_sector')), index=keys)
+    facts['ProporsiSektorUtama'] = _percentage(top_sector, sums['klu_rows']).to_numpy()
+    facts['RataRataKLUPerKoperasi'] = (sums['klu_rows'] / coops).to_numpy()
+    facts['KluDiversificationIndex'] = unique_klus / np.maximum(coops.to_numpy(), 1)
+    
+    # Partnerships (KPI_33 to KPI_40, KPI_53)
+    partnerships = sums['partnerships']
+    facts['TotalAplikasiKemitraan'] = partnerships.to_numpy()
+    for kpi, name in [('VerifiedPartnershipRate', 'verified_partnerships'),
+                      ('RejectedPartnershipRate', 'rejected_partnerships'),
+                      ('InProgressPartnershipRate', 'in_progress_partnerships')]:
+        facts[kpi] = _percentage(sums[name], partnerships).to_numpy()
+    avg_hours = process_hours(sums['process_seconds_sum'], sums['process_seconds_count']).fillna(0)
+    facts['RataRataWaktuProsesAplikasiKemitraan'] = avg_hours.where(avg_hours <= 0, np.maximum(avg_hours, 5)).to_numpy()
+    facts['KemitraanPerProvinsi'] = partnerships.to_numpy()
+    
+    # UPKDK (KPI_41 to KPI_44, KPI_54)
+    upkdk = sums['upkdk']
+    facts['TotalUPKDKAktif'] = upkdk.to_numpy()
+    top_upkdk_type = pd.Series(per_key(tallies.top_count('upkdk_type')), index=keys)
+    facts['ProporsiJenisUPKDK'] = _percentage(top_upkdk_type, upkdk).to_numpy()
+    for kpi, name in [('UpkdkDenganAksesInternet', 'upkdk_internet'),
+                      ('KondisiBangunanUpkdkLayak', 'upkdk_good_building'),
+                      ('PersentaseUpkdkDenganAksesAirListrikMemadai', 'upkdk_water_electricity')]:
+        facts[kpi] = _percentage(sums[name], upkdk).to_numpy()
+    
+    # Geography (KPI_48, KPI_49)
+    facts['JumlahPenggabunganDesa'] = sums['village_mergers'].to_numpy()
+    facts['GeoSpatialDataCompletenessScore'] = _percentage(sums['geo_filled_points'], sums['geo_total_points']).to_numpy()
+    facts = pd.DataFrame(facts)
+    
+    # --- Regional and global KPIs (KPI_02, KPI_03, KPI_21, KPI_37, KPI_38, KPI_45 to KPI_47) ---
+    with logger.stage("apply_regional_kpis", rows=len(facts)):
+        district_internal, subdistrict_internal = geo_internal_ids(geo, district_code_to_id, subdistrict_code_to_id)
+        apply_regional_kpis(facts, geo, district_internal, subdistrict_internal, global_agg)
+    return facts
+
+def generate_fact_rows_vectorized(data, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                  rollups=False, distinct_count=DEFAULT_DISTINCT_COUNT, fact_coop=None):
+    """Compute all village FACT_KPI rows from village tallies (plus their rollups with rollups=True)."""
+    logger.log("INFO", f"Vectorized engine: aggregating {len(village_geo):,} villages...")
+    tallies, geo = village_tallies(data, global_agg, village_geo, distinct_count, fact_coop)
+    facts = facts_from_tallies(tallies, geo, date_key, global_agg, district_code_to_id, subdistrict_code_to_id)
+    logger.log("INFO", f"Vectorized engine: {len(facts):,} villages with cooperatives", "success")
+    
+    if rollups:
+        facts = append_rollup_rows(facts, tallies, data['dim_geography'], date_key, global_agg,
+                                   district_code_to_id, subdistrict_code_to_id)
+    return facts
+
+# ============================================================================
+# HIERARCHICAL ROLLUPS
+# ============================================================================
+# Subdistrict, district and province FACT_KPI rows. Each level sums the
+# KpiTallies of the level below (villages -> subdistricts -> districts ->
+# provinces) and derives its KPIs with the same facts_from_tallies as the
+# villages, so ratios are re-derived from their numerators and denominators
+# instead of averaging village ratios. Only regions with at least one village
+# row get a rollup row.
+
+def geography_level_rows(dim_geography, columns):
+    """DIM_GEOGRAPHY rows identified by exactly ``columns`` (the finer levels left empty)."""
+    finer = GEO_LEVEL_COLUMNS[len(columns)]
+    mask = dim_geography[columns].notna().all(axis=1) & dim_geography[finer].isna()
+    return dim_geography[mask]
+
+def rollup_fact_rows(tallies, dim_geography, date_key, global_agg, district_code_to_id, subdistrict_code_to_id):
+    """FACT_KPI rows of every ROLLUP_LEVELS region above the village rows in ``tallies``, by geo_key."""
+    geo_by_key = dim_geography.set_index('geo_key')
+    frames = []
+    for level, columns in ROLLUP_LEVELS:
+        parents = geography_level_rows(dim_geography, columns).drop_duplicates(columns)
+        children = geo_by_key.loc[tallies.sums.index, columns].rename_axis('_child').reset_index()
+        parent = children.merge(parents[['geo_key'] + columns], on=columns, how='inner').set_index('_child')['geo_key']
+        orphans = len(children) - len(parent)
+        if orphans:
+            logger.log("INFO", f"Rollups: {orphans:,} rows have no {level} row in DIM_GEOGRAPHY", "info")
+        
+        tallies = tallies.rollup(parent)
+        geo = parents.set_index('geo_key').loc[tallies.sums.index].reset_index()
+        facts = facts_from_tallies(tallies, geo, date_key, global_agg, district_code_to_id, subdistrict_code_to_id)
+        if level != 'subdistrict':
+            # KPI_47 is a subdistrict average; above that, cooperatives per village with cooperatives, capped 1-3
+            sums = tallies.sums
+            facts['KoperasiPerDesa'] = (sums['coops'] / sums['coop_villages']).clip(1.0, 3.0).to_numpy()
+        frames.append(facts)
+        logger.log("INFO", f"Rollups: {len(facts):,} {level} rows")
+    
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values('geo_key', kind='stable').reset_index(drop=True)
+
+def append_rollup_rows(facts, tallies, dim_geography, date_key, global_agg, district_code_to_id, subdistrict_code_to_id):
+    """Village FACT_KPI rows followed by the rollup rows derived from their tallies."""
+    with logger.stage("rollup_fact_rows", rows=len(facts)):
+        rollup_rows = rollup_fact_rows(tallies, dim_geography, date_key, global_agg,
+                                       district_code_to_id, subdistrict_code_to_id)
+    if len(rollup_rows) > 0:
+        facts = pd.concat([facts, rollup_rows], ignore_index=True)
+    return facts
+
+# ============================================================================
+# SQLITE ENGINE
+# ============================================================================
+# A low-memory path: SQLITE_TABLES are bulk loaded chunk by chunk into an
+# indexed on-disk SQLite database (SQLITE_DB_FILE) and FACT_KPI is computed
+# with the set-based GROUP BY formulas of formula_datasource_fact_kpi.md.
+# Only aggregates (one row per cooperative, village code or category) reach
+# pandas; they fill the same KpiTallies as the vectorized engine, so the rows
+# (and --rollups) are identical. "First row" dimension keys follow the rowid,
+# i.e. the source table order. Money columns are int64 cents, timestamps
+# int64 epoch nanoseconds (NULL when missing).
+
+def _sqlite_rows(chunk, schema):
+    """Rows of a parsed source chunk as tuples of plain Python values (None where missing) for executemany."""
+    columns = []
+    for col in chunk.columns:
+        values = chunk[col]
+        if schema.get(col) == 'timestamp':
+            columns.append([None if value == NAT_EPOCH else value for value in epoch_ns(values).tolist()])
+        elif values.dtype.kind in 'iu':
+            columns.append(values.tolist())
+        else:
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return zip(*columns)
+
+def _sql_list(values):
+    """SQL literal list of strings, e.g. ('Ketua', 'Sekretaris')."""
+    return "(" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + ")"
+
+class SqliteSource:
+    """SQLITE_TABLES in an on-disk SQLite database, kept up to date with their source files.
+    
+    A table is reloaded (one executemany per chunk_size rows, indexes built
+    afterwards) when its source file changed: size and mtime, else SHA-256,
+    like the source cache. rebuild=True reloads every table.
+    """
+    
+    def __init__(self, db_path=SQLITE_DB_FILE):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        # The database can always be rebuilt from the source files
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_MB * 1024}")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS source_meta (key TEXT PRIMARY KEY, meta TEXT)")
+        self.rows = {}  # Table -> row count
+        self.coercion_failures = {}  # 'table.column' -> values not parseable as money
+    
+    def load(self, chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False):
+        """Bring every SQLITE_TABLES table up to date with its source file."""
+        for key in SQLITE_TABLES:
+            filepath = source_file_path(key)
+            try:
+                schema = table_schema(key)
+                meta = None if rebuild else self._fresh_meta(key, filepath, schema)
+                loaded_from = "sqlite"
+                if meta is None:
+                    meta = self._load_table(key, filepath, schema, chunk_size)
+                    loaded_from = f"csv -> sqlite, {meta['chunks']} chunks"
+            except FileNotFoundError:
+                logger.log_error(f"File not found: {filepath}")
+                raise
+            except Exception as e:
+                logger.log_error(f"Error loading {filepath} into SQLite: {str(e)}")
+                raise
+            self.rows[key] = meta['rows']
+            for col, count in meta['coercion_failures'].items():
+                self.coercion_failures[f"{key}.{col}"] = count
+            logger.log_file_load(os.path.basename(filepath), get_file_size_mb(filepath), meta['rows'], loaded_from)
+        for column, count in self.coercion_failures.items():
+            if count:
+                logger.log("INIT", f"{column}: {count:,} values not parseable as money, counted as 0", "info")
+        return self
+    
+    def _store_meta(self, key, meta):
+        self.conn.execute("INSERT OR REPLACE INTO source_meta VALUES (?, ?)", (key, json.dumps(meta)))
+    
+    def _fresh_meta(self, key, filepath, schema):
+        """Metadata of a loaded table that still matches its source file, None if it must be reloaded."""
+        row = self.conn.execute("SELECT meta FROM source_meta WHERE key = ?", (key,)).fetchone()
+        meta = json.loads(row[0]) if row else None
+        if meta is None or meta.get('schema') != schema or meta.get('source') != filepath:
+            return None
+        stat = os.stat(filepath)
+        if meta.get('size') != stat.st_size:
+            return None
+        if meta.get('mtime_ns') != stat.st_mtime_ns:
+            if get_file_sha256(filepath) != meta.get('sha256'):
+                return None
+            meta['mtime_ns'] = stat.st_mtime_ns
+            with self.conn:
+                self._store_meta(key, meta)
+        return meta
+    
+    def _load_table(self, key, filepath, schema, chunk_size):
+        """(Re)load one table in a single transaction, then index it."""
+        row_count, chunk_count, failures = 0, 0, {}
+        with self.conn:
+            self.conn.execute(f'DROP TABLE IF EXISTS "{key}"')
+            for chunk in read_source_chunks(filepath, schema, chunk_size):
+                if chunk_count == 0:
+                    columns = list(chunk.columns)
+                    definitions = ", ".join(f'"{col}" {SQLITE_COLUMN_TYPES.get(schema[col], "")}'.rstrip()
+                                            for col in columns)
+                    self.conn.execute(f'CREATE TABLE "{key}" ({definitions})')
+                    names = ", ".join(f'"{col}"' for col in columns)
+                    insert = f'INSERT INTO "{key}" ({names}) VALUES ({", ".join("?" * len(columns))})'
+                self.conn.executemany(insert, _sqlite_rows(chunk[columns], schema))
+                row_count += len(chunk)
+                chunk_count += 1
+                for col, count in chunk.attrs.get('coercion_failures', {}).items():
+                    failures[col] = failures.get(col, 0) + count
+            for column in SQLITE_INDEXES.get(key, []):
+                if column in columns:
+                    self.conn.execute(f'CREATE INDEX "{key}_{column}" ON "{key}" ("{column}")')
+            stat = os.stat(filepath)
+            meta = {
+                'source': filepath,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': get_file_sha256(filepath),
+                'schema': schema,
+                'rows': row_count,
+                'chunks': chunk_count,
+                'coercion_failures': failures,
+            }
+            self._store_meta(key, meta)
+        return meta
+    
+    def query(self, sql, params=()):
+        """Result of a query as a DataFrame, fetched SQLITE_FETCH_ROWS rows at a time."""
+        frames = list(pd.read_sql_query(sql, self.conn, params=params, chunksize=SQLITE_FETCH_ROWS))
+        if len(frames) <= 1:
+            return frames[0] if frames else pd.read_sql_query(sql, self.conn, params=params)
+        return pd.concat(frames, ignore_index=True)
+    
+    def columns(self, table):
+        """Column names of a table."""
+        return {row[1] for row in self.conn.execute(f'PRAGMA table_info("{table}")')}
+    
+    def close(self):
+        self.conn.close()
+
+def calculate_global_aggregates_sqlite(source):
+    """calculate_global_aggregates with GROUP BY queries over the SQLite tables."""
+    logger.log("INIT", "Calculating global aggregates...")
+    
+    def as_dict(sql):
+        return dict(source.conn.execute(sql).fetchall())
+    
+    global_agg = {}
+    
+    # 1. Top 10 KLU (ties in order of first appearance, like value_counts)
+    global_agg['top_10_klu'] = [row[0] for row in source.conn.execute(
+        "SELECT kluId FROM klus WHERE kluId IS NOT NULL GROUP BY kluId ORDER BY COUNT(*) DESC, MIN(rowid) LIMIT 10")]
+    unique_klus = source.conn.execute("SELECT COUNT(DISTINCT kluId) FROM klus").fetchone()[0]
+    logger.log_global("Top 10 KLU", f"Found {unique_klus} unique KLUs")
+    
+    # 2. Total Gerai per Provinsi
+    gerai_per_provinsi = as_dict("SELECT c.provinceId, COUNT(*) FROM outlets o "
+                                 "LEFT JOIN cooperative c ON c.cooperative_id = o.cooperativeId "
+                                 "WHERE c.provinceId IS NOT NULL GROUP BY c.provinceId")
+    global_agg['gerai_per_provinsi'] = gerai_per_provinsi
+    logger.log_global("Gerai per provinsi", f"{len(gerai_per_provinsi)} provinces")
+    
+    # 3. Distribusi Jenis Layanan Kemitraan
+    service_dist = as_dict("SELECT business_partner_service_id, COUNT(*) FROM partnerships "
+                           "WHERE business_partner_service_id IS NOT NULL GROUP BY business_partner_service_id")
+    global_agg['service_distribution'] = service_dist
+    logger.log_global("Service distribution", f"{len(service_dist)} service types")
+    
+    # 4. Total Domains (global)
+    global_agg['total_domains'], global_agg['verified_domains'] = source.conn.execute(
+        "SELECT COUNT(*), COUNT(*) FILTER (WHERE verification_status = 'Verified') FROM domains").fetchone()
+    logger.log_global("Total domains", f"{global_agg['total_domains']:,}")
+    
+    # 5. Partnership Growth Rate (KPI_38): verified partnerships per month of created_at
+    monthly_counts = []
+    if 'created_at' in source.columns('partnerships'):
+        monthly_counts = [row[1] for row in source.conn.execute(
+            "SELECT strftime('%Y-%m', created_at / 1000000000, 'unixepoch') AS month, COUNT(*) FROM partnerships "
+            "WHERE status = 'Verified' AND created_at IS NOT NULL GROUP BY month ORDER BY month")]
+    global_agg['partnership_growth_rate'] = monthly_growth_rate(np.array(monthly_counts, dtype='int64'))
+    logger.log_global("Partnership growth rate", f"{global_agg['partnership_growth_rate']:.4f}")
+    
+    # 6. Regional cooperative counts (KPI_02, KPI_03, KPI_08)
+    for name, column in [('coops_per_province', 'provinceId'), ('coops_per_district', 'districtId'),
+                         ('coops_per_village', 'villageId')]:
+        global_agg[name] = as_dict(f"SELECT {column}, COUNT(*) FROM cooperative "
+                                   f"WHERE {column} IS NOT NULL GROUP BY {column}")
+    logger.log_global("Cooperatives per province", f"{len(global_agg['coops_per_province'])} provinces")
+    logger.log_global("Cooperatives per district", f"{len(global_agg['coops_per_district'])} districts")
+    
+    # 7. Koperasi per Desa per subdistrict (KPI_47): cooperatives / villages with cooperatives, capped 1-3
+    subdistricts = source.query(
+        "SELECT provinceId, districtId, subdistrictId, COUNT(*) AS coops, COUNT(DISTINCT villageId) AS villages "
+        "FROM cooperative WHERE provinceId IS NOT NULL AND districtId IS NOT NULL AND subdistrictId IS NOT NULL "
+        "GROUP BY provinceId, districtId, subdistrictId")
+    koperasi_per_desa = (subdistricts['coops'] / subdistricts['villages'].where(subdistricts['villages'] > 0)).clip(1.0, 3.0)
+    keys = zip(subdistricts['provinceId'], subdistricts['districtId'], subdistricts['subdistrictId'])
+    global_agg['koperasi_per_desa'] = dict(zip(keys, koperasi_per_desa.fillna(1.0)))
+    logger.log_global("Koperasi per desa", f"{len(global_agg['koperasi_per_desa'])} subdistricts")
+    
+    # 8. GeoSpatial completeness points per village (KPI_49); outlets count in their cooperative's village
+    parts = []
+    for key, fields in GEO_COMPLETENESS_FIELDS.items():
+        present = [field for field in fields if field in source.columns(key)]
+        if not present:
+            continue
+        filled = " + ".join(f"(t.{field} IS NOT NULL AND t.{field} != '')" for field in present)
+        if key == 'outlets':
+            village, join = "c.villageId", "JOIN cooperative c ON c.cooperative_id = t.cooperativeId"
+        else:
+            village, join = "t.villageId", ""
+        parts.append(f"SELECT {village} AS villageId, SUM({filled}) AS filled, COUNT(*) * {len(fields)} AS total "
+                     f"FROM {key} t {join} WHERE {village} IS NOT NULL GROUP BY {village}")
+    points = pd.DataFrame(columns=['villageId', 'filled', 'total'])
+    if parts:
+        points = source.query(f"SELECT villageId, SUM(filled) AS filled, SUM(total) AS total "
+                              f"FROM ({' UNION ALL '.join(parts)}) GROUP BY villageId")
+    global_agg['geo_filled_points'] = dict(zip(points['villageId'], points['filled']))
+    global_agg['geo_total_points'] = dict(zip(points['villageId'], points['total']))
+    logger.log_global("GeoSpatial completeness", f"{len(points)} villages")
+    
+    return global_agg
+
+def build_fact_coop_sqlite(source):
+    """FACT_COOP from one GROUP BY per child table, also kept as the temp table fact_coop (rowid = cooperative rowid)."""
+    def count_where(table, condition, required):
+        return f"COUNT(*) FILTER (WHERE {condition})" if required <= source.columns(table) else "0"
+    
+    def flag(column, value):
+        return f"IFNULL(c.{column} = '{value}', 0)" if column in source.columns('cooperative') else "0"
+    
+    pengurus = _sql_list(PENGURUS_ROLES)
+    role = _management_role_column(source.columns('management'))
+    if role is not None:
+        role_mask = " + ".join(f"(COUNT(*) FILTER (WHERE {role} = '{role_name}') > 0) * {1 << bit}"
+                               for bit, role_name in enumerate(PENGURUS_ROLES))
+        female_pengurus = count_where('management', f"{role} IN {pengurus} AND gender = 'Perempuan'", {'gender'})
+        management = (f"SELECT cooperativeId, COUNT(*) FILTER (WHERE {role} IN {pengurus}) AS pengurus, "
+                      f"COUNT(*) FILTER (WHERE {role} = 'Pengawas') AS pengawas, {female_pengurus} AS female_pengurus, "
+                      f"{role_mask} AS role_mask FROM management GROUP BY cooperativeId")
+    else:
+        management = "SELECT NULL AS cooperativeId, 0 AS pengurus, 0 AS pengawas, 0 AS female_pengurus, 0 AS role_mask"
+    partnership_hours = "0 AS process_seconds_sum, 0 AS process_seconds_count"
+    if {'created_at', 'updated_at'} <= source.columns('partnerships'):
+        # KPI_53: whole seconds from created_at to updated_at, only when positive, capped at 72 hours
+        seconds = "(updated_at - created_at) / 1000000000"
+        partnership_hours = (f"IFNULL(SUM(MIN({seconds}, {PROCESS_SECONDS_CAP})) FILTER (WHERE {seconds} > 0), 0) "
+                             f"AS process_seconds_sum, COUNT(*) FILTER (WHERE {seconds} > 0) AS process_seconds_count")
+    children = {
+        'm': f"""SELECT cooperativeId, COUNT(*) AS members,
+                        {count_where('members', "gender = 'PEREMPUAN'", {'gender'})} AS female_members,
+                        {count_where('members', "bi_checking_verification = 'Lancar'", {'bi_checking_verification'})} AS lancar_members,
+                        SUM(principal_saving) AS principal_saving_sum, SUM(mandatory_saving) AS mandatory_saving_sum
+                 FROM members GROUP BY cooperativeId""",
+        'r': management,
+        'o': f"""SELECT cooperativeId, COUNT(*) AS outlets,
+                        {count_where('outlets', 'primary_image IS NOT NULL', {'primary_image'})} AS outlets_with_photo
+                 FROM outlets GROUP BY cooperativeId""",
+        'k': "SELECT cooperativeId, COUNT(*) AS klu_rows, COUNT(DISTINCT kluId) AS distinct_klus FROM klus GROUP BY cooperativeId",
+        'p': f"""SELECT cooperativeId, COUNT(*) AS partnerships,
+                        COUNT(*) FILTER (WHERE status = 'Verified') AS verified_partnerships,
+                        COUNT(*) FILTER (WHERE status = 'Rejected') AS rejected_partnerships,
+                        COUNT(*) FILTER (WHERE status IN ('Requested', 'InReview', 'In Progress')) AS in_progress_partnerships,
+                        {partnership_hours}
+                 FROM partnerships GROUP BY cooperativeId""",
+    }
+    child_columns = {
+        'm': ['members', 'female_members', 'lancar_members', 'principal_saving_sum', 'mandatory_saving_sum'],
+        'r': ['pengurus', 'pengawas', 'female_pengurus', 'complete_structures'],
+        'o': ['outlets', 'outlets_with_photo'],
+        'k': ['klu_rows'],
+        'p': ['partnerships', 'verified_partnerships', 'rejected_partnerships', 'in_progress_partnerships',
+              'process_seconds_sum', 'process_seconds_count'],
+    }
+    # Child table facts only on the first row of a cooperative_id, like build_fact_coop
+    expressions = {name: f"IIF(c.first_row, IFNULL({alias}.{name}, 0), 0)"
+                   for alias, names in child_columns.items() for name in names}
+    expressions.update({
+        'capital_sum': "c.capital",
+        'new_coops': flag('registration_type', 'Pendaftaran Baru'),
+        'mandiri_coops': flag('filling_method', 'Mandiri'),
+        # A cooperative has a complete structure when its role mask has Ketua, Sekretaris and Bendahara
+        'complete_structures': f"IFNULL(r.role_mask, 0) = {COMPLETE_STRUCTURE_MASK}",
+        'process_seconds_sum': "IIF(c.first_row, IFNULL(p.process_seconds_sum, 0), 0)",
+        'distinct_klus': "IIF(c.first_row, IFNULL(k.distinct_klus, 0), 0)",
+        'role_mask': "IFNULL(r.role_mask, 0)",
+    })
+    keys = [col for col in FACT_COOP_KEY_COLUMNS if col in source.columns('cooperative')]
+    select = [f"c.{col}" for col in keys] + [f"{expressions[name]} AS {name}" for name in FACT_COOP_COLUMNS[len(FACT_COOP_KEY_COLUMNS):]]
+    joins = "\n".join(f"LEFT JOIN ({sql}) {alias} ON {alias}.cooperativeId = c.cooperative_id" for alias, sql in children.items())
+    # cooperative rows with their rowid and whether they are the first row of their cooperative_id (indexed lookup)
+    cooperative = ("(SELECT *, rowid AS coop_row, rowid = (SELECT MIN(d.rowid) FROM cooperative d "
+                   "WHERE d.cooperative_id IS cooperative.cooperative_id) AS first_row FROM cooperative)")
+    
+    with logger.stage("build_fact_coop", rows=source.rows['cooperative']):
+        source.conn.execute("DROP TABLE IF EXISTS temp.fact_coop")
+        source.conn.execute(f"CREATE TEMP TABLE fact_coop AS SELECT {', '.join(select)} FROM {cooperative} c\n{joins}\nORDER BY c.coop_row")
+        source.conn.execute("CREATE INDEX temp.fact_coop_cooperative_id ON fact_coop (cooperative_id)")
+        fact_coop = source.query("SELECT * FROM fact_coop")
+    return fact_coop
+
+# Village code temp tables: distinct (village_id, code) pairs, cooperatives with their codes and
+# the distinct (cooperative_id, code) pairs that attach child rows to a code
+SQLITE_CODE_TABLES = """
+DROP TABLE IF EXISTS temp.village_code;
+DROP TABLE IF EXISTS temp.coop_code;
+DROP TABLE IF EXISTS temp.coop_code_pair;
+CREATE TEMP TABLE village_code AS SELECT DISTINCT village_id, code FROM villages;
+CREATE INDEX temp.village_code_village_id ON village_code (village_id);
+CREATE TEMP TABLE coop_code AS
+    SELECT c.rowid AS coop_row, c.cooperative_id, c.villageId, v.code
+    FROM cooperative c JOIN village_code v ON v.village_id = c.villageId;
+CREATE TEMP TABLE coop_code_pair AS SELECT DISTINCT cooperative_id, code FROM coop_code;
+CREATE INDEX temp.coop_code_pair_cooperative_id ON coop_code_pair (cooperative_id);
+"""
+
+def village_tallies_sqlite(source, global_agg, village_geo, distinct_count=DEFAULT_DISTINCT_COUNT):
+    """village_tallies computed with GROUP BY queries over the SQLite tables (after build_fact_coop_sqlite)."""
+    source.conn.executescript(SQLITE_CODE_TABLES)
+    first_village = source.query("SELECT code AS _code, village_id AS _first_village_id FROM villages "
+                                 "WHERE rowid IN (SELECT MIN(rowid) FROM villages GROUP BY code) ORDER BY rowid")
+    
+    # --- Per-cooperative sums (KPI_01, KPI_04 to KPI_07, KPI_09 to KPI_24, KPI_27, KPI_33 to KPI_40, KPI_53) ---
+    with logger.stage("reduce_fact_coop", rows=source.rows['cooperative']):
+        # FACT_COOP_CODE_ROW_SUMS add up the code's own cooperative rows, the other sums every row
+        # of each distinct cooperative_id in the code (child facts only sit on an id's first row)
+        row_sums = ", ".join(f"SUM(f.{name}) AS {name}" for name in FACT_COOP_CODE_ROW_SUMS)
+        id_sums = ", ".join(f"SUM(f.{name}) AS {name}" for name in FACT_COOP_ID_SUMS)
+        by_code = source.query(f"SELECT cc.code AS _code, COUNT(*) AS coops, COUNT(DISTINCT cc.villageId) AS coop_villages, "
+                               f"{row_sums} FROM coop_code cc JOIN fact_coop f ON f.rowid = cc.coop_row "
+                               f"GROUP BY cc.code").set_index('_code')
+        by_code = by_code.join(source.query(f"SELECT p.code AS _code, COUNT(*) AS coop_rows, {id_sums} FROM coop_code_pair p "
+                                            f"JOIN fact_coop f ON f.cooperative_id = p.cooperative_id "
+                                            f"GROUP BY p.code").set_index('_code'))
+    
+    # Village rows to emit, in DIM_GEOGRAPHY order
+    geo = village_geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id', 'village_id']]
+    geo = geo.rename(columns={'village_id': '_code'})
+    geo = geo.merge(first_village, on='_code', how='inner')
+    geo = geo[geo['_code'].isin(by_code.index)].reset_index(drop=True)
+    
+    code = geo['_code']
+    first_village_id = geo['_first_village_id']
+    code_keys = pd.Series(geo['geo_key'].to_numpy(), index=code.to_numpy())
+    village_keys = pd.Series(geo['geo_key'].to_numpy(), index=first_village_id.to_numpy())
+    
+    def per_code(values, default=0):
+        return code.map(values).fillna(default).to_numpy()
+    
+    def per_village(values, default=0):
+        return first_village_id.map(values).fillna(default).to_numpy()
+    
+    def tally(sql, key, keys, columns, params=()):
+        return _keyed(source.query(sql, params), key, keys)[['_geo_key'] + columns]
+    
+    sums = dict.fromkeys(KPI_TALLY_SUMS, 0)
+    for name in ['coops', 'coop_rows', 'coop_villages'] + FACT_COOP_SUMS:
+        sums[name] = per_code(by_code[name])
+    
+    # --- Dimension keys (first matching row in source table order) ---
+    coop_pair = "JOIN coop_code_pair p ON p.cooperative_id = t.cooperativeId"
+    village_pair = "JOIN village_code p ON p.village_id = t.villageId"
+    firsts = {}
+    for name, table, column, join in [('outlet_id', 'outlets', 'cooperative_outlet_id', coop_pair),
+                                      ('business_partner_service_id', 'partnerships', 'business_partner_service_id', coop_pair),
+                                      ('upkdk_id', 'upkdk', 'upkdk_id', village_pair),
+                                      ('klu_id', 'klus', 'kluId', coop_pair)]:
+        # The bare column of a MIN() aggregate comes from the row holding the minimum
+        firsts[name] = tally(f"SELECT p.code AS _code, MIN(t.rowid) - 1 AS _pos, t.{column} AS value "
+                             f"FROM {table} t {join} GROUP BY p.code", '_code', code_keys, ['_pos', 'value'])
+    histograms, distinct = {}, {}
+    counter = DISTINCT_COUNTERS[distinct_count]
+    
+    # --- Outlet type histogram (KPI_22) ---
+    with logger.stage("calculate_outlet_kpis", rows=len(geo)):
+        histograms['outlet_type'] = tally(
+            f"SELECT p.code AS _code, t.cooperative_type_id AS value, COUNT(*) AS count FROM outlets t {coop_pair} "
+            f"WHERE t.cooperative_type_id IS NOT NULL GROUP BY p.code, t.cooperative_type_id",
+            '_code', code_keys, ['value', 'count'])
+    
+    # --- KLU distinct counts and sectors (KPI_28 to KPI_30, KPI_32) ---
+    with logger.stage("calculate_klu_kpis", rows=len(geo)):
+        pairs = tally(f"SELECT DISTINCT p.code AS _code, t.kluId AS value FROM klus t {coop_pair} "
+                      f"WHERE t.kluId IS NOT NULL", '_code', code_keys, ['value'])
+        distinct['klu'] = counter.from_pairs(pairs['_geo_key'].to_numpy(), pairs['value'].to_numpy())
+        top_10_klu = [int(klu) for klu in global_agg['top_10_klu']]
+        pairs = tally(f"SELECT DISTINCT p.code AS _code, t.cooperativeId AS value FROM klus t {coop_pair} "
+                      f"WHERE t.kluId IN ({', '.join('?' * len(top_10_klu))})", '_code', code_keys, ['value'], top_10_klu)
+        distinct['top_10_klu_coops'] = counter.from_pairs(pairs['_geo_key'].to_numpy(), pairs['value'].to_numpy())
+        histograms['klu_sector'] = tally(
+            f"SELECT p.code AS _code, d.sector AS value, COUNT(*) AS count FROM klus t {coop_pair} "
+            f"JOIN dim_klu d ON d.kluId = t.kluId WHERE d.sector IS NOT NULL GROUP BY p.code, d.sector",
+            '_code', code_keys, ['value', 'count'])
+    
+    # --- UPKDK tallies (KPI_41 to KPI_44, KPI_54), keyed on the first matching village_id ---
+    with logger.stage("calculate_upkdk_kpis", rows=len(geo)):
+        upkdk_columns = source.columns('upkdk')
+        counts = ["COUNT(*) AS upkdk"] + [
+            f"COUNT(*) FILTER (WHERE {column} = '{value}') AS {name}"
+            for name, column, value in [('upkdk_internet', 'internet_access', 'Ada'),
+                                        ('upkdk_good_building', 'building_condition', 'Baik'),
+                                        ('upkdk_water_electricity', 'water_electricity', 'Ya')]
+            if column in upkdk_columns]
+        by_village = source.query(f"SELECT villageId, {', '.join(counts)} FROM upkdk "
+                                  f"WHERE villageId IS NOT NULL GROUP BY villageId").set_index('villageId')
+        for name in by_village.columns:
+            sums[name] = per_village(by_village[name])
+        if 'type' in upkdk_columns:
+            histograms['upkdk_type'] = tally(
+                "SELECT villageId, type AS value, COUNT(*) AS count FROM upkdk "
+                "WHERE villageId IS NOT NULL AND type IS NOT NULL GROUP BY villageId, type",
+                'villageId', village_keys, ['value', 'count'])
+        else:
+            histograms['upkdk_type'] = _empty_tally('value', 'count')
+    
+    # --- Geography tallies (KPI_08, KPI_48, KPI_49) ---
+    with logger.stage("calculate_geo_kpis", rows=len(geo)):
+        population_columns = [col for col in ['total_u17', 'total_a17'] if col in source.columns('villages')]
+        village_rows = source.query(f"SELECT {', '.join(['village_id'] + population_columns)} FROM villages "
+                                    f"WHERE rowid IN (SELECT MIN(rowid) FROM villages GROUP BY village_id)")
+        population = pd.Series(0, index=village_rows['village_id'].to_numpy(), dtype='float64')
+        for column in population_columns:
+            population = population + pd.to_numeric(village_rows[column], errors='coerce').to_numpy()
+        coops_in_village = pd.Series(per_village(global_agg['coops_per_village']))
+        village_population = pd.Series(per_village(population, default=np.nan))
+        populated = village_population > 0
+        sums['populated_coops'] = coops_in_village.where(populated, 0).to_numpy()
+        sums['population'] = village_population.where(populated, 0).to_numpy()
+        sums['village_mergers'] = per_village(dict(source.conn.execute(
+            "SELECT village_id, COUNT(*) FROM village_mergers GROUP BY village_id").fetchall()))
+        sums['geo_filled_points'] = per_village(global_agg['geo_filled_points'])
+        sums['geo_total_points'] = per_village(global_agg['geo_total_points'])
+    
+    sums = pd.DataFrame(sums, index=pd.Index(geo['geo_key'].to_numpy(), name='geo_key'))
+    sums = sums.astype(dict.fromkeys(MONEY_TALLY_SUMS, 'int64'))
+    geo = geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id']]
+    return KpiTallies(sums, firsts, histograms, distinct), geo
+
+def generate_fact_rows_sqlite(source, data, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                              rollups=False, distinct_count=DEFAULT_DISTINCT_COUNT):
+    """Compute all village FACT_KPI rows (plus their rollups with rollups=True) from GROUP BY queries."""
+    logger.log("INFO", f"SQLite engine: aggregating {len(village_geo):,} villages...")
+    tallies, geo = village_tallies_sqlite(source, global_agg, village_geo, distinct_count)
+    facts = facts_from_tallies(tallies, geo, date_key, global_agg, district_code_to_id, subdistrict_code_to_id)
+    logger.log("INFO", f"SQLite engine: {len(facts):,} villages with cooperatives", "success")
+    
+    if rollups:
+        facts = append_rollup_rows(facts, tallies, data['dim_geography'], date_key, global_agg,
+                                   district_code_to_id, subdistrict_code_to_id)
+    return facts
+
+# ============================================================================
+# MAIN PROCESSING
+# ============================================================================
+
+def get_latest_date_key(data):
+    """Return the latest week-level date_key from DIM_PERIOD."""
+    latest_period = data['dim_period'][
+        (data['dim_period']['week'].notna()) & 
+        (data['dim_period']['month'].notna())
+    ].sort_values('date_key', ascending=False).iloc[0]
+    date_key = int(latest_period['date_key'])
+    logger.log("INFO", f"Using date_key: {date_key} ({latest_period['period_st']} to {latest_period['period_end_date']})")
+    return date_key
+
+def create_code_mappings(data):
+    """Map DIM_GEOGRAPHY district/subdistrict codes to the internal IDs used by cooperative.csv."""
+    # DIM_GEOGRAPHY uses district.code (e.g., "11.05"), cooperative uses district.district_id (integer)
+    district_code_to_id = {}
+    if 'districts' in data:
+        for _, row in data['districts'].iterrows():
+            code = row['code']  # Keep as float to match DIM_GEOGRAPHY (which is also float)
+            district_code_to_id[code] = row['district_id']
+        logger.log("INFO", f"Created district code-to-ID mapping: {len(district_code_to_id):,} districts")
+    
+    # DIM_GEOGRAPHY uses subdistrict.code (string like "11.05.07"), cooperative uses subdistrict_id (integer)
+    subdistrict_code_to_id = {}
+    if 'subdistricts' in data:
+        for _, row in data['subdistricts'].iterrows():
+            code = str(row['code'])  # Keep as string
+            subdistrict_code_to_id[code] = row['subdistrict_id']
+        logger.log("INFO", f"Created subdistrict code-to-ID mapping: {len(subdistrict_code_to_id):,} subdistricts")
+    
+    return district_code_to_id, subdistrict_code_to_id
+
+class VillageProfiler:
+    """cProfile of an evenly spaced sample of the villages handled by the loop engine."""
+    
+    def __init__(self, total_villages, sample_size):
+        step = max(total_villages // max(sample_size, 1), 1)
+        self.positions = set(range(1, total_villages + 1, step)[:sample_size])
+        self.profile = cProfile.Profile()
+        self.sampled = 0
+    
+    @contextmanager
+    def village(self, position):
+        """Profile the block if position (1-based, in village_geo order) is sampled."""
+        if position not in self.positions:
+            yield
+            return
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            self.sampled += 1
+    
+    def dump(self, filepath, top=PROFILE_TOP_FUNCTIONS):
+        """Write the pstats file and return the top functions by cumulative time as text."""
+        self.profile.dump_stats(filepath)
+        summary = io.StringIO()
+        pstats.Stats(self.profile, stream=summary).sort_stats('cumulative').print_stats(top)
+        return summary.getvalue()
+
+def generate_fact_rows_loop(data, mappings, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                            on_progress=None, profiler=None):
+    """Compute village FACT_KPI rows one village at a time.
+    
+    on_progress, if given, receives the number of villages handled so far
+    instead of the rows being logged (used by parallel workers).
+    profiler, a VillageProfiler, runs cProfile over its sampled villages.
+    """
+    coop_index = mappings['coop_index']
+    village_codes = mappings['village_codes']
+    village_index = mappings['village_index']
+    total_villages = len(village_geo)
+    fact_data = []
+    
+    for idx, (_, geo_row) in enumerate(village_geo.iterrows(), 1):
+        with profiler.village(idx) if profiler is not None else nullcontext():
+            geo_key = geo_row['geo_key']
+            province_id = geo_row['province_id']
+            district_id = geo_row['district_id']
+            subdistrict_id = geo_row['subdistrict_id']
+            village_code = geo_row['village_id']  # This is the code from DIM_GEOGRAPHY
+            
+            # Find ALL village_ids with this code (codes are duplicated) and the
+            # cooperatives of ANY of these village_ids
+            matching_village_ids, village_coop_ids = village_codes.lookup(village_code)
+            
+            if len(matching_village_ids) == 0:
+                # Skip if village code not found in villages.csv
+                continue
+            
+            # Skip if no cooperatives
+            if len(village_coop_ids) == 0:
+                continue
+            
+            # Initialize row
+            row = {
+                'date_key': date_key,
+                'geo_key': geo_key,
+            }
+            
+            # Get district and subdistrict internal IDs for KPI calculations
+            # district_id is already float in DIM_GEOGRAPHY, no need to convert
+            district_id_internal = district_code_to_id.get(district_id) if pd.notna(district_id) else None
+            
+            # subdistrict_id is string in DIM_GEOGRAPHY
+            subdistrict_id_str = str(subdistrict_id) if pd.notna(subdistrict_id) else None
+            subdistrict_id_internal = subdistrict_code_to_id.get(subdistrict_id_str) if subdistrict_id_str else None
+            
+            # Get dimension keys
+            # outlet_id: first outlet in village
+            village_outlets = coop_index.rows_for('outlets', village_coop_ids)
+            row['outlet_id'] = village_outlets['cooperative_outlet_id'].iloc[0] if len(village_outlets) > 0 else 0
+            
+            # business_partner_service_id: first partnership service
+            village_partnerships = coop_index.rows_for('partnerships', village_coop_ids)
+            row['business_partner_service_id'] = village_partnerships['business_partner_service_id'].iloc[0] if len(village_partnerships) > 0 else 0
+            
+            # upkdk_id: first UPKDK in village (use first matching village_id)
+            village_upkdk = village_index.rows_for('upkdk', matching_village_ids)
+            row['upkdk_id'] = village_upkdk['upkdk_id'].iloc[0] if len(village_upkdk) > 0 else 0
+            
+            # klu_id: first KLU from village cooperatives
+            village_klus = coop_index.rows_for('klus', village_coop_ids)
+            row['klu_id'] = village_klus['kluId'].iloc[0] if len(village_klus) > 0 else 0
+            
+            # Calculate all KPIs (use first matching village_id for geo and upkdk KPIs)
+            first_village_id = matching_village_ids[0]
+            row.update(calculate_cooperative_kpis(village_coop_ids, coop_index, global_agg, province_id, district_id, district_id_internal))
+            row.update(calculate_geo_kpis(first_village_id, village_index, global_agg, province_id, district_id_internal, subdistrict_id_internal))
+            row.update(calculate_member_kpis(village_coop_ids, coop_index))
+            row.update(calculate_management_kpis(village_coop_ids, mappings['management_roles']))
+            row.update(calculate_outlet_kpis(village_coop_ids, coop_index, global_agg, province_id))
+            row.update(calculate_klu_kpis(village_coop_ids, data, coop_index, global_agg))
+            row.update(calculate_partnership_kpis(village_coop_ids, coop_index, global_agg))
+            row.update(calculate_upkdk_kpis(first_village_id, village_index))
+            row.update(calculate_domain_kpis(global_agg))
+            
+            fact_data.append(row)
+        
+        # Log progress every 50 villages
+        if idx % 50 == 0 or idx == total_villages:
+            if on_progress is not None:
+                on_progress(idx)
+            else:
+                logger.log_progress(idx, total_villages, f"geo_key: {geo_key}")
+    
+    return pd.DataFrame(fact_data)
+
+# ============================================================================
+# PARALLEL PROCESSING
+# ============================================================================
+# Village rows are split into province (or district) shards and processed by
+# the loop engine in a process pool. With the 'fork' start method the source
+# frames are inherited copy-on-write from the parent; otherwise they are sent
+# once per worker through the pool initializer, never once per task.
+
+_WORKER_STATE = {}
+
+def _init_worker(state, counter):
+    """Process pool initializer: keep the shared state and progress counter."""
+    if state is not None:
+        _WORKER_STATE.update(state)
+    _WORKER_STATE['counter'] = counter
+
+def _run_shard(positions):
+    """Process one shard of village_geo positions inside a worker."""
+    state = _WORKER_STATE
+    counter = state['counter']
+    reported = [0]
+    
+    def on_progress(done):
+        with counter.get_lock():
+            counter.value += done - reported[0]
+        reported[0] = done
+    
+    # Stage metrics of this shard only (a forked worker starts with the parent's)
+    logger.step_times = {}
+    shard_geo = state['village_geo'].iloc[positions]
+    rows = generate_fact_rows_loop(
+        state['data'], state['mappings'], state['global_agg'], state['date_key'], shard_geo,
+        state['district_code_to_id'], state['subdistrict_code_to_id'], on_progress=on_progress)
+    # Villages skipped at the end of the shard still count as processed
+    on_progress(len(positions))
+    return rows, logger.step_times
+
+def generate_fact_rows_parallel(data, mappings, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                workers, shard_by="province"):
+    """Run the loop engine over geography shards in a process pool."""
+    village_geo = village_geo.reset_index(drop=True)
+    shard_column = SHARD_LEVELS[shard_by]
+    # Largest shards first so the pool finishes evenly
+    shards = sorted(village_geo.groupby(shard_column, sort=False, dropna=False).indices.values(),
+                    key=len, reverse=True)
+    total_villages = len(village_geo)
+    logger.log("INFO", f"Parallel run: {len(shards):,} {shard_by} shards on {workers} workers")
+    
+    state = {
+        'data': data,
+        'mappings': mappings,
+        'global_agg': global_agg,
+        'date_key': date_key,
+        'village_geo': village_geo,
+        'district_code_to_id': district_code_to_id,
+        'subdistrict_code_to_id': subdistrict_code_to_id,
+    }
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Forked workers inherit _WORKER_STATE copy-on-write, nothing is pickled
+        context = multiprocessing.get_context('fork')
+        _WORKER_STATE.update(state)
+        init_state = None
+    else:
+        context = multiprocessing.get_context('spawn')
+        init_state = state
+    counter = context.Value('q', 0)
+    
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(init_state, counter)) as pool:
+            futures = [pool.submit(_run_shard, positions) for positions in shards]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=PROGRESS_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                finished = len(futures) - len(pending)
+                logger.log_progress(counter.value, total_villages, f"({finished}/{len(futures)} shards done)")
+            results = [future.result() for future in futures]
+    finally:
+        _WORKER_STATE.clear()
+    
+    # KPI family metrics of the workers add up to worker-seconds
+    for _, step_times in results:
+        logger.merge_steps(step_times)
+    frames = [frame for frame, _ in results]
+    
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    
+    # Merge shards back into DIM_GEOGRAPHY order, same as a single-process run
+    df = pd.concat(frames, ignore_index=True)
+    geo_order = pd.Series(np.arange(total_villages), index=village_geo['geo_key'])
+    df = df.iloc[np.argsort(df['geo_key'].map(geo_order).to_numpy(), kind='stable')]
+    return df.reset_index(drop=True)
+
+# ============================================================================
+# MULTI-PERIOD PROCESSING
+# ============================================================================
+# Facts for every requested DIM_PERIOD row in one run. The snapshot of a
+# period holds the rows created before its period_end; rows with an
+# unparseable created_at are always present, which keeps the latest period
+# identical to a regular single-snapshot run. Periods are swept in
+# chronological order, so every time-stamped row only needs the index of the
+# first period holding it (its bucket): PeriodSweep folds each bucket's rows
+# into running village tallies and global aggregates, and every period's
+# FACT_KPI rows are derived from those running totals by facts_from_tallies.
+# A row that only counts through another one (a child row through its
+# cooperative, an outlet through the cooperative placing it in a village)
+# counts from the later of the two buckets.
+
+def period_grains(dim_period):
+    """Return the DIM_PERIOD level (year/quarter/month/week) of every row."""
+    return np.select([dim_period['week'].notna(), dim_period['month'].notna(), dim_period['quarter'].notna()],
+                     ['week', 'month', 'quarter'], 'year')
+
+def select_periods(dim_period, grains=PERIOD_GRAINS, years=None):
+    """Select DIM_PERIOD rows of the requested grains (and year range), ordered by end date."""
+    periods = dim_period.copy()
+    periods['grain'] = period_grains(periods)
+    periods = periods[periods['grain'].isin(grains)]
+    if years is not None:
+        periods = periods[periods['year'].between(years[0], years[1])]
+    periods['period_end'] = pd.to_datetime(periods['period_end_date']) + pd.Timedelta(days=1)
+    return periods.sort_values(['period_end', 'date_key'], kind='stable').reset_index(drop=True)
+
+class PeriodLookup:
+    """Sorted DIM_PERIOD boundaries that map timestamps to date_keys at every grain.
+    
+    The start and (exclusive) end of every period cut the timeline into elementary
+    intervals. One searchsorted over those boundaries finds the interval of each
+    timestamp, and a table per grain holds the date_key covering that interval.
+    """
+    
+    def __init__(self, dim_period, grains=PERIOD_GRAINS):
+        grain_of = period_grains(dim_period)
+        starts = pd.to_datetime(dim_period['period_st']).to_numpy(dtype='datetime64[ns]').astype('int64')
+        ends = (pd.to_datetime(dim_period['period_end_date']) + pd.Timedelta(days=1)).to_numpy(
+            dtype='datetime64[ns]').astype('int64')
+        date_keys = dim_period['date_key'].to_numpy(dtype='int64')
+        
+        self.boundaries = np.unique(np.concatenate([starts, ends]))
+        interval_starts = self.boundaries[:-1]
+        self.tables = {}
+        for grain in grains:
+            mask = grain_of == grain
+            order = np.argsort(starts[mask], kind='stable')
+            grain_starts, grain_ends, grain_keys = starts[mask][order], ends[mask][order], date_keys[mask][order]
+            slot = np.searchsorted(grain_starts, interval_starts, side='right') - 1
+            covered = slot >= 0
+            covered[covered] = interval_starts[covered] < grain_ends[slot[covered]]
+            # Slot 0 is before the first boundary and the last slot after the last one
+            table = np.full(len(self.boundaries) + 1, -1, dtype='int64')
+            table[1:-1][covered] = grain_keys[slot[covered]]
+            self.tables[grain] = table
+    
+    def date_keys(self, timestamps):
+        """date_key per grain of every timestamp ({grain: int64 array}); -1 outside DIM_PERIOD or NaT."""
+        ns = epoch_ns(parse_timestamps(pd.Series(timestamps)))
+        slots = np.searchsorted(self.boundaries, ns, side='right')
+        slots[ns == NAT_EPOCH] = 0
+        return {grain: table[slots] for grain, table in self.tables.items()}
+
+FIRST_NONE = np.iinfo('int64').max  # Running first position of a slot without rows yet
+
+def period_buckets(table, period_ends):
+    """Index of the first period (of ascending period_ends) whose snapshot holds each row.
+    
+    len(period_ends) means no requested period holds the row. A missing
+    created_at (NAT_EPOCH) sorts before every period end, so such rows, like
+    every row of a table without created_at, are in bucket 0.
+    """
+    if 'created_at' not in table.columns:
+        return np.zeros(len(table), dtype='int64')
+    return np.searchsorted(period_ends, epoch_ns(table['created_at']), side='right').astype('int64')
+
+class RunningTotals:
+    """Per-slot totals of rows bucketed by period, advanced one period at a time.
+    
+    The rows are sorted by bucket once; advance(period) folds that bucket's
+    rows into the totals with ``ufunc`` (np.add for counts and sums,
+    np.minimum for first positions), so a sweep reads every row once.
+    """
+    
+    def __init__(self, buckets, slots, values, size, periods, ufunc=np.add, initial=0):
+        buckets = np.asarray(buckets, dtype='int64')
+        values = np.ones(len(buckets), dtype='int64') if values is None else np.asarray(values, dtype='int64')
+        values = values.reshape(len(buckets), -1)
+        order = np.argsort(buckets, kind='stable')
+        self.slots = np.asarray(slots, dtype='int64')[order]
+        self.values = values[order]
+        self.offsets = np.searchsorted(buckets[order], np.arange(periods + 1))
+        self.ufunc = ufunc
+        self.totals = np.full((size, values.shape[1]), initial, dtype='int64')
+    
+    def advance(self, period):
+        """Totals of ``period`` (call once per period, in order)."""
+        rows = slice(self.offsets[period], self.offsets[period + 1])
+        self.ufunc.at(self.totals, self.slots[rows], self.values[rows])
+        return self.totals
+
+class FirstSeenPairs:
+    """Distinct (slot, value) pairs sorted by the first bucket holding them: a period's pairs are a prefix."""
+    
+    def __init__(self, buckets, slots, values):
+        pairs = pd.DataFrame({'_bucket': np.asarray(buckets, dtype='int64'), '_slot': np.asarray(slots, dtype='int64'),
+                              'value': values.reset_index(drop=True)})
+        pairs = pairs.dropna(subset=['value']).sort_values('_bucket', kind='stable').drop_duplicates(['_slot', 'value'])
+        self.buckets = pairs['_bucket'].to_numpy()
+        self.slots = pairs['_slot'].to_numpy()
+        self.values = pairs['value'].to_numpy()
+    
+    def upto(self, period):
+        """Slots and values of the pairs present in ``period``."""
+        count = np.searchsorted(self.buckets, period, side='right')
+        return self.slots[:count], self.values[:count]
+
+class PeriodSweep:
+    """Village KpiTallies and global aggregates of every period snapshot, from running totals.
+    
+    Built once from the full tables (loaded with created_at). tallies(period),
+    called for the periods in order, returns what village_tallies and
+    calculate_global_aggregates return for that period's snapshot: the
+    KpiTallies, the DIM_GEOGRAPHY rows of the villages with cooperatives and
+    the global aggregates. Village slots are the DIM_GEOGRAPHY rows that have a
+    cooperative in some period.
+    """
+    
+    def __init__(self, data, periods, village_geo, distinct_count=DEFAULT_DISTINCT_COUNT, fact_coop=None):
+        self.count = len(periods)
+        period_ends = periods['period_end'].to_numpy(dtype='datetime64[ns]').view('int64')
+        self.buckets = {}
+        for name in TIME_AWARE_TABLES:
+            if 'created_at' not in data[name].columns:
+                logger.log("INFO", f"{name} has no created_at column, using all rows for every period", "info")
+            self.buckets[name] = period_buckets(data[name], period_ends)
+        self.counter = DISTINCT_COUNTERS[distinct_count]
+        self._village_tallies(data, village_geo, build_fact_coop(data) if fact_coop is None else fact_coop)
+        self._global_aggregates(data)
+    
+    def _running(self, buckets, slots, values=None, ufunc=np.add, initial=0, size=None):
+        return RunningTotals(buckets, slots, values, len(self.geo) if size is None else size, self.count, ufunc, initial)
+    
+    def _histogram(self, frame, column, buckets):
+        """Running row count per (slot, category) of a column, or None without the column."""
+        if column not in frame.columns:
+            return None
+        value_ids, values = pd.factorize(frame[column])
+        kept = value_ids >= 0
+        cells = frame['_slot'].to_numpy()[kept] * len(values) + value_ids[kept]
+        return self._running(buckets[kept], cells, size=len(self.geo) * len(values)), values
+    
+    def _village_tallies(self, data, village_geo, fact_coop):
+        """Running village tallies: each row counts from its bucket (or the later bucket of the row it needs)."""
+        buckets = self.buckets
+        villages = data['villages']
+        village_codes = villages[['village_id', 'code']].drop_duplicates()
+        village_codes = village_codes.rename(columns={'village_id': '_village_id', 'code': '_code'})
+        first_village = villages.drop_duplicates('code')[['code', 'village_id']]
+        first_village = first_village.rename(columns={'code': '_code', 'village_id': '_first_village_id'})
+        cooperative = _with_position(data['cooperative'], ['cooperative_id', 'villageId'])
+        cooperative['_bucket'] = buckets['cooperative']
+        coop_in_code = cooperative.merge(village_codes, left_on='villageId', right_on='_village_id', how='inner')
+        
+        # Village slots in DIM_GEOGRAPHY order
+        geo = village_geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id', 'village_id']]
+        geo = geo.rename(columns={'village_id': '_code'}).merge(first_village, on='_code', how='inner')
+        self.geo = geo[geo['_code'].isin(coop_in_code['_code'])].reset_index(drop=True)
+        slots = np.arange(len(self.geo))
+        code_slots = pd.DataFrame({'_code': self.geo['_code'].to_numpy(), '_slot': slots})
+        village_slots = pd.DataFrame({'_first_village_id': self.geo['_first_village_id'].to_numpy(), '_slot': slots})
+        
+        def per_village(frame, key):
+            return frame.merge(village_slots, left_on=key, right_on='_first_village_id', how='inner')
+        
+        # A cooperative_id counts towards a village code from the first bucket one of its rows sits there
+        coop_in_code = coop_in_code.merge(code_slots, on='_code', how='inner')
+        pairs = coop_in_code.groupby(['cooperative_id', '_slot'], dropna=False)['_bucket'].min()
+        pairs = pairs.rename('_pair_bucket').reset_index().rename(columns={'cooperative_id': '_coop_id'})
+        
+        def paired(frame, bucket_column='_bucket'):
+            frame = frame.merge(pairs, on='_coop_id', how='inner')
+            return frame, np.maximum(frame[bucket_column].to_numpy(), frame['_pair_bucket'].to_numpy())
+        
+        # --- Sums (KPI_TALLY_SUMS) ---
+        first_villages = coop_in_code.sort_values('_bucket', kind='stable').drop_duplicates(['_slot', 'villageId'])
+        self.sums = [
+            (self._running(coop_in_code['_bucket'], coop_in_code['_slot']), ['coops']),
+            (self._running(first_villages['_bucket'], first_villages['_slot']), ['coop_villages']),
+        ]
+        
+        # Cooperative row facts count for every code of their cooperative_id (see village_tallies)
+        row_sums = [name for name in FACT_COOP_ID_SUMS if name in FACT_COOP_ROW_FACTS]
+        rows = fact_coop[['cooperative_id'] + row_sums].rename(columns={'cooperative_id': '_coop_id'})
+        rows, row_buckets = paired(rows.assign(coop_rows=1, _bucket=buckets['cooperative']))
+        self.sums.append((self._running(row_buckets, rows['_slot'], rows[['coop_rows'] + row_sums]),
+                          ['coop_rows'] + row_sums))
+        
+        # Child table facts per (cooperative_id, bucket)
+        child_sums = [name for name in FACT_COOP_ID_SUMS if name not in FACT_COOP_ROW_FACTS]
+        
+        def bucket_keys(name):
+            table = data[name]
+            return [table['cooperativeId'], pd.Series(buckets[name], index=table.index, name='_bucket')]
+        
+        per_coop = cooperative_child_facts(data, bucket_keys)
+        child = pd.DataFrame({name: values for name, values in per_coop.items()
+                              if name in child_sums + ['role_mask'] and len(values) > 0})
+        child = child.reindex(columns=child_sums + ['role_mask']).fillna(0).astype('int64')
+        child = child.rename_axis(['_coop_id', '_bucket']).reset_index()
+        child_rows, child_buckets = paired(child)
+        self.sums.append((self._running(child_buckets, child_rows['_slot'], child_rows[child_sums]), child_sums))
+        
+        # KPI_17 counts the code's rows from the bucket the cooperative's structure is complete
+        role_buckets = [child.loc[(child['role_mask'] & (1 << bit)) > 0].groupby('_coop_id')['_bucket'].min()
+                        for bit in range(len(PENGURUS_ROLES))]
+        complete_bucket = pd.concat(role_buckets, axis=1).max(axis=1, skipna=False).dropna()
+        complete_rows = coop_in_code.assign(_complete=coop_in_code['cooperative_id'].map(complete_bucket))
+        complete_rows = complete_rows[complete_rows['_complete'].notna()]
+        self.sums.append((self._running(np.maximum(complete_rows['_bucket'], complete_rows['_complete']),
+                                        complete_rows['_slot']), ['complete_structures']))
+        
+        # Village tallies keyed on the code's first village_id
+        upkdk = data['upkdk'].reset_index(drop=True)
+        upkdk_rows = pd.DataFrame({'villageId': upkdk['villageId'], '_bucket': buckets['upkdk'], 'upkdk': 1})
+        upkdk_sums = ['upkdk']
+        for name, column, value in [('upkdk_internet', 'internet_access', 'Ada'),
+                                    ('upkdk_good_building', 'building_condition', 'Baik'),
+                                    ('upkdk_water_electricity', 'water_electricity', 'Ya')]:
+            if column in upkdk.columns:
+                upkdk_rows[name] = (upkdk[column] == value).to_numpy(dtype='int64')
+                upkdk_sums.append(name)
+        upkdk_rows = per_village(upkdk_rows, 'villageId')
+        mergers = per_village(pd.DataFrame({'village_id': data['village_mergers']['village_id'].to_numpy(),
+                                            '_bucket': buckets['village_mergers']}), 'village_id')
+        self.sums += [
+            (self._running(upkdk_rows['_bucket'], upkdk_rows['_slot'], upkdk_rows[upkdk_sums]), upkdk_sums),
+            (self._running(mergers['_bucket'], mergers['_slot']), ['village_mergers']),
+        ]
+        
+        # KPI_08 and KPI_49 (GeoSpatialDataCompletenessScore) per first village
+        population = self.geo['_first_village_id'].map(village_populations(villages))
+        populated = (population > 0).to_numpy()
+        self.population = np.where(populated, population, 0)
+        coop_rows = per_village(cooperative, 'villageId')
+        self.sums.append((self._running(coop_rows['_bucket'], coop_rows['_slot'], populated[coop_rows['_slot']]),
+                          ['populated_coops']))
+        for key, points in geo_completeness_rows(data):
+            point_buckets = buckets[key][points['_pos'].to_numpy()]
+            if '_coop_pos' in points.columns:
+                point_buckets = np.maximum(point_buckets, buckets['cooperative'][points['_coop_pos'].to_numpy()])
+            points = per_village(points.assign(_bucket=point_buckets), 'villageId')
+            self.sums.append((self._running(points['_bucket'], points['_slot'], points[['filled', 'total']]),
+                              ['geo_filled_points', 'geo_total_points']))
+        
+        # --- Dimension keys, histograms and distinct counts ---
+        def attached(name, columns):
+            rows = _attach_village_code(data[name], pairs, columns)
+            return rows, np.maximum(buckets[name][rows['_pos'].to_numpy()], rows['_pair_bucket'].to_numpy())
+        
+        outlets, outlet_buckets = attached('outlets', ['cooperative_outlet_id', 'cooperative_type_id'])
+        partnerships, partnership_buckets = attached('partnerships', ['business_partner_service_id'])
+        self.klus, self.klu_buckets = attached('klus', ['kluId'])
+        upkdk_codes = _with_position(upkdk, ['villageId', 'upkdk_id']).merge(
+            village_codes, left_on='villageId', right_on='_village_id', how='inner').merge(code_slots, on='_code')
+        self.firsts = {}
+        for name, frame, frame_buckets, table, column in [
+                ('outlet_id', outlets, outlet_buckets, 'outlets', 'cooperative_outlet_id'),
+                ('business_partner_service_id', partnerships, partnership_buckets, 'partnerships', 'business_partner_service_id'),
+                ('upkdk_id', upkdk_codes, buckets['upkdk'][upkdk_codes['_pos'].to_numpy()], 'upkdk', 'upkdk_id'),
+                ('klu_id', self.klus, self.klu_buckets, 'klus', 'kluId')]:
+            running = self._running(frame_buckets, frame['_slot'], frame['_pos'], np.minimum, FIRST_NONE)
+            self.firsts[name] = running, data[table][column].reset_index(drop=True)
+        
+        sectors = self.klus[['_slot', 'kluId']].assign(_bucket=self.klu_buckets).merge(
+            data['dim_klu'][['kluId', 'sector']], on='kluId', how='left')
+        upkdk_types = per_village(upkdk.assign(_bucket=buckets['upkdk']), 'villageId')
+        self.histograms = {
+            'outlet_type': self._histogram(outlets, 'cooperative_type_id', outlet_buckets),
+            'klu_sector': self._histogram(sectors, 'sector', sectors['_bucket'].to_numpy()),
+            'upkdk_type': self._histogram(upkdk_types, 'type', upkdk_types['_bucket'].to_numpy()),
+        }
+        self.klu_pairs = FirstSeenPairs(self.klu_buckets, self.klus['_slot'], self.klus['kluId'])
+        self.top_10_klu, self.top_klu_pairs = None, None
+    
+    def _global_aggregates(self, data):
+        """Running global counts behind calculate_global_aggregates."""
+        buckets = self.buckets
+        cooperative = data['cooperative']
+        coop_buckets = buckets['cooperative']
+        
+        def count_by(values, value_buckets):
+            value_ids, uniques = pd.factorize(values)
+            kept = value_ids >= 0
+            return self._running(value_buckets[kept], value_ids[kept], size=len(uniques)), uniques
+        
+        outlets = data['outlets'][['cooperativeId']].assign(_bucket=buckets['outlets']).merge(
+            cooperative[['cooperative_id', 'provinceId']].assign(_coop_bucket=coop_buckets),
+            left_on='cooperativeId', right_on='cooperative_id', how='inner')
+        self.global_counts = {
+            'coops_per_province': count_by(cooperative['provinceId'], coop_buckets),
+            'coops_per_district': count_by(cooperative['districtId'], coop_buckets),
+            'gerai_per_provinsi': count_by(outlets['provinceId'],
+                                           np.maximum(outlets['_bucket'].to_numpy(), outlets['_coop_bucket'].to_numpy())),
+            'service_distribution': count_by(data['partnerships']['business_partner_service_id'], buckets['partnerships']),
+        }
+        
+        # Top 10 KLU: value_counts order, i.e. by count and then by first occurrence
+        klu_ids, self.klu_values = pd.factorize(data['klus']['kluId'])
+        kept = np.flatnonzero(klu_ids >= 0)
+        klu_buckets = buckets['klus'][kept]
+        self.klu_counts = self._running(klu_buckets, klu_ids[kept], size=len(self.klu_values))
+        self.klu_firsts = self._running(klu_buckets, klu_ids[kept], kept, np.minimum, FIRST_NONE, size=len(self.klu_values))
+        
+        domains = data['domains']
+        verified = (domains['verification_status'] == 'Verified').to_numpy(dtype='int64')
+        self.domains = self._running(buckets['domains'], np.zeros(len(domains)),
+                                     np.column_stack([np.ones(len(domains), dtype='int64'), verified]), size=1)
+        
+        # KPI_38: verified partnerships per created_at month, in month order
+        partnerships = data['partnerships']
+        self.months = None
+        if 'created_at' in partnerships.columns:
+            verified = (partnerships['status'] == 'Verified').to_numpy()
+            created = partnerships.loc[verified, 'created_at']
+            month_ids, months = pd.factorize(created.dt.year * 12 + created.dt.month, sort=True)
+            kept = month_ids >= 0
+            self.months = self._running(buckets['partnerships'][verified][kept], month_ids[kept], size=len(months))
+        
+        # KPI_47: cooperatives and distinct villages per subdistrict
+        subdistricts = cooperative.groupby(['provinceId', 'districtId', 'subdistrictId'])
+        group_ids = subdistricts.ngroup()
+        kept = group_ids.notna().to_numpy()
+        group_ids = group_ids.to_numpy()[kept].astype('int64')
+        self.subdistricts = subdistricts.size().index
+        self.subdistrict_coops = self._running(coop_buckets[kept], group_ids, size=len(self.subdistricts))
+        villages = pd.DataFrame({'_group': group_ids, 'villageId': cooperative['villageId'].to_numpy()[kept],
+                                 '_bucket': coop_buckets[kept]}).dropna(subset=['villageId'])
+        villages = villages.sort_values('_bucket', kind='stable').drop_duplicates(['_group', 'villageId'])
+        self.subdistrict_villages = self._running(villages['_bucket'], villages['_group'], size=len(self.subdistricts))
+    
+    def _top_10_klu(self, period):
+        counts = self.klu_counts.advance(period)[:, 0]
+        firsts = self.klu_firsts.advance(period)[:, 0]
+        seen = np.flatnonzero(counts > 0)
+        top = seen[np.lexsort((firsts[seen], -counts[seen]))][:10]
+        return self.klu_values[top].tolist()
+    
+    def _global(self, period):
+        """Global aggregates (the ones facts_from_tallies reads) of ``period``."""
+        global_agg = {'top_10_klu': self._top_10_klu(period)}
+        for name, (running, uniques) in self.global_counts.items():
+            counts = running.advance(period)[:, 0]
+            present = np.flatnonzero(counts)
+            global_agg[name] = dict(zip(uniques[present], counts[present]))
+        global_agg['total_domains'], global_agg['verified_domains'] = (int(total) for total in self.domains.advance(period)[0])
+        global_agg['partnership_growth_rate'] = 0
+        if self.months is not None:
+            monthly_counts = self.months.advance(period)[:, 0]
+            global_agg['partnership_growth_rate'] = monthly_growth_rate(monthly_counts[monthly_counts > 0])
+        coops = self.subdistrict_coops.advance(period)[:, 0]
+        villages = self.subdistrict_villages.advance(period)[:, 0]
+        present = np.flatnonzero(coops)
+        koperasi_per_desa = pd.Series(coops[present] / np.where(villages[present] > 0, villages[present], np.nan))
+        global_agg['koperasi_per_desa'] = dict(zip(self.subdistricts[present], koperasi_per_desa.clip(1.0, 3.0).fillna(1.0)))
+        return global_agg
+    
+    def tallies(self, period):
+        """KpiTallies, DIM_GEOGRAPHY rows and global aggregates of the ``period``-th period's snapshot."""
+        totals = {}
+        for running, names in self.sums:
+            values = running.advance(period)
+            for position, name in enumerate(names):
+                totals[name] = totals.get(name, 0) + values[:, position]
+        has_coops = totals['coops'] > 0
+        emitted = np.flatnonzero(has_coops)
+        geo_keys = self.geo['geo_key'].to_numpy(dtype='int64')
+        
+        sums = dict.fromkeys(KPI_TALLY_SUMS, 0)
+        for name, values in totals.items():
+            sums[name] = values[emitted]
+        sums['population'] = self.population[emitted]
+        sums = pd.DataFrame(sums, index=pd.Index(geo_keys[emitted], name='geo_key'))
+        
+        firsts = {}
+        for name, (running, values) in self.firsts.items():
+            positions = running.advance(period)[:, 0]
+            found = emitted[positions[emitted] != FIRST_NONE]
+            firsts[name] = pd.DataFrame({'_geo_key': geo_keys[found], '_pos': positions[found],
+                                         'value': values.iloc[positions[found]].reset_index(drop=True)})
+        histograms = {}
+        for name, histogram in self.histograms.items():
+            if histogram is None:
+                histograms[name] = _empty_tally('value', 'count')
+                continue
+            running, values = histogram
+            counts = running.advance(period)[:, 0]
+            cells = np.flatnonzero(counts)
+            slots, value_ids = np.divmod(cells, len(values))
+            cells, slots, value_ids = cells[has_coops[slots]], slots[has_coops[slots]], value_ids[has_coops[slots]]
+            histograms[name] = pd.DataFrame({'_geo_key': geo_keys[slots], 'value': values[value_ids], 'count': counts[cells]})
+        
+        global_agg = self._global(period)
+        distinct = {}
+        slots, values = self.klu_pairs.upto(period)
+        distinct['klu'] = self.counter.from_pairs(geo_keys[slots], values)
+        if global_agg['top_10_klu'] != self.top_10_klu:
+            # The top 10 changes rarely once the KLU counts grow, so its pairs are rebuilt only then
+            top = self.klus['kluId'].isin(global_agg['top_10_klu']).to_numpy()
+            self.top_klu_pairs = FirstSeenPairs(self.klu_buckets[top], self.klus['_slot'][top], self.klus['cooperativeId'][top])
+            self.top_10_klu = global_agg['top_10_klu']
+        slots, values = self.top_klu_pairs.upto(period)
+        distinct['top_10_klu_coops'] = self.counter.from_pairs(geo_keys[slots], values)
+        
+        geo = self.geo.iloc[emitted][['geo_key', 'province_id', 'district_id', 'subdistrict_id']].reset_index(drop=True)
+        return KpiTallies(sums, firsts, histograms, distinct), geo, global_agg
+
+def generate_fact_rows_multi_period(data, periods, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                    rollups=False, distinct_count=DEFAULT_DISTINCT_COUNT, fact_coop=None):
+    """Compute village FACT_KPI rows (and their rollups) for every period in ``periods`` in one chronological sweep."""
+    with logger.stage("period_sweep", rows=len(data['cooperative'])):
+        sweep = PeriodSweep(data, periods, village_geo, distinct_count, fact_coop)
+    
+    frames = []
+    total_periods = len(periods)
+    for idx, period in enumerate(periods.itertuples(index=False)):
+        tallies, geo, global_agg = sweep.tallies(idx)
+        rows = pd.DataFrame()
+        if len(geo) > 0:
+            with logger.quiet():
+                rows = facts_from_tallies(tallies, geo, int(period.date_key), global_agg,
+                                          district_code_to_id, subdistrict_code_to_id)
+                if rollups:
+                    rows = append_rollup_rows(rows, tallies, data['dim_geography'], int(period.date_key), global_agg,
+                                              district_code_to_id, subdistrict_code_to_id)
+        frames.append(rows)
+        logger.log_progress(idx + 1, total_periods, f"date_key: {period.date_key} ({period.grain} ending "
+                            f"{period.period_end_date}, {len(rows):,} rows)", unit="Period")
+    
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values('date_key', kind='stable').reset_index(drop=True)
+
+# ============================================================================
+# INCREMENTAL RECOMPUTE
+# ============================================================================
+# Every --incremental run leaves a manifest next to its output remembering
+# what that version was built from: content hashes of every input file, one
+# hash per cooperative (its own row plus its members, management, outlets,
+# KLU and partnership rows) and one signature per village code covering every
+# source row its FACT_KPI row reads, in source order. The next --incremental
+# run only recomputes villages whose signature changed; the other rows are
+# copied from that version and get their regional/global columns refreshed
+# from the new global aggregates. Without a manifest (the first --incremental
+# run) it is a full run; plain runs skip the hashing and keep the manifest.
+
+COOPERATIVE_CHILD_TABLES = ['members', 'management', 'outlets', 'klus', 'partnerships']
+
+def _row_hashes(frame):
+    """Content hash of every row (uint64), independent of the index."""
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+def _ordered_group_hash(row_hashes, keys):
+    """Order-sensitive hash of the rows of each key: same rows in another order hash differently."""
+    keys = pd.Series(np.asarray(keys))
+    rank = keys.groupby(keys).cumcount().to_numpy()
+    paired = pd.util.hash_pandas_object(pd.DataFrame({'h': row_hashes, 'k': rank}), index=False)
+    return pd.Series(paired.to_numpy()).groupby(keys).sum()
+
+def _combine_table_hashes(table_hashes):
+    """Fold per-table hash Series (same kind of key) into one hash per key."""
+    keys = pd.Index([])
+    for hashes in table_hashes.values():
+        keys = keys.union(hashes.index)
+    # reindex with an integer fill keeps uint64 (a NaN round trip through float64 would lose bits)
+    combined = pd.DataFrame({name: hashes.reindex(keys, fill_value=0).astype('uint64')
+                             for name, hashes in table_hashes.items()})
+    return pd.Series(pd.util.hash_pandas_object(combined, index=False).to_numpy(), index=keys)
+
+def compute_row_signatures(data):
+    """Hash per cooperative and signature per village code of the rows behind each FACT_KPI row."""
+    villages = data['villages'][['village_id', 'code']].drop_duplicates()
+    cooperative = data['cooperative']
+    coop_codes = cooperative[['cooperative_id', 'villageId']].merge(
+        villages, left_on='villageId', right_on='village_id', how='inner')[['cooperative_id', 'code']]
+    coop_codes = coop_codes.drop_duplicates()
+    
+    coop_tables = {'cooperative': pd.Series(_row_hashes(cooperative)).groupby(cooperative['cooperative_id'].to_numpy()).sum()}
+    village_tables = {}
+    
+    # Cooperative rows belong to every code their cooperative_id sits in (KPI_04 to KPI_07 read them all)
+    rows = pd.DataFrame({'cooperativeId': cooperative['cooperative_id'].to_numpy(), '_hash': _row_hashes(cooperative)})
+    rows = rows.merge(coop_codes, left_on='cooperativeId', right_on='cooperative_id', how='inner')
+    village_tables['cooperative'] = _ordered_group_hash(rows['_hash'].to_numpy(), rows['code'])
+    
+    # Child rows belong to their cooperative (and through it to a village code)
+    for name in COOPERATIVE_CHILD_TABLES:
+        # Streamed tables are only available as their per-cooperative partials
+        table = data[name] if name in data else data[f'{name}_partials'].reset_index()
+        hashes = _row_hashes(table)
+        coop_tables[name] = _ordered_group_hash(hashes, table['cooperativeId'])
+        rows = pd.DataFrame({'cooperativeId': table['cooperativeId'].to_numpy(), '_hash': hashes})
+        rows = rows.merge(coop_codes, left_on='cooperativeId', right_on='cooperative_id', how='inner')
+        village_tables[name] = _ordered_group_hash(rows['_hash'].to_numpy(), rows['code'])
+    
+    # UPKDK and village mergers belong to every code of their village_id
+    for name, key in [('upkdk', 'villageId'), ('village_mergers', 'village_id')]:
+        table = data[name]
+        rows = pd.DataFrame({'_village_id': table[key].to_numpy(), '_hash': _row_hashes(table)})
+        rows = rows.merge(villages, left_on='_village_id', right_on='village_id', how='inner')
+        village_tables[name] = _ordered_group_hash(rows['_hash'].to_numpy(), rows['code'])
+    
+    coop_hashes = _combine_table_hashes(coop_tables)
+    village_hashes = _combine_table_hashes(village_tables)
+    # Villages without cooperatives produce no FACT_KPI row and need no signature
+    village_hashes = village_hashes[village_hashes.index.isin(coop_codes['code'])]
+    
+    return ({str(key): int(value) for key, value in coop_hashes.items()},
+            {str(key): int(value) for key, value in village_hashes.items()})
+
+def hash_source_files():
+    """Size and SHA-256 of every input file."""
+    return {key: {'size': os.path.getsize(source_file_path(key)), 'sha256': source_file_sha256(key)}
+            for key in SOURCE_FILES}
+
+def load_manifest():
+    """Read the manifest of the previous run, None if missing or unreadable."""
+    manifest_path = os.path.join(RESULT_DIR, MANIFEST_FILE)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.log("INFO", f"Ignoring unreadable {MANIFEST_FILE}: {e}", "info")
+        return None
+    return manifest if manifest.get('format') == MANIFEST_FORMAT else None
+
+def write_manifest(output_filename, date_key, file_hashes, global_agg, coop_hashes, village_hashes):
+    """Record what ``output_filename`` was built from."""
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'output_file': output_filename,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'date_key': date_key,
+        'village_limit': TEST_VILLAGE_LIMIT,
+        'top_10_klu': [str(klu) for klu in global_agg['top_10_klu']],
+        'files': file_hashes,
+        'cooperatives': coop_hashes,
+        'villages': village_hashes,
+    }
+    manifest_path = os.path.join(RESULT_DIR, MANIFEST_FILE)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    logger.log("SAVING", f"Manifest saved: {MANIFEST_FILE} ({len(village_hashes):,} villages, "
+                         f"{len(coop_hashes):,} cooperatives)", "success")
+
+def plan_incremental(manifest, file_hashes, date_key, global_agg):
+    """Return the previous FACT_KPI rows to build on, or None (with the reason logged) for a full run."""
+    def full_run(reason):
+        logger.log("INFO", f"Incremental: full recompute ({reason})", "info")
+        return None
+    
+    if manifest is None:
+        return full_run("no previous manifest")
+    previous_path = os.path.join(RESULT_DIR, manifest['output_file'])
+    if not os.path.exists(previous_path):
+        return full_run(f"previous output {manifest['output_file']} not found")
+    if manifest['date_key'] != date_key:
+        return full_run(f"date_key changed from {manifest['date_key']} to {date_key}")
+    if manifest['village_limit'] != TEST_VILLAGE_LIMIT:
+        return full_run("TEST_VILLAGE_LIMIT changed")
+    changed = [key for key in FULL_RECOMPUTE_SOURCES if manifest['files'].get(key) != file_hashes[key]]
+    if changed:
+        return full_run(f"{', '.join(changed)} changed")
+    if manifest['top_10_klu'] != [str(klu) for klu in global_agg['top_10_klu']]:
+        return full_run("top 10 KLU changed")
+    
+    previous = read_fact_kpi(previous_path)
+    if list(previous.columns) != FACT_KPI_COLUMNS:
+        return full_run(f"{manifest['output_file']} has a different column layout")
+    logger.log("INFO", f"Incremental: building on {manifest['output_file']} ({len(previous):,} rows)")
+    return previous
+
+def find_dirty_villages(manifest, coop_hashes, village_hashes):
+    """Village codes whose FACT_KPI row has to be recomputed (changed, new or gone)."""
+    old_villages = manifest['villages']
+    dirty = {code for code, value in village_hashes.items() if old_villages.get(code) != value}
+    dirty |= set(old_villages) - set(village_hashes)
+    
+    old_coops = manifest['cooperatives']
+    changed_coops = sum(1 for coop_id, value in coop_hashes.items() if old_coops.get(coop_id) != value)
+    changed_coops += len(set(old_coops) - set(coop_hashes))
+    logger.log("INFO", f"Incremental: {changed_coops:,} cooperatives changed, "
+                       f"{len(dirty):,}/{len(village_hashes):,} villages to recompute")
+    return dirty
+
+def merge_incremental(previous, fresh, village_geo, dirty_codes, global_agg, district_code_to_id, subdistrict_code_to_id):
+    """Previous rows of clean villages (with regional columns refreshed) plus recomputed rows, in DIM_GEOGRAPHY order."""
+    geo = village_geo[['geo_key', 'province_id', 'district_id', 'subdistrict_id', 'village_id']]
+    kept = previous.merge(geo, on='geo_key', how='inner')
+    kept = kept[~kept['village_id'].astype(str).isin(dirty_codes)].reset_index(drop=True)
+    
+    district_internal, subdistrict_internal = geo_internal_ids(kept, district_code_to_id, subdistrict_code_to_id)
+    apply_regional_kpis(kept, kept, district_internal, subdistrict_internal, global_agg)
+    kept = kept[FACT_KPI_COLUMNS]
+    logger.log("INFO", f"Incremental: {len(kept):,} rows copied forward, {len(fresh):,} recomputed")
+    
+    frames = [frame for frame in [kept, fresh] if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, ignore_index=True)
+    geo_order = pd.Series(np.arange(len(geo)), index=geo['geo_key'].to_numpy())
+    order = np.argsort(combined['geo_key'].map(geo_order).to_numpy(), kind='stable')
+    return combined.iloc[order].reset_index(drop=True)
+
+# ============================================================================
+# OUTPUT WRITERS
+# ============================================================================
+# FACT_KPI_Vnnn can be written as CSV, Parquet and/or Arrow IPC (Feather v2).
+# The binary formats carry the typed schema of fact_kpi_data_types.md:
+# Integer -> int32, BigInt -> int64, Dec(18,2) -> decimal128(18, 2) and the
+# percentage columns -> decimal128(7, 4), since Dec(5,4) cannot hold 100.0000.
+
+DIMENSION_KEY_COLUMNS = ['date_key', 'geo_key', 'outlet_id', 'business_partner_service_id', 'upkdk_id', 'klu_id']
+
+def fact_kpi_arrow_schema(df):
+    """Arrow schema of FACT_KPI (keys that overflow int32 are widened to int64)."""
+    fields = []
+    for col in FACT_KPI_COLUMNS:
+        if col in DIMENSION_KEY_COLUMNS:
+            fits = len(df) == 0 or (df[col].min() >= INT32_RANGE[0] and df[col].max() <= INT32_RANGE[1])
+            fields.append(pa.field(col, pa.int32() if fits else pa.int64(), nullable=False))
+        elif col in INT_COLUMNS:
+            fields.append(pa.field(col, pa.int64(), nullable=False))
+        elif col in DEC_18_2_COLUMNS:
+            fields.append(pa.field(col, pa.decimal128(18, 2), nullable=False))
+        else:
+            fields.append(pa.field(col, pa.decimal128(7, 4), nullable=False))
+    return pa.schema(fields)
+
+def fact_kpi_to_arrow(df):
+    """Convert a typed FACT_KPI DataFrame to an Arrow table with the FACT_KPI schema."""
+    schema = fact_kpi_arrow_schema(df)
+    arrays = [pa.array(df[field.name].to_numpy()).cast(field.type) for field in schema]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def write_fact_kpi(df, version, output_formats):
+    """Write FACT_KPI_V{version} in every requested format, return the written paths."""
+    paths = []
+    table = None
+    for output_format in output_formats:
+        output_filename = f"{OUTPUT_FILE_PREFIX}{version:03d}{OUTPUT_FORMATS[output_format]}"
+        output_path = os.path.join(RESULT_DIR, output_filename)
+        logger.log("SAVING", f"Writing to {output_filename}...")
+        
+        if output_format == "csv":
+            # Format decimal columns to ensure proper display (with .0 if needed)
+            # Note: pandas will handle formatting automatically, but we ensure float64 type
+            df.to_csv(output_path, index=False, float_format='%.10g')
+        else:
+            if table is None:
+                table = fact_kpi_to_arrow(df)
+            if output_format == "parquet":
+                # Dictionary encoding pays off for the many repeated regional values
+                parquet.write_table(table, output_path, use_dictionary=True, compression='zstd')
+            else:
+                feather.write_feather(table, output_path, compression='uncompressed')
+        
+        file_size_mb = get_file_size_mb(output_path)
+        logger.log("SAVING", f"File saved: {file_size_mb:.2f} MB", "success")
+        paths.append(output_path)
+    return paths
+
+def read_fact_kpi(filepath):
+    """Read a FACT_KPI_Vnnn file of any output format back into float/int64 columns."""
+    if filepath.endswith(OUTPUT_FORMATS["csv"]):
+        return pd.read_csv(filepath, low_memory=False)
+    return read_arrow_file(filepath)
+
+def apply_fact_kpi_schema(df):
+    """Order FACT_KPI columns and apply the target data types."""
+    # Add missing columns with default value 0
+    for col in FACT_KPI_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0
+    
+    # Reorder columns
+    df = df[FACT_KPI_COLUMNS].copy()
+    
+    logger.log("INFO", f"DataFrame created with {len(df)} rows and {len(df.columns)} columns")
+    logger.log("INFO", "Applying data types...")
+    
+    for col in INT_COLUMNS:
+        df[col] = df[col].fillna(0).astype('int64')
+    
+    for col in DEC_18_2_COLUMNS:
+        # Ensure float64 type and 2 decimal places
+        df[col] = df[col].fillna(0).astype('float64').round(2)
+    
+    for col in DEC_5_4_COLUMNS:
+        # Ensure float64 type, percentage range 0-100, and 4 decimal places
+        df[col] = df[col].fillna(0).astype('float64').clip(0, 100).round(4)
+    
+    return df
+
+def generate_fact_kpi(engine=DEFAULT_ENGINE, workers=DEFAULT_WORKERS, shard_by="province",
+                      all_periods=False, grains=PERIOD_GRAINS, years=None, incremental=False,
+                      cache_format=DEFAULT_CACHE_FORMAT, output_formats=DEFAULT_OUTPUT_FORMATS,
+                      streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, metrics_textfile=None,
+                      profile=False, profile_sample=0, rollups=False, distinct_count=DEFAULT_DISTINCT_COUNT):
+    """Main function to generate FACT_KPI data.
+    
+    With all_periods=True, facts are generated for every DIM_PERIOD row of the
+    requested grains (and year range) instead of only the latest week.
+    With incremental=True, only villages whose source rows changed since the
+    last incremental run (see MANIFEST_FILE) are recomputed; without a usable
+    manifest it does a full run that writes one. Other runs leave it alone.
+    cache_format picks the source table cache format, None disables it.
+    output_formats lists the formats (csv/parquet/arrow) FACT_KPI is written in.
+    With streaming=True, STREAMED_TABLES are aggregated chunk_size rows at a
+    time instead of being loaded whole; this needs the vectorized engine.
+    Stage metrics are written to FACT_KPI_Vnnn_metrics.json, and also as an
+    OpenMetrics textfile when metrics_textfile is given.
+    profile=True logs the calculate_*_kpis families ranked by time;
+    profile_sample > 0 also runs cProfile over that many villages of the
+    single-process loop engine.
+    With rollups=True, subdistrict, district and province rows are added,
+    rolled up from the village tallies of the vectorized engine.
+    distinct_count picks how the vectorized engine counts distinct KLUs and
+    cooperatives: 'exact' or 'hll' (HyperLogLog sketches, HLL_PRECISION).
+    engine='sqlite' loads SQLITE_TABLES into SQLITE_DB_FILE (rebuilt when
+    cache_format is None) and computes the latest period with GROUP BY queries.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+    if distinct_count not in DISTINCT_COUNTERS:
+        raise ValueError(f"Unknown distinct count '{distinct_count}', expected one of: {', '.join(DISTINCT_COUNTERS)}")
+    if shard_by not in SHARD_LEVELS:
+        raise ValueError(f"Unknown shard level '{shard_by}', expected one of: {', '.join(SHARD_LEVELS)}")
+    unknown_formats = [fmt for fmt in output_formats if fmt not in OUTPUT_FORMATS]
+    if unknown_formats or not output_formats:
+        raise ValueError(f"Unknown output format {unknown_formats}, expected some of: {', '.join(OUTPUT_FORMATS)}")
+    if pa is None and any(fmt != "csv" for fmt in output_formats):
+        raise RuntimeError("Parquet/Arrow output requires pyarrow (pip install pyarrow)")
+    
+    started_at = datetime.now()
+    logger.step_times = {}
+    logger.log("START", f"FACT_KPI Generation Started at {started_at.strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.log("START", f"Test mode: {TEST_VILLAGE_LIMIT} villages" if TEST_VILLAGE_LIMIT else "Full run: all villages")
+    logger.log("START", f"Engine: {engine}" + (f", {workers} workers by {shard_by}" if workers > 1 else ""))
+    
+    # Row signatures and the manifest cost a pass over every source row, so only --incremental runs keep them
+    # (also when the run below falls back to a full one, so the next --incremental run can build on it)
+    keep_manifest = incremental
+    if engine == "sqlite" and all_periods:
+        logger.log("INFO", "The sqlite engine only builds the latest period, switching to the vectorized engine", "info")
+        engine = "vectorized"
+    if engine == "sqlite" and streaming:
+        logger.log("INFO", "The sqlite engine already reads every table in chunks, ignoring --streaming", "info")
+        streaming = False
+    if engine == "sqlite" and incremental:
+        logger.log("INFO", "The sqlite engine keeps no per-row signatures, doing a full run", "info")
+        incremental = False
+    if streaming and all_periods:
+        logger.log("INFO", "Streaming is not supported with --all-periods, loading full tables", "info")
+        streaming = False
+    if streaming and engine != "vectorized":
+        logger.log("INFO", "Streaming keeps only per-cooperative partials, switching to the vectorized engine", "info")
+        engine = "vectorized"
+    if rollups and engine not in ("vectorized", "sqlite"):
+        logger.log("INFO", "Rollups are built from the vectorized engine's village tallies, switching to it", "info")
+        engine = "vectorized"
+    if rollups and incremental:
+        logger.log("INFO", "Rollups need the tallies of every village, doing a full run", "info")
+        incremental = False
+    
+    # Step 1: Load all data (and fingerprint the input files for the manifest)
+    sqlite_source = None
+    with logger.stage("load_all_data") as stage:
+        if engine == "sqlite":
+            # Only the dimension tables are loaded into pandas
+            sqlite_source = SqliteSource().load(chunk_size, rebuild=cache_format is None)
+            data = load_all_data(cache_format, tables=[key for key in SOURCE_FILES if key not in SQLITE_TABLES])
+            stage['rows'] = sum(len(table) for table in data.values()) + sum(sqlite_source.rows.values())
+        else:
+            data = load_all_data(cache_format, include_created_at=all_periods,
+                                 streamed_tables=STREAMED_TABLES if streaming else (), chunk_size=chunk_size)
+            stage['rows'] = sum(len(table) for table in data.values())
+    # The manifest needs per-row signatures of the full tables, which the sqlite engine never loads
+    write_run_manifest = keep_manifest and not all_periods and sqlite_source is None
+    if write_run_manifest:
+        with logger.stage("hash_source_files", rows=len(SOURCE_FILES)):
+            file_hashes = hash_source_files()
+    
+    if sqlite_source is not None:
+        # Steps 2-3.5 as GROUP BY queries over the SQLite tables
+        mappings = None
+        with logger.stage("calculate_global_aggregates", rows=sqlite_source.rows['cooperative']):
+            global_agg = calculate_global_aggregates_sqlite(sqlite_source)
+        fact_coop = build_fact_coop_sqlite(sqlite_source)
+    else:
+        # Step 2: Create mappings (only the per-village loop engine looks rows up one village at a time)
+        mappings = None
+        if engine == "loop" and not all_periods:
+            with logger.stage("create_mappings", rows=len(data['cooperative'])):
+                mappings = create_mappings(data)
+        
+        # Step 3: Calculate global aggregates
+        with logger.stage("calculate_global_aggregates", rows=len(data['cooperative'])):
+            global_agg = calculate_global_aggregates(data, mappings)
+        
+        # Step 3.5: Per-cooperative facts (FACT_COOP), written next to FACT_KPI
+        fact_coop = build_fact_coop(data)
+    
+    # Step 4: Get latest period (date_key), or every requested period
+    if all_periods:
+        periods = select_periods(data['dim_period'], grains, years)
+        date_key = None
+        logger.log("INFO", f"Multi-period run: {len(periods):,} periods ({', '.join(grains)})")
+    else:
+        date_key = get_latest_date_key(data)
+    
+    # Step 4.5: Village code matching
+    # Problem: villages.csv has DUPLICATE codes (36,978 duplicates!)
+    # Solution: match cooperative.villageId → villages.village_id → villages.code → DIM_GEOGRAPHY.village_id
+    # (pre-built once in create_mappings() as mappings['village_codes'])
+    
+    # Step 4.6: District/subdistrict code to internal ID mappings
+    district_code_to_id, subdistrict_code_to_id = create_code_mappings(data)
+    
+    # Step 5: Filter geography for village level
+    village_geo = data['dim_geography'][data['dim_geography']['village_id'].notna()].copy()
+    
+    # Limit for testing
+    if TEST_VILLAGE_LIMIT:
+        village_geo = village_geo.head(TEST_VILLAGE_LIMIT)
+    
+    total_villages = len(village_geo)
+    logger.log("INFO", f"Processing {total_villages:,} villages...")
+    
+    # Step 5.5: Incremental mode - only recompute villages whose source rows changed
+    previous = None
+    if write_run_manifest:
+        manifest = load_manifest()
+        if incremental:
+            previous = plan_incremental(manifest, file_hashes, date_key, global_agg)
+        if previous is not None and manifest['files'] == file_hashes:
+            coop_hashes, village_hashes = manifest['cooperatives'], manifest['villages']
+        else:
+            with logger.stage("compute_row_signatures", rows=len(data['cooperative'])):
+                coop_hashes, village_hashes = compute_row_signatures(data)
+        if previous is not None:
+            dirty_codes = find_dirty_villages(manifest, coop_hashes, village_hashes)
+            village_geo = village_geo[village_geo['village_id'].astype(str).isin(dirty_codes)]
+    elif incremental:
+        logger.log("INFO", "Incremental mode is not supported with --all-periods, doing a full run", "info")
+    
+    profiler = None
+    if profile_sample > 0:
+        if engine == "loop" and workers == 1 and not all_periods:
+            profiler = VillageProfiler(len(village_geo), profile_sample)
+        else:
+            logger.log("INFO", "--profile-sample needs the single-process loop engine, skipping cProfile", "info")
+    
+    # Step 6: Process villages with the selected engine
+    with logger.stage("generate_fact_rows", rows=len(village_geo)):
+        if all_periods:
+            if engine != "vectorized" or workers > 1:
+                logger.log("INFO", "Multi-period runs always use the single-process vectorized engine", "info")
+            df = generate_fact_rows_multi_period(data, periods, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                                 rollups=rollups, distinct_count=distinct_count, fact_coop=fact_coop)
+        elif engine == "sqlite":
+            if workers > 1:
+                logger.log("INFO", "SQLite engine runs in a single process, ignoring --workers", "info")
+            df = generate_fact_rows_sqlite(sqlite_source, data, global_agg, date_key, village_geo, district_code_to_id,
+                                           subdistrict_code_to_id, rollups=rollups, distinct_count=distinct_count)
+            sqlite_source.close()
+        elif engine == "vectorized":
+            if workers > 1:
+                logger.log("INFO", "Vectorized engine runs in a single process, ignoring --workers", "info")
+            df = generate_fact_rows_vectorized(data, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                               rollups=rollups, distinct_count=distinct_count, fact_coop=fact_coop)
+        elif workers > 1:
+            df = generate_fact_rows_parallel(data, mappings, global_agg, date_key, village_geo,
+                                             district_code_to_id, subdistrict_code_to_id, workers, shard_by)
+        else:
+            df = generate_fact_rows_loop(data, mappings, global_agg, date_key, village_geo, district_code_to_id, subdistrict_code_to_id,
+                                         profiler=profiler)
+    
+    if previous is not None:
+        full_geo = data['dim_geography'][data['dim_geography']['village_id'].notna()]
+        if TEST_VILLAGE_LIMIT:
+            full_geo = full_geo.head(TEST_VILLAGE_LIMIT)
+        if len(df) > 0:
+            df = apply_fact_kpi_schema(df)
+        df = merge_incremental(previous, df, full_geo, dirty_codes, global_agg, district_code_to_id, subdistrict_code_to_id)
+    
+    # Step 7-8: Create DataFrame with expected columns and apply data types
+    logger.log("INFO", "Creating DataFrame...")
+    with logger.stage("apply_fact_kpi_schema", rows=len(df)):
+        df = apply_fact_kpi_schema(df)
+    
+    # Step 9: Determine version and save (one version number for every format)
+    version = get_next_version_number()
+    with logger.stage("write_fact_kpi", rows=len(df) * len(output_formats)):
+        output_paths = write_fact_kpi(df, version, output_formats)
+    with logger.stage("write_fact_coop", rows=len(fact_coop) * len(output_formats)):
+        write_fact_coop(fact_coop, version, output_formats)
+    output_path = output_paths[0]
+    output_filename = os.path.basename(output_path)
+    if write_run_manifest:
+        write_manifest(output_filename, date_key, file_hashes, global_agg, coop_hashes, village_hashes)
+    elif sqlite_source is not None and keep_manifest:
+        logger.log("INFO", f"SQLite engine: {MANIFEST_FILE} not updated, the next --incremental run diffs against "
+                   "the last pandas run", "info")
+    
+    # Step 9.5: Stage metrics next to the output (and for the node exporter if requested)
+    run_info = {
+        'output_file': output_filename,
+        'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'engine': engine,
+        'workers': workers,
+        'all_periods': all_periods,
+        'incremental': previous is not None,
+        'streaming': streaming,
+        'rollups': rollups,
+        'distinct_count': distinct_count,
+        'coercion_failures': {**coercion_failures(data), **(sqlite_source.coercion_failures if sqlite_source else {})},
+        'date_key': None if date_key is None else int(date_key),
+        'villages': len(village_geo),
+        'rows': len(df),
+    }
+    metrics_path = os.path.join(RESULT_DIR, f"{OUTPUT_FILE_PREFIX}{version:03d}{METRICS_FILE_SUFFIX}")
+    logger.save_metrics(metrics_path, run_info)
+    logger.log("SAVING", f"Stage metrics: {metrics_path}", "success")
+    if metrics_textfile:
+        logger.save_openmetrics(metrics_textfile, run_info)
+        logger.log("SAVING", f"OpenMetrics textfile: {metrics_textfile}", "success")
+    
+    # Step 9.6: Profiling report (opt-in)
+    if profile or profiler is not None:
+        logger.log_stage_ranking()
+    if profiler is not None:
+        profile_path = os.path.join(RESULT_DIR, f"{OUTPUT_FILE_PREFIX}{version:03d}{PROFILE_FILE_SUFFIX}")
+        summary = profiler.dump(profile_path)
+        logger.log("PROFILE", f"cProfile of {profiler.sampled:,} sampled villages: {profile_path}", "success")
+        print(summary)
+    
+    # Step 10: Summary
+    logger.log_complete(f"Generated {len(df):,} rows with {len(df.columns)} columns")
+    logger.log("SUCCESS", f"Output file: {', '.join(output_paths)}", "success")
+    
+    # Display sample statistics (village rows only, rollup rows count the same cooperatives again)
+    village_rows = df[df['geo_key'].isin(village_geo['geo_key'])] if rollups else df
+    logger.log("INFO", "Sample statistics:")
+    if rollups:
+        print(f"  - Rollup rows: {len(df) - len(village_rows):,}")
+    print(f"  - Total cooperatives processed: {village_rows['TotalKoperasiTerdaftar'].sum():,}")
+    print(f"  - Total members: {village_rows['TotalAnggotaKoperasi'].sum():,}")
+    print(f"  - Total outlets: {village_rows['TotalGeraiKoperasi'].sum():,}")
+    print(f"  - Average cooperatives per village: {village_rows['TotalKoperasiTerdaftar'].mean():.2f}")
     
     return df
 
@@ -1064,14 +4038,87 @@ def generate_fact_kpi():
 # ENTRY POINT
 # ============================================================================
 
-if __name__ == "__main__":
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Generate FACT_KPI from data sources.")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE,
+                        help="KPI engine: 'loop' filters per village, 'vectorized' uses groupby/merge passes, "
+                             f"'sqlite' runs GROUP BY queries over {SQLITE_DB_FILE} (low memory)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of worker processes for the loop engine (default: 1)")
+    parser.add_argument("--shard-by", choices=list(SHARD_LEVELS), default="province",
+                        help="Geography level used to split villages between workers")
+    parser.add_argument("--all-periods", action="store_true",
+                        help="Generate facts for every DIM_PERIOD row instead of only the latest week")
+    parser.add_argument("--grains", default=",".join(PERIOD_GRAINS),
+                        help="Comma-separated period grains for --all-periods (default: year,quarter,month,week)")
+    parser.add_argument("--years", default=None,
+                        help="Year range for --all-periods, e.g. 2022-2025 (default: all DIM_PERIOD years)")
+    parser.add_argument("--cache", choices=CACHE_FORMATS + ("off",), default=DEFAULT_CACHE_FORMAT,
+                        help=f"Source table cache in {SOURCE_CACHE_DIR}/ (default: {DEFAULT_CACHE_FORMAT}, 'off' reads CSVs only)")
+    parser.add_argument("--output-format", default=",".join(DEFAULT_OUTPUT_FORMATS),
+                        help=f"Comma-separated output formats: {', '.join(OUTPUT_FORMATS)} (default: csv)")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Only recompute villages whose source rows changed since the run in {MANIFEST_FILE}")
+    parser.add_argument("--streaming", action="store_true",
+                        help=f"Read {' and '.join(STREAMED_TABLES)} in chunks into per-cooperative partials (vectorized engine)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Rows per chunk for --streaming and the sqlite engine's bulk load (default: {DEFAULT_CHUNK_SIZE:,})")
+    parser.add_argument("--metrics-textfile", default=None,
+                        help="Also write stage metrics as an OpenMetrics textfile, e.g. for the node exporter textfile collector")
+    parser.add_argument("--rollups", action="store_true",
+                        help="Also write subdistrict, district and province rows rolled up from the villages (vectorized engine)")
+    parser.add_argument("--distinct-count", choices=tuple(DISTINCT_COUNTERS), default=DEFAULT_DISTINCT_COUNT,
+                        help="Distinct KLU/cooperative counts of the vectorized engine: exact sets or HyperLogLog sketches")
+    parser.add_argument("--profile", action="store_true",
+                        help="Log the calculate_*_kpis families ranked by cumulative time")
+    parser.add_argument("--profile-sample", type=int, default=0, metavar="N",
+                        help="Also cProfile N evenly spaced villages of the loop engine (pstats file in result/)")
+    args = parser.parse_args(argv)
+    if args.profile_sample < 0:
+        parser.error("--profile-sample must not be negative")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    
+    args.grains = tuple(grain.strip() for grain in args.grains.split(",") if grain.strip())
+    unknown = [grain for grain in args.grains if grain not in PERIOD_GRAINS]
+    if unknown or not args.grains:
+        parser.error(f"--grains must be a comma-separated subset of {','.join(PERIOD_GRAINS)}")
+    args.output_format = tuple(fmt.strip() for fmt in args.output_format.split(",") if fmt.strip())
+    if not args.output_format or any(fmt not in OUTPUT_FORMATS for fmt in args.output_format):
+        parser.error(f"--output-format must be a comma-separated subset of {','.join(OUTPUT_FORMATS)}")
+    if args.years is not None:
+        try:
+            start, _, end = args.years.partition("-")
+            args.years = (int(start), int(end or start))
+        except ValueError:
+            parser.error("--years must look like 2022-2025 or 2024")
+    return args
+
+def main(argv=None):
+    """Run the command line entry point (argv defaults to sys.argv[1:])."""
+    args = parse_args(argv)
     try:
-        df = generate_fact_kpi()
+        df = generate_fact_kpi(engine=args.engine, workers=args.workers, shard_by=args.shard_by,
+                               all_periods=args.all_periods, grains=args.grains, years=args.years,
+                               incremental=args.incremental,
+                               cache_format=None if args.cache == "off" else args.cache,
+                               output_formats=args.output_format,
+                               streaming=args.streaming, chunk_size=args.chunk_size,
+                               metrics_textfile=args.metrics_textfile,
+                               profile=args.profile, profile_sample=args.profile_sample,
+                               rollups=args.rollups, distinct_count=args.distinct_count)
         print("\n" + "="*80)
         print("FACT_KPI generation completed successfully!")
         print("="*80)
+        return df
     except Exception as e:
         logger.log_error(f"Fatal error: {str(e)}")
         import traceback
         traceback.print_exc()
         raise
+
+if __name__ == "__main__":
+    main()
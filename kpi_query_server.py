@@ -0,0 +1,364 @@
+"""
+KPI Query Server
+================
+Serves the latest FACT_KPI_Vnnn (joined with DIM_GEOGRAPHY and DIM_PERIOD)
+over a small local HTTP/JSON API, so dashboards can look up a handful of
+geo_keys without loading whole FACT_KPI files. Rows are held in memory sorted
+by (geo_key, date_key) with per-province and per-district row indexes,
+answers are kept in an LRU cache, and a newer FACT_KPI version in result/ is
+picked up without a restart.
+
+Usage:
+    python kpi_query_server.py                        # http://127.0.0.1:8765
+    python kpi_query_server.py --port 9000 --cache-size 4096
+
+Endpoints (GET, JSON):
+    /health                                           loaded version, rows, cache statistics
+    /kpi?geo_key=123[&date_key=45]                    point lookup
+    /kpi?geo_key_from=100&geo_key_to=200              geo_key range (also date_key_from / date_key_to)
+    /kpi?province_id=11[&district_id=11.05]           rows of a province or district
+    /rollup?level=district[&province_id=11]           subdistrict / district / province rows
+    /kpi and /rollup also take columns=TotalAnggotaKoperasi,... and limit=N
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import generate_fact_kpi as fact
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 1024  # Query answers kept in the LRU cache
+RELOAD_CHECK_SECONDS = 5  # How often result/ is checked for a newer FACT_KPI version
+DEFAULT_ROW_LIMIT = 10_000  # Rows per answer unless limit= is given
+FORMAT_PREFERENCE = ["arrow", "parquet", "csv"]  # Loaded format when a version exists in several
+GEO_ID_COLUMNS = ['province_id', 'district_id', 'subdistrict_id', 'village_id']
+PERIOD_COLUMNS = ['year', 'quarter', 'month', 'week', 'period_st', 'period_end_date']
+# Columns that may be summed over villages when FACT_KPI has no --rollups rows for a level
+ADDITIVE_COLUMNS = [
+    'TotalKoperasiTerdaftar', 'TotalModalAwalKoperasi', 'TotalAnggotaKoperasi',
+    'TotalPengurusKoperasi', 'TotalPengawasKoperasi', 'TotalGeraiKoperasi',
+    'TotalAplikasiKemitraan', 'TotalUPKDKAktif', 'JumlahPenggabunganDesa',
+]
+
+class QueryError(ValueError):
+    """A query the server cannot answer (answered with HTTP 400)."""
+
+# ============================================================================
+# FACT_KPI STORE
+# ============================================================================
+
+def latest_fact_kpi(result_dir=fact.RESULT_DIR):
+    """Path of the newest FACT_KPI_Vnnn file (in FORMAT_PREFERENCE order within a version), None if none."""
+    formats = FORMAT_PREFERENCE if fact.feather is not None else ["csv"]
+    candidates = {}
+    for output_format in formats:
+        extension = fact.OUTPUT_FORMATS[output_format]
+        for path in glob.glob(os.path.join(result_dir, f"{fact.OUTPUT_FILE_PREFIX}*{extension}")):
+            version = os.path.basename(path)[len(fact.OUTPUT_FILE_PREFIX):-len(extension)]
+            if version.isdigit():
+                candidates.setdefault(int(version), path)
+    return candidates[max(candidates)] if candidates else None
+
+def file_signature(path):
+    """(path, size, mtime_ns) of a file, to notice when it is replaced or still being written."""
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+def geography_levels(geography):
+    """Level (province/district/subdistrict/village) of every DIM_GEOGRAPHY row."""
+    return np.select([geography['village_id'].notna(), geography['subdistrict_id'].notna(),
+                      geography['district_id'].notna()], ['village', 'subdistrict', 'district'], 'province')
+
+class KpiStore:
+    """One FACT_KPI version in memory, sorted by (geo_key, date_key), with region row indexes."""
+    
+    def __init__(self, path, result_dir=fact.RESULT_DIR):
+        self.signature = file_signature(path)
+        self.loaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        facts = fact.read_fact_kpi(path)
+        self.kpi_columns = [col for col in facts.columns if col not in ('geo_key', 'date_key')]
+        
+        geography = pd.read_csv(os.path.join(result_dir, 'DIM_GEOGRAPHY.csv'),
+                                dtype={col: str for col in GEO_ID_COLUMNS})
+        geography['level'] = geography_levels(geography)
+        periods = pd.read_csv(os.path.join(result_dir, 'DIM_PERIOD.csv'))
+        self.geography = geography
+        
+        rows = facts.merge(geography[['geo_key', 'level'] + GEO_ID_COLUMNS], on='geo_key', how='left')
+        rows = rows.merge(periods[['date_key'] + PERIOD_COLUMNS], on='date_key', how='left')
+        self.rows = rows.sort_values(['geo_key', 'date_key'], kind='stable').reset_index(drop=True)
+        self.geo_keys = self.rows['geo_key'].to_numpy()
+        self.date_keys = self.rows['date_key'].to_numpy()
+        
+        # Region -> row positions (sorted, so every answer stays in (geo_key, date_key) order)
+        self.by_province = self.rows.groupby('province_id').indices
+        self.by_district = self.rows.groupby('district_id').indices
+        self.levels = set(self.rows['level'].dropna())
+    
+    @property
+    def version(self):
+        """File name of the loaded FACT_KPI version."""
+        return os.path.basename(self.signature[0])
+    
+    def _dates(self, positions, date_from, date_to):
+        """Positions whose date_key lies in [date_from, date_to] (None = unbounded)."""
+        dates = self.date_keys[positions]
+        keep = np.ones(len(positions), dtype=bool)
+        if date_from is not None:
+            keep &= dates >= date_from
+        if date_to is not None:
+            keep &= dates <= date_to
+        return positions[keep]
+    
+    def geo_range(self, geo_from=None, geo_to=None, date_from=None, date_to=None):
+        """Row positions with geo_key in [geo_from, geo_to] and date_key in [date_from, date_to]."""
+        start = 0 if geo_from is None else np.searchsorted(self.geo_keys, geo_from, side='left')
+        end = len(self.geo_keys) if geo_to is None else np.searchsorted(self.geo_keys, geo_to, side='right')
+        return self._dates(np.arange(start, end), date_from, date_to)
+    
+    def region(self, province_id=None, district_id=None, date_from=None, date_to=None):
+        """Row positions of a province or district (every row when both are None)."""
+        if district_id is not None:
+            positions = self.by_district.get(district_id, np.array([], dtype='int64'))
+            if province_id is not None:
+                positions = positions[self.rows['province_id'].to_numpy()[positions] == province_id]
+        elif province_id is not None:
+            positions = self.by_province.get(province_id, np.array([], dtype='int64'))
+        else:
+            positions = np.arange(len(self.rows))
+        return self._dates(positions, date_from, date_to)
+    
+    def rollup(self, level, positions):
+        """Rows of ``level`` among positions: the stored --rollups rows, else ADDITIVE_COLUMNS summed over villages.
+        
+        Returns (frame, source) with source "fact_kpi" or "village_sum".
+        """
+        rows = self.rows.iloc[positions]
+        if level in self.levels:
+            return rows[rows['level'] == level], "fact_kpi"
+        
+        columns = dict(fact.ROLLUP_LEVELS)[level]
+        villages = rows[rows['level'] == 'village']
+        sums = villages.groupby(columns + ['date_key'])[ADDITIVE_COLUMNS].sum().reset_index()
+        parents = fact.geography_level_rows(self.geography, columns).drop_duplicates(columns)
+        sums = sums.merge(parents[['geo_key', 'level'] + GEO_ID_COLUMNS], on=columns, how='inner')
+        sums = sums.merge(villages[['date_key'] + PERIOD_COLUMNS].drop_duplicates('date_key'), on='date_key', how='left')
+        return sums.sort_values(['geo_key', 'date_key'], kind='stable'), "village_sum"
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+def _int_param(params, name):
+    """Integer query parameter, None when absent."""
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer, got {value!r}")
+
+def _date_range(params):
+    """(date_from, date_to) from date_key, or date_key_from / date_key_to."""
+    date_key = _int_param(params, 'date_key')
+    if date_key is not None:
+        return date_key, date_key
+    return _int_param(params, 'date_key_from'), _int_param(params, 'date_key_to')
+
+def _encode(store, frame, params, **meta):
+    """JSON answer with the (projected, limited) rows of frame."""
+    columns = params.get('columns')
+    if columns is not None:
+        requested = [col.strip() for col in columns.split(',') if col.strip()]
+        unknown = [col for col in requested if col not in frame.columns]
+        if unknown:
+            raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+        frame = frame[['geo_key', 'date_key'] + [col for col in requested if col not in ('geo_key', 'date_key')]]
+    limit = _int_param(params, 'limit')
+    if limit is None:
+        limit = DEFAULT_ROW_LIMIT
+    elif limit < 1:
+        raise QueryError(f"limit must be at least 1, got {limit}")
+    header = json.dumps({'version': store.version, **meta, 'count': len(frame), 'truncated': len(frame) > limit})
+    return f'{header[:-1]}, "rows": {frame.head(limit).to_json(orient="records")}}}'.encode()
+
+def answer_kpi(store, params):
+    """Rows by geo_key (point or range) or by province / district, optionally within a date_key range."""
+    date_from, date_to = _date_range(params)
+    geo_key = _int_param(params, 'geo_key')
+    if geo_key is not None:
+        positions = store.geo_range(geo_key, geo_key, date_from, date_to)
+    elif 'geo_key_from' in params or 'geo_key_to' in params:
+        positions = store.geo_range(_int_param(params, 'geo_key_from'), _int_param(params, 'geo_key_to'),
+                                    date_from, date_to)
+    elif 'province_id' in params or 'district_id' in params:
+        positions = store.region(params.get('province_id'), params.get('district_id'), date_from, date_to)
+    else:
+        raise QueryError("/kpi needs geo_key, geo_key_from/geo_key_to, province_id or district_id")
+    return _encode(store, store.rows.iloc[positions], params)
+
+def answer_rollup(store, params):
+    """Subdistrict, district or province rows, optionally within a province / district and date_key range."""
+    levels = [level for level, _ in fact.ROLLUP_LEVELS]
+    level = params.get('level')
+    if level not in levels:
+        raise QueryError(f"level must be one of {', '.join(levels)}")
+    date_from, date_to = _date_range(params)
+    positions = store.region(params.get('province_id'), params.get('district_id'), date_from, date_to)
+    frame, source = store.rollup(level, positions)
+    return _encode(store, frame, params, level=level, source=source)
+
+ENDPOINTS = {'/kpi': answer_kpi, '/rollup': answer_rollup}
+
+class KpiQueryService:
+    """The loaded KpiStore, an LRU cache of encoded answers and the reload check."""
+    
+    def __init__(self, result_dir=fact.RESULT_DIR, cache_size=DEFAULT_CACHE_SIZE):
+        self.result_dir = result_dir
+        self.store = None
+        self.pending = None  # Signature of a newer version seen once, loaded when it is unchanged next check
+        # Keyed on the store too, so an answer computed during a reload never outlives its version
+        self.cached_answer = functools.lru_cache(maxsize=cache_size)(self._answer)
+        path = latest_fact_kpi(result_dir)
+        if path is None:
+            raise FileNotFoundError(f"No {fact.OUTPUT_FILE_PREFIX}nnn file in {result_dir}, run generate_fact_kpi.py first")
+        self.load(path)
+    
+    def load(self, path):
+        """Load a FACT_KPI version and swap it in (the previous one keeps serving until then)."""
+        start = time.time()
+        store = KpiStore(path, self.result_dir)
+        self.store = store
+        self.cached_answer.cache_clear()
+        print(f"[RELOAD      ] {store.version}: {len(store.rows):,} rows in {time.time() - start:.1f}s")
+    
+    def check_reload(self):
+        """Load a newer (or rewritten) FACT_KPI version once its file is unchanged for one check."""
+        path = latest_fact_kpi(self.result_dir)
+        if path is None:
+            return False
+        signature = file_signature(path)
+        if signature == self.store.signature:
+            self.pending = None
+            return False
+        if signature != self.pending:
+            # Possibly still being written: wait for it to stay the same until the next check
+            self.pending = signature
+            return False
+        self.pending = None
+        self.load(path)
+        return True
+    
+    def watch(self, interval=RELOAD_CHECK_SECONDS):
+        """Check for new versions every interval seconds (run in a daemon thread)."""
+        while True:
+            time.sleep(interval)
+            try:
+                self.check_reload()
+            except Exception as e:
+                print(f"[RELOAD      ] Keeping {self.store.version}: {e}")
+    
+    @staticmethod
+    def _answer(store, endpoint, params):
+        return ENDPOINTS[endpoint](store, dict(params))
+    
+    def answer(self, endpoint, params):
+        """Encoded answer of an endpoint for a query string dict, from the LRU cache when possible."""
+        return self.cached_answer(self.store, endpoint, tuple(sorted(params.items())))
+    
+    def health(self):
+        """Loaded version and cache statistics."""
+        cache = self.cached_answer.cache_info()
+        store = self.store
+        return json.dumps({
+            'version': store.version,
+            'loaded_at': store.loaded_at,
+            'rows': len(store.rows),
+            'levels': sorted(store.levels),
+            'cache': {'hits': cache.hits, 'misses': cache.misses, 'size': cache.currsize, 'max_size': cache.maxsize},
+        }).encode()
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+
+class KpiRequestHandler(BaseHTTPRequestHandler):
+    """GET /health, /kpi and /rollup as JSON."""
+    
+    service = None  # KpiQueryService, set by serve()
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/health':
+                self._send(200, self.service.health())
+            elif url.path in ENDPOINTS:
+                self._send(200, self.service.answer(url.path, params))
+            else:
+                self._send(404, json.dumps({'error': f"Unknown endpoint {url.path}"}).encode())
+        except QueryError as e:
+            self._send(400, json.dumps({'error': str(e)}).encode())
+    
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, result_dir=fact.RESULT_DIR, cache_size=DEFAULT_CACHE_SIZE,
+          reload_seconds=RELOAD_CHECK_SECONDS):
+    """Load the latest FACT_KPI and serve it until interrupted."""
+    service = KpiQueryService(result_dir, cache_size)
+    KpiRequestHandler.service = service
+    threading.Thread(target=service.watch, args=(reload_seconds,), daemon=True).start()
+    server = ThreadingHTTPServer((host, port), KpiRequestHandler)
+    print(f"[SERVER      ] Serving {service.store.version} on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Serve the latest FACT_KPI version over a local HTTP/JSON API.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--result-dir', default=fact.RESULT_DIR,
+                        help=f"Directory with FACT_KPI_Vnnn, DIM_GEOGRAPHY and DIM_PERIOD (default: {fact.RESULT_DIR})")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"Answers kept in the LRU cache (default: {DEFAULT_CACHE_SIZE})")
+    parser.add_argument('--reload-seconds', type=float, default=RELOAD_CHECK_SECONDS,
+                        help=f"Seconds between checks for a new FACT_KPI version (default: {RELOAD_CHECK_SECONDS})")
+    args = parser.parse_args(argv)
+    if args.cache_size < 1 or args.reload_seconds <= 0:
+        parser.error("--cache-size must be at least 1 and --reload-seconds positive")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.host, args.port, args.result_dir, args.cache_size, args.reload_seconds)
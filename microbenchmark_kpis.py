@@ -0,0 +1,202 @@
+"""
+KPI Family Microbenchmarks
+==========================
+Runs every calculate_*_kpis family of the loop engine against a fixed,
+seeded synthetic fixture and compares the time per village with stored
+baselines; a family slower than baseline * threshold is a regression.
+
+Usage:
+    python microbenchmark_kpis.py --save-baseline     # record baselines on this machine
+    python microbenchmark_kpis.py                     # compare, exit code 1 on a regression
+    python microbenchmark_kpis.py --families calculate_geo_kpis,calculate_klu_kpis
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import benchmark_fact_kpi
+import generate_dimensions
+import generate_fact_kpi as fact
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+FIXTURE_VILLAGES = 600
+FIXTURE_COOPERATIVES = 1_500
+FIXTURE_SEED = 42
+FIXTURE_DIR = os.path.join(benchmark_fact_kpi.BENCHMARK_DIR, f"microbench_fixture_seed{FIXTURE_SEED}")
+BASELINE_FILE = os.path.join(benchmark_fact_kpi.BENCHMARK_DIR, "kpi_baselines.json")  # Machine specific
+DEFAULT_SAMPLE_VILLAGES = 200  # Villages (with cooperatives) every family is timed on
+DEFAULT_REPEATS = 5  # Rounds per family; the fastest round is reported
+DEFAULT_THRESHOLD = 1.20  # current / baseline above this is a regression
+
+# Family -> call with the fixture (f) and one village's arguments (v), as the loop engine does
+KPI_FAMILIES = {
+    'calculate_cooperative_kpis': lambda fn, f, v: fn(v['coop_ids'], f['coop_index'], f['global_agg'], v['province_id'],
+                                                      v['district_id'], v['district_id_internal']),
+    'calculate_geo_kpis': lambda fn, f, v: fn(v['first_village_id'], f['village_index'], f['global_agg'],
+                                              v['province_id'], v['district_id_internal'], v['subdistrict_id_internal']),
+    'calculate_member_kpis': lambda fn, f, v: fn(v['coop_ids'], f['coop_index']),
+    'calculate_management_kpis': lambda fn, f, v: fn(v['coop_ids'], f['management_roles']),
+    'calculate_outlet_kpis': lambda fn, f, v: fn(v['coop_ids'], f['coop_index'], f['global_agg'], v['province_id']),
+    'calculate_klu_kpis': lambda fn, f, v: fn(v['coop_ids'], f['data'], f['coop_index'], f['global_agg']),
+    'calculate_partnership_kpis': lambda fn, f, v: fn(v['coop_ids'], f['coop_index'], f['global_agg']),
+    'calculate_upkdk_kpis': lambda fn, f, v: fn(v['first_village_id'], f['village_index']),
+    'calculate_domain_kpis': lambda fn, f, v: fn(f['global_agg']),
+}
+
+# ============================================================================
+# FIXTURE
+# ============================================================================
+
+def build_fixture(sample_villages):
+    """Load the seeded fixture tree (synthesized on first use) and the per-village KPI arguments."""
+    if not os.path.exists(os.path.join(FIXTURE_DIR, 'synthetic.json')):
+        benchmark_fact_kpi.synthesize_data_source(FIXTURE_DIR, FIXTURE_VILLAGES, FIXTURE_COOPERATIVES, FIXTURE_SEED)
+    cwd = os.getcwd()
+    os.chdir(FIXTURE_DIR)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not os.path.exists(os.path.join(fact.RESULT_DIR, 'DIM_PERIOD.csv')):
+                generate_dimensions.generate_dim_geography()
+                generate_dimensions.generate_dim_period()
+            data = fact.load_all_data(cache_format=None)
+            mappings = fact.create_mappings(data)
+            global_agg = fact.calculate_global_aggregates(data, mappings)
+            district_code_to_id, subdistrict_code_to_id = fact.create_code_mappings(data)
+    finally:
+        os.chdir(cwd)
+
+    # Per-village arguments, derived exactly as generate_fact_rows_loop does
+    villages = []
+    village_geo = data['dim_geography'][data['dim_geography']['village_id'].notna()]
+    for geo_row in village_geo.itertuples(index=False):
+        matching_village_ids, coop_ids = mappings['village_codes'].lookup(geo_row.village_id)
+        if len(matching_village_ids) == 0 or len(coop_ids) == 0:
+            continue
+        district_id, subdistrict_id = geo_row.district_id, geo_row.subdistrict_id
+        villages.append({
+            'coop_ids': coop_ids,
+            'first_village_id': matching_village_ids[0],
+            'province_id': geo_row.province_id,
+            'district_id': district_id,
+            'district_id_internal': district_code_to_id.get(district_id) if pd.notna(district_id) else None,
+            'subdistrict_id_internal': subdistrict_code_to_id.get(str(subdistrict_id)) if pd.notna(subdistrict_id) else None,
+        })
+        if len(villages) == sample_villages:
+            break
+    return {'data': data, 'coop_index': mappings['coop_index'], 'management_roles': mappings['management_roles'],
+            'village_index': mappings['village_index'], 'global_agg': global_agg, 'villages': villages}
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def time_family(name, fixture, repeats):
+    """Fastest of `repeats` rounds over the fixture villages, in microseconds per village."""
+    # Time the bare function, without the ProgressLogger stage wrapper
+    function = getattr(fact, name)
+    function = getattr(function, '__wrapped__', function)
+    call = KPI_FAMILIES[name]
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for village in fixture['villages']:
+            call(function, fixture, village)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(fixture['villages']) * 1e6
+
+def load_baselines(filepath=BASELINE_FILE):
+    """Stored baselines ({'families': {name: us_per_village}, ...}), None if there are none."""
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath) as f:
+        return json.load(f)
+
+def save_baselines(results, sample_villages, filepath=BASELINE_FILE):
+    """Store the current timings as the baselines of this machine."""
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    baselines = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'sample_villages': sample_villages,
+        'families': {name: round(us, 2) for name, us in results.items()},
+    }
+    with open(filepath, 'w') as f:
+        json.dump(baselines, f, indent=2)
+
+def report(results, baselines, threshold):
+    """Print current vs baseline per family and return the names of regressed families."""
+    regressions = []
+    print(f"\n{'KPI family':32s} {'us/village':>11s} {'baseline':>10s} {'ratio':>7s}")
+    print("-" * 64)
+    for name, us in results.items():
+        baseline = (baselines or {}).get('families', {}).get(name)
+        if baseline:
+            ratio = us / baseline
+            flag = "  REGRESSION" if ratio > threshold else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:32s} {us:11.1f} {baseline:10.1f} {ratio:6.2f}x{flag}")
+        else:
+            print(f"{name:32s} {us:11.1f} {'-':>10s} {'-':>7s}")
+    return regressions
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Microbenchmark every calculate_*_kpis family against fixed fixtures.")
+    parser.add_argument('--families', default=",".join(KPI_FAMILIES),
+                        help="Comma-separated KPI families to run (default: all)")
+    parser.add_argument('--villages', type=int, default=DEFAULT_SAMPLE_VILLAGES,
+                        help=f"Fixture villages per round (default: {DEFAULT_SAMPLE_VILLAGES})")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help=f"Rounds per family, the fastest counts (default: {DEFAULT_REPEATS})")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Regression when current / baseline exceeds this (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--baseline-file', default=BASELINE_FILE, help=f"Baselines file (default: {BASELINE_FILE})")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baselines")
+    args = parser.parse_args(argv)
+    args.families = [name.strip() for name in args.families.split(",") if name.strip()]
+    unknown = [name for name in args.families if name not in KPI_FAMILIES]
+    if unknown or not args.families:
+        parser.error(f"--families must be a comma-separated subset of {','.join(KPI_FAMILIES)}")
+    if args.villages < 1 or args.repeats < 1:
+        parser.error("--villages and --repeats must be at least 1")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"Building fixture ({FIXTURE_VILLAGES:,} villages / {FIXTURE_COOPERATIVES:,} cooperatives, seed {FIXTURE_SEED})...")
+    fixture = build_fixture(args.villages)
+    print(f"Timing {len(args.families)} KPI families on {len(fixture['villages'])} villages, best of {args.repeats}...")
+    results = {name: time_family(name, fixture, args.repeats) for name in args.families}
+
+    baselines = load_baselines(args.baseline_file)
+    regressions = report(results, None if args.save_baseline else baselines, args.threshold)
+    if args.save_baseline:
+        save_baselines(results, len(fixture['villages']), args.baseline_file)
+        print(f"\nBaselines saved to {args.baseline_file}")
+    elif baselines is None:
+        print(f"\nNo baselines in {args.baseline_file} yet, run with --save-baseline first")
+    elif regressions:
+        print(f"\n{len(regressions)} KPI families slower than {args.threshold:.2f}x baseline: {', '.join(regressions)}")
+        sys.exit(1)
+    else:
+        print(f"\nNo regressions (threshold {args.threshold:.2f}x)")